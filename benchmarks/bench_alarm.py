@@ -0,0 +1,37 @@
+"""
+Проверка правил оповещения одной ячейки за цикл: все правила сразу по прогнозу на horizon часов
+"""
+import time
+
+from benchmarks.common import measure, report
+
+from fast_weather_bot.alarm import AlarmRule, CompiledRules
+from fast_weather_bot.entity import WeatherCondition, WindDirection
+from fast_weather_bot.weather_api.hourly import HourlyForecast
+
+RULE_COUNTS = (1, 10, 100, 1000)
+HORIZON = 12
+
+
+def rules(count: int) -> list:
+    words = ("снег", "дождь", "осадки", "гроза", "")
+    return [AlarmRule.parse(f"{words[i % len(words)]} t<{-(i % 30)} ветер>{i % 25} {i % 24}-{(i + 8) % 24}")
+            for i in range(count)]
+
+
+def run() -> list:
+    start = int(time.time()) // 3600 * 3600
+    conditions = list(WeatherCondition)
+    forecast = HourlyForecast.from_rows((start + h * 3600, -20 + h % 30, 0, 0, h % 20, WindDirection.N.value, 750,
+                                         50, conditions[h % len(conditions)].value) for h in range(HORIZON))
+    results = []
+    for count in RULE_COUNTS:
+        compiled = CompiledRules(rules(count))
+        results.append(measure(f"alarm/evaluate/{count}", lambda: compiled.evaluate(forecast).any(axis=1),
+                               rules=count, hours=HORIZON))
+    results.append(measure("alarm/compile/100", lambda: CompiledRules(rules(100)), rules=100))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
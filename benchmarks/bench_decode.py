@@ -0,0 +1,62 @@
+"""
+Разбор ответов Яндекс.Погоды на записанных ответах: прежний путь через yandex_weather_api (json в словари,
+проверка схемы) и собственный клиент так, как ответ разбирает кэш: одно декодирование (orjson) и из него
+текущая погода, прогноз и почасовой прогноз. Кроме времени замеряется пик выделенной памяти на один разбор
+"""
+import json
+import os
+import tracemalloc
+from typing import Any, Callable
+
+from benchmarks.common import FIXTURES, measure, report
+
+from fast_weather_bot.weather_api import YandexWeatherAPI
+from fast_weather_bot.weather_api.jsonlib import BACKEND
+
+try:
+    from yandex_weather_api.types import WeatherAnswer
+except ImportError:
+    WeatherAnswer = None
+
+
+def load(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+def peak_bytes(func: Callable[[], Any]) -> int:
+    func()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run():
+    api = YandexWeatherAPI("token")
+    informers = load("yandex_informers.json")
+    full = load("yandex_forecast_full.json")
+    trimmed = load("yandex_forecast_trimmed.json")
+
+    def parse_response(raw: bytes):
+        doc = api.decode(raw)
+        return api.parse_current(doc), api.parse_forecast(doc), api.parse_hourly(doc)
+
+    cases = [
+        ("yandex/response/informers", lambda: parse_response(informers), len(informers)),
+        ("yandex/response/forecast_trimmed", lambda: parse_response(trimmed), len(trimmed)),
+        ("yandex/response/forecast_full", lambda: parse_response(full), len(full)),
+    ]
+    if WeatherAnswer is not None:
+        # Так ответ разбирался раньше: aiohttp json() и проверка схемы всего документа
+        cases += [
+            ("legacy/informers", lambda: WeatherAnswer.validate(json.loads(informers)), len(informers)),
+            ("legacy/forecast_full", lambda: WeatherAnswer.validate(json.loads(full)), len(full)),
+        ]
+    return [measure(name, func, payload_bytes=size, peak_bytes=peak_bytes(func), backend=BACKEND)
+            for name, func, size in cases]
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,69 @@
+"""
+Создание записей прогноза: проверяющий конструктор, construct без проверок и прежние модели pydantic.
+Кроме скорости замеряется память на один объект
+"""
+import datetime
+import tracemalloc
+from typing import Callable, Optional
+
+from benchmarks.common import measure, report
+
+from fast_weather_bot.entity import Forecast, DayPart, WeatherCondition, WindDirection, Coordinates
+
+try:
+    from pydantic import BaseModel, ConfigDict
+except ImportError:
+    BaseModel = None
+
+FIELDS = dict(part=DayPart.Day, min_temperature=-3, max_temperature=2, pressure=745,
+              condition=WeatherCondition.Snow, wind_speed=4.2, wind_direction=WindDirection.NW, humidity=87)
+
+if BaseModel is not None:
+    # Прежнее определение Forecast
+    class PydanticForecast(BaseModel):
+        model_config = ConfigDict(frozen=True)
+
+        time: Optional[datetime.datetime] = None
+        part: Optional[DayPart] = None
+        min_temperature: int
+        max_temperature: int
+        pressure: int
+        condition: WeatherCondition
+        wind_speed: float
+        wind_direction: WindDirection
+        humidity: int
+
+
+def bytes_per_object(factory: Callable[[], object], count: int = 10000) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return round(size / count, 1)
+
+
+def run():
+    results = []
+    cases = [
+        ("entity/validated", lambda: Forecast(**FIELDS)),
+        ("entity/construct", lambda: Forecast.construct(**FIELDS)),
+    ]
+    if BaseModel is not None:
+        cases += [
+            ("pydantic/validated", lambda: PydanticForecast(**FIELDS)),
+            ("pydantic/model_construct", lambda: PydanticForecast.model_construct(**FIELDS)),
+        ]
+    for name, factory in cases:
+        results.append(measure(name, factory, bytes_per_object=bytes_per_object(factory)))
+
+    coordinates = Coordinates(lat=55.75, lon=37.62)
+    results.append(measure("entity/hash_cached", lambda: hash(coordinates)))
+    results.append(measure("entity/hash_fresh", lambda: hash(Coordinates.construct(lat=55.75, lon=37.62))))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,25 @@
+"""
+Офлайн-справочник городов: открытие файла, поиск по префиксу, поиск с опечаткой и ближайший город к точке
+"""
+from benchmarks.common import measure, report
+
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.gazetteer import Gazetteer, DEFAULT_PATH
+
+
+def run():
+    gazetteer = Gazetteer(DEFAULT_PATH)
+    point = Coordinates(lat=55.9, lon=37.5)
+    results = [
+        measure("gazetteer/open", lambda: Gazetteer(DEFAULT_PATH).close()),
+        measure("gazetteer/prefix", lambda: gazetteer.search("новоси")),
+        measure("gazetteer/exact_latin", lambda: gazetteer.search("Moscow")),
+        measure("gazetteer/fuzzy", lambda: gazetteer.search("масква")),
+        measure("gazetteer/nearest", lambda: gazetteer.nearest(point)),
+    ]
+    gazetteer.close()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,69 @@
+"""
+История наблюдений: выборка суток одной ячейки и дневные агрегаты за год и за два года, когда в архиве
+два года почасовых наблюдений по CELLS ячейкам в сегментах месяцев, и дописывание пачки ответов
+"""
+import datetime
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import measure, report
+
+from fast_weather_bot.entity import WeatherPoint, WeatherCondition, WindDirection
+from fast_weather_bot.history import History, _ROW, _write_segment
+from fast_weather_bot.weather_api.grid import cell_key
+from fast_weather_bot.weather_api.hourly import HourlyForecast, HOUR
+
+CELLS = 50
+YEARS = 2
+DAY = 24 * HOUR
+
+
+def fill(path: str, end: datetime.datetime) -> None:
+    month = datetime.datetime(end.year - YEARS, end.month, 1, tzinfo=datetime.timezone.utc)
+    keys = np.array([cell_key((1100 + i, 750 + i)) for i in range(CELLS)])
+    rng = np.random.default_rng(0)
+    while month < end.replace(day=1):
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        hours = np.arange(month.timestamp(), following.timestamp(), HOUR, dtype=np.int64)
+        rows = np.zeros(len(hours) * CELLS, _ROW)
+        rows["key"] = np.repeat(keys, len(hours))
+        rows["time"] = np.tile(hours, CELLS)
+        rows["issued"] = rows["time"]
+        rows["temperature"] = rng.normal(5, 10, len(rows))
+        _write_segment(os.path.join(path, f"{month:%Y%m}.seg"), rows)
+        month = following
+
+
+def records(now: float, count: int) -> list:
+    current = WeatherPoint.construct(time=datetime.datetime.fromtimestamp(now), temperature=5, pressure=750,
+                                     condition=WeatherCondition.Rain, wind_speed=2.5,
+                                     wind_direction=WindDirection.N, humidity=80)
+    hourly = HourlyForecast.from_rows((int(now) // HOUR * HOUR + i * HOUR, 5, 0, 0, 1, 0, 750, 50, 1)
+                                      for i in range(24))
+    return [((1100 + i, 750 + i), now, (current, (), hourly)) for i in range(count)]
+
+
+def run():
+    with tempfile.TemporaryDirectory() as path:
+        end = datetime.datetime.now(datetime.timezone.utc)
+        fill(path, end)
+        history = History(os.path.join(path))
+        cell = (1100, 750)
+        now = end.replace(day=1).timestamp()
+        results = [
+            measure("history/scan/day", lambda: history.scan(cell, now - DAY, now), rows=24),
+            measure("history/aggregate/hourly_week", lambda: history.aggregate(cell, now - 7 * DAY, now)),
+            measure("history/aggregate/daily_year", lambda: history.aggregate(cell, now - 365 * DAY, now, DAY)),
+            measure(f"history/aggregate/daily_{YEARS}_years",
+                    lambda: history.aggregate(cell, now - YEARS * 365 * DAY, now, DAY)),
+        ]
+        batch = records(end.timestamp(), 100)
+        results.append(measure("history/append/100", lambda: history.append(batch), number=20, repeat=3))
+        history.close()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
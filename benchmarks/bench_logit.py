@@ -0,0 +1,70 @@
+"""
+Накладные расходы декоратора logit: выключенный уровень, выборка и включённый уровень с пустым приёмником
+"""
+import inspect
+from functools import wraps
+
+from benchmarks.common import measure, report, run_coroutine
+
+import log
+from log import logit, arglist, logger
+
+
+def legacy_logit(level: str = "TRACE"):
+    # Прежняя реализация: аргументы форматируются при каждом вызове, дважды
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                log.log(level, f"START AWAIT {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
+                ret = await func(*args, **kwargs)
+                log.log(level, f"END AWAIT {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
+                return ret
+
+            return wrapper
+        raise NotImplementedError
+
+    return decorate
+
+
+class Handler:
+    async def plain(self, msg):
+        return msg
+
+    @logit()
+    async def logged(self, msg):
+        return msg
+
+    @logit(sample=0.01)
+    async def sampled(self, msg):
+        return msg
+
+    @legacy_logit()
+    async def legacy(self, msg):
+        return msg
+
+
+def run():
+    handler = Handler()
+    msg = {"chat": {"id": 1}, "text": "Погода" * 10}
+    results = []
+
+    log.setup("INFO")
+    logger.remove()
+    logger.add(lambda message: None, level="INFO")
+    results.append(measure("logit/plain", lambda: run_coroutine(handler.plain(msg))))
+    results.append(measure("logit/disabled", lambda: run_coroutine(handler.logged(msg))))
+    results.append(measure("legacy_logit/disabled", lambda: run_coroutine(handler.legacy(msg))))
+
+    log.setup("TRACE")
+    logger.remove()
+    logger.add(lambda message: None, level="TRACE")
+    results.append(measure("logit/enabled", lambda: run_coroutine(handler.logged(msg))))
+    results.append(measure("logit/sampled_1pct", lambda: run_coroutine(handler.sampled(msg))))
+    results.append(measure("legacy_logit/enabled", lambda: run_coroutine(handler.legacy(msg))))
+    log.setup()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
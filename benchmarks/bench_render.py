@@ -0,0 +1,42 @@
+"""
+Отрисовка сообщений: текущая погода, прогноз по частям суток и клавиатура расписания
+"""
+import datetime
+import os
+
+from benchmarks.common import FIXTURES, measure, report
+
+from fast_weather_bot.bot import Bot
+from fast_weather_bot.chat_store import ChatSettings
+from fast_weather_bot.weather_api import YandexWeatherAPI
+
+
+def run():
+    api = YandexWeatherAPI("token")
+    with open(os.path.join(FIXTURES, "yandex_forecast_full.json"), "rb") as f:
+        raw = f.read()
+    doc = api.decode(raw)
+    weather = api.parse_current(doc)
+    hourly = api.parse_hourly(doc)
+    forecast = hourly.summary().forecasts()[0]
+    window = hourly[:24]
+
+    settings = ChatSettings(1, 55.75, 37.62)
+    for minute in range(0, 24 * 60, 90):
+        settings.add_time(datetime.time(minute // 60, minute % 60))
+
+    def forecast_text():
+        return "\n".join(Bot._format_forecast(f) for f in window.summary().forecasts())
+
+    return [
+        measure("render/weather", lambda: Bot._format_weather(weather)),
+        measure("render/forecast_part", lambda: Bot._format_forecast(forecast)),
+        measure("render/forecast_24h", forecast_text, hours=len(window)),
+        # Метод не обращается к состоянию бота, поэтому экземпляр не нужен
+        measure("render/schedule_keyboard", lambda: Bot._build_schedule_keyboard(None, settings),
+                buttons=len(settings.schedule)),
+    ]
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,63 @@
+"""
+Стоимость такта планировщика при разном числе задач: такт без готовых задач и запуск одной задачи
+с перепланированием. Время берётся виртуальное, задачи выполняются в настоящем цикле событий
+"""
+import asyncio
+import time
+
+from benchmarks.common import report
+
+from fast_weather_bot.scheduler import Scheduler
+
+JOB_COUNTS = (1000, 10000, 100000)
+
+
+async def noop() -> None:
+    pass
+
+
+def result(name: str, seconds: float, ops: int, **extra) -> dict:
+    per_op = seconds / ops
+    result = {"name": name, "ns_per_op": round(per_op * 1e9, 1), "ops_per_sec": round(1 / per_op, 1)}
+    result.update(extra)
+    return result
+
+
+async def measure_jobs(count: int, period: float = 3600, fired: int = 20000) -> list:
+    scheduler = Scheduler()
+    base = 1_000_000_000.0
+    for i in range(count):
+        scheduler.every(period, noop, first=base + i * period / count)
+
+    idle = 100000
+    started = time.perf_counter()
+    for _ in range(idle):
+        scheduler.run_pending(base - 1)
+    idle_time = time.perf_counter() - started
+
+    # Шаг виртуального времени такой, чтобы за такт наступало около десяти задач
+    step = period / count * 10
+    now = base
+    total = 0
+    busy_time = 0.0
+    while total < fired:
+        now += step
+        started = time.perf_counter()
+        total += scheduler.run_pending(now)
+        await asyncio.sleep(0)
+        busy_time += time.perf_counter() - started
+    return [
+        result(f"scheduler/idle_tick/{count}", idle_time, idle, jobs=count),
+        result(f"scheduler/fire_job/{count}", busy_time, total, jobs=count),
+    ]
+
+
+def run():
+    results = []
+    for count in JOB_COUNTS:
+        results.extend(asyncio.run(measure_jobs(count)))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,110 @@
+"""
+Холодный старт: импорт модулей бота в чистом процессе (отдельно - main с конфигом, который читается до импорта
+бота, и супервизору больше ничего не нужно) и время от создания Bot до первого getUpdates
+против заглушки Bot API с задержкой сети. Первый запуск задаёт список команд, повторный на той же базе -
+нет. Задачи чатов из базы восстанавливаются в фоне и на время старта не влияют
+"""
+import asyncio
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp.test_utils import TestServer
+
+from benchmarks.common import ROOT, report
+from benchmarks.loadsim import FakeTelegram, TOKEN
+
+from fast_weather_bot.bot import Bot
+from fast_weather_bot.chat_store import ChatStore
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.scheduler import Scheduler
+
+IMPORT_RUNS = 5
+RTT = 0.05
+CHATS = 20000
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import fast_weather_bot.main
+import fast_weather_bot.bot
+print(time.perf_counter() - started)
+"""
+
+IMPORT_MAIN_SCRIPT = """
+import time
+started = time.perf_counter()
+import fast_weather_bot.main
+print(time.perf_counter() - started)
+"""
+
+
+def result(name: str, seconds: float, **extra) -> dict:
+    result = {"name": name, "ns_per_op": round(seconds * 1e9, 1), "ops_per_sec": round(1 / seconds, 1)}
+    result.update(extra)
+    return result
+
+
+def measure_import(script: str = IMPORT_SCRIPT) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "fast_weather_bot"), ROOT]))
+    times = []
+    for _ in range(IMPORT_RUNS):
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT, env=env, text=True)
+        times.append(float(output))
+    return min(times)
+
+
+async def fill_chats(path: str, chats: int) -> None:
+    store = ChatStore(path, Coordinates(lat=55.75, lon=37.62))
+    await store.start()
+    for chat_id in range(chats):
+        settings = store.get(chat_id)
+        settings.coordinates = Coordinates(lat=50 + chat_id % 1000 / 100, lon=30 + chat_id // 1000 / 10)
+        settings.add_time(datetime.time(chat_id % 24, chat_id % 60))
+        settings.alarm = chat_id % 3 == 0
+        store.save(settings)
+    await store.close()
+
+
+async def time_to_poll(db_path: str) -> float:
+    telegram = FakeTelegram(poll_timeout=0.05, latency=RTT)
+    server = TestServer(telegram.app)
+    await server.start_server()
+    scheduler = Scheduler()
+    started = time.perf_counter()
+    bot = Bot(TOKEN, scheduler, "bench-key", Coordinates(lat=55.75, lon=37.62), db_path=db_path,
+              telegram_api_url=str(server.make_url("")).rstrip("/"))
+    task = asyncio.create_task(bot.start())
+    while not telegram.calls["getUpdates"]:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    bot.stop()
+    await task
+    await bot.close()
+    await scheduler.stop()
+    await server.close()
+    return elapsed
+
+
+async def measure_ready() -> list:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "chats.sqlite3")
+        await fill_chats(db_path, CHATS)
+        first = await time_to_poll(db_path)
+        restart = await time_to_poll(db_path)
+    return [
+        result("startup/ready/first", first, rtt_ms=RTT * 1000, chats=CHATS),
+        result("startup/ready/restart", restart, rtt_ms=RTT * 1000, chats=CHATS),
+    ]
+
+
+def run():
+    return [result("startup/import", measure_import()),
+            result("startup/import/main", measure_import(IMPORT_MAIN_SCRIPT))] + asyncio.run(measure_ready())
+
+
+if __name__ == "__main__":
+    report(run())
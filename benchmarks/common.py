@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+
+# Бот импортирует log и symbols напрямую, остальные модули - как fast_weather_bot.*
+for path in (os.path.join(ROOT, "fast_weather_bot"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def measure(name: str, func: Callable[[], Any], number: int = 0, repeat: int = 5, **extra) -> Dict[str, Any]:
+    """
+    Лучшее время одного вызова func из repeat серий
+    """
+    timer = timeit.Timer(func)
+    if not number:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    result = {"name": name, "ns_per_op": round(best * 1e9, 1), "ops_per_sec": round(1 / best, 1)}
+    result.update(extra)
+    return result
+
+
+def run_coroutine(coro) -> Any:
+    """
+    Выполняет корутину, которая ничего не ждёт, без цикла событий
+    """
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("Coroutine suspended")
+
+
+def report(results: List[Dict[str, Any]]) -> None:
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
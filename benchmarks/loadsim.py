@@ -0,0 +1,367 @@
+"""
+Нагрузочный прогон: настоящий Bot против локальных заглушек Bot API и Яндекс.Погоды.
+Виртуальные чаты одновременно проходят типичные сценарии, результат - JSON с пропускной способностью,
+задержками ответов по шагам, числом запросов к погодному API и ростом памяти
+
+    python -m benchmarks.loadsim --chats 200 --rounds 3 --latency 0.05 --error-rate 0.01
+
+С --workers N бот запускается супервизором в N процессах
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from benchmarks.common import FIXTURES
+
+import log
+from fast_weather_bot.bot import Bot, BotReplyAction, BotSettingsAction, BotScheduleAction
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.main import run_worker
+from fast_weather_bot.scheduler import Scheduler
+from fast_weather_bot.sharding import ShardOptions
+from fast_weather_bot.supervisor import Supervisor
+
+TOKEN = "123456:load-test"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Weather", "username": "weather_bot"}
+
+
+class FakeTelegram:
+    """
+    Заглушка Bot API: отдаёт обновления через getUpdates и складывает ответы бота в очереди по чатам
+    """
+
+    def __init__(self, poll_timeout: float = 0.5, latency: float = 0.0):
+        """
+        :param latency: Задержка сети на каждый вызов в секундах
+        """
+        self._poll_timeout = poll_timeout
+        self._latency = latency
+        self._updates: List[dict] = []
+        self._update_id = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self.replies: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    def push(self, update: dict) -> None:
+        update["update_id"] = next(self._update_id)
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def _get_updates(self, data: Dict[str, Any]) -> list:
+        offset = int(data.get("offset", 0))
+        if offset < 0:
+            return self._updates[-1:]
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                # Короткий long polling, чтобы остановка бота не ждала полный таймаут
+                await asyncio.wait_for(self._new_updates.wait(), self._poll_timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(data.get("limit", 100))]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        # aiogram шлёт форму, супервизор - JSON
+        data = await request.json() if request.content_type == "application/json" else dict(await request.post())
+        if method == "getUpdates":
+            result = await self._get_updates(data)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            self.replies[chat_id].put_nowait((time.perf_counter(), data["text"]))
+            result = {"message_id": self.calls[method], "date": int(time.time()), "text": data["text"],
+                      "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        elif method == "answerInlineQuery":
+            # Ответ на inline-запрос узнаётся по id запроса, в котором первым идёт id пользователя
+            query_id = data["inline_query_id"]
+            self.replies[int(query_id.split("-")[0])].put_nowait((time.perf_counter(), query_id))
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeYandex:
+    """
+    Заглушка API Яндекс.Погоды с задержкой и долей ошибок
+    """
+
+    def __init__(self, payload: bytes, latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0,
+                 seed: int = 0):
+        """
+        :param latency: Средняя задержка ответа в секундах
+        :param jitter: Разброс задержки, доля от latency
+        :param error_rate: Доля ответов 500
+        """
+        self._payload = payload
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.app = web.Application()
+        self.app.router.add_get("/v1/{rate}", self._handle)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        delay = self._latency * (1 + self._jitter * (2 * self._random.random() - 1))
+        await asyncio.sleep(max(0.0, delay))
+        if self._random.random() < self._error_rate:
+            self.errors += 1
+            return web.Response(status=500)
+        return web.Response(body=self._payload, content_type="application/json")
+
+
+# Шаги, на которые бот ничего не отвечает или ответ которых не ждём
+SILENT_STEPS = {"schedule_del_time", "inline_typing"}
+# Что набирают в inline-режиме
+INLINE_CITIES = ["Москва", "Казань", "Новосибирск", "Самара", "Тверь"]
+
+
+class VirtualChat:
+    def __init__(self, chat_id: int, telegram: FakeTelegram, timeout: float, rng: random.Random):
+        self.chat_id = chat_id
+        self._telegram = telegram
+        self._timeout = timeout
+        self._random = rng
+        self._message_id = itertools.count(1)
+        self.user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+        self.chat = {"id": chat_id, "type": "private"}
+
+    def _message(self, text: str) -> dict:
+        message = {"message_id": next(self._message_id), "date": int(time.time()), "chat": self.chat,
+                   "from": self.user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": message}
+
+    def _callback(self, data: str) -> dict:
+        message = {"message_id": next(self._message_id), "date": int(time.time()), "chat": self.chat,
+                   "from": BOT_USER, "text": "Настройки"}
+        return {"callback_query": {"id": f"{self.chat_id}-{message['message_id']}", "from": self.user,
+                                   "chat_instance": str(self.chat_id), "data": data, "message": message}}
+
+    def _inline(self, query: str) -> dict:
+        return {"inline_query": {"id": f"{self.chat_id}-{next(self._message_id)}", "from": self.user,
+                                 "query": query, "offset": ""}}
+
+    async def step(self, name: str, update: dict, stats: "Stats") -> None:
+        replies = self._telegram.replies[self.chat_id]
+        while not replies.empty():
+            replies.get_nowait()
+        started = time.perf_counter()
+        self._telegram.push(update)
+        if name in SILENT_STEPS:
+            return
+        inline_query_id = update["inline_query"]["id"] if "inline_query" in update else None
+        try:
+            while True:
+                received, text = await asyncio.wait_for(replies.get(), self._timeout)
+                # Ответы на предыдущие нажатия клавиш пропускаем
+                if inline_query_id is None or text == inline_query_id:
+                    break
+        except asyncio.TimeoutError:
+            stats.timeouts[name] += 1
+            return
+        stats.latencies[name].append(received - started)
+
+    async def run(self, rounds: int, stats: "Stats", think_time: float) -> None:
+        for _ in range(rounds):
+            t = f"{self._random.randrange(24):02d}:{self._random.randrange(60):02d}"
+            lat = round(55.5 + self._random.random(), 4)
+            lon = round(37.0 + self._random.random(), 4)
+            flow = [
+                ("start", self._message("/start")),
+                ("weather", self._message(BotReplyAction.GetWeather.value)),
+                ("forecast", self._message("/forecast")),
+                ("history", self._message("/history 7")),
+                ("settings", self._message("/settings")),
+                ("schedule", self._callback(BotSettingsAction.Schedule.name)),
+                ("schedule_add", self._callback(BotScheduleAction.Add.name)),
+                ("schedule_add_time", self._message(t)),
+                ("schedule_del", self._callback(BotScheduleAction.Del.name)),
+                ("schedule_del_time", self._message(t)),
+                ("coordinates", self._callback(BotSettingsAction.ChangeCoord.name)),
+                ("coordinates_input", self._message(f"{lat} {lon}")),
+                ("alarm_on", self._message(BotReplyAction.TurnOnAlarm.value)),
+                ("alarm_off", self._message(BotReplyAction.TurnOffAlarm.value)),
+            ]
+            city = self._random.choice(INLINE_CITIES)
+            flow += [("inline_typing", self._inline(city[:i])) for i in range(1, len(city))]
+            flow.append(("inline", self._inline(city)))
+            for name, update in flow:
+                await self.step(name, update, stats)
+                if think_time:
+                    await asyncio.sleep(self._random.expovariate(1 / think_time))
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_report(values: List[float], timeouts: int) -> Dict[str, Any]:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    return {"count": len(values), "timeouts": timeouts, "p50_ms": ms(percentile(values, 0.5)),
+            "p99_ms": ms(percentile(values, 0.99)), "max_ms": ms(max(values) if values else None)}
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def simulate(chats: int = 100, rounds: int = 1, latency: float = 0.05, error_rate: float = 0.0,
+                   think_time: float = 0.0, timeout: float = 5.0, send_rate: float = 10000,
+                   chat_interval: float = 0.0, fixture: str = "yandex_informers.json", seed: int = 0,
+                   fallback: Sequence[str] = (), workers: int = 1, log_level: str = "ERROR",
+                   ) -> Dict[str, Any]:
+    with open(os.path.join(FIXTURES, fixture), "rb") as f:
+        payload = f.read()
+    rate = "informers" if "informers" in fixture else "forecast"
+
+    telegram = FakeTelegram()
+    yandex = FakeYandex(payload, latency=latency, error_rate=error_rate, seed=seed)
+    telegram_server = TestServer(telegram.app)
+    yandex_server = TestServer(yandex.app)
+    await telegram_server.start_server()
+    await yandex_server.start_server()
+
+    db_dir = tempfile.TemporaryDirectory()
+    telegram_url = str(telegram_server.make_url("")).rstrip("/")
+    bot = supervisor = None
+    if workers > 1:
+        # Воркеры читают настройки из окружения, как при обычном запуске
+        shard = ShardOptions(workers=workers, socket_dir=db_dir.name)
+        os.environ.update(TELEGRAM_TOKEN=TOKEN, YANDEX_KEY="load-test-key", COORDINATES="55.75 37.62",
+                          DB_PATH=os.path.join(db_dir.name, "chats.sqlite3"), TELEGRAM_API_URL=telegram_url,
+                          YANDEX_API_URL=str(yandex_server.make_url("/v1/")), YANDEX_RATE=rate,
+                          TELEGRAM_SEND_RATE=str(send_rate), TELEGRAM_CHAT_INTERVAL=str(chat_interval),
+                          WEATHER_FALLBACK=",".join(fallback), WORKERS=str(workers), WORKER_SOCKET_DIR=db_dir.name,
+                          WEATHER_SHARED_CACHE=os.path.join(db_dir.name, "weather.sqlite3"), LOG_LEVEL=log_level,
+                          SNAPSHOT_PATH=os.path.join(db_dir.name, "bot.snapshot"), METRICS_PORT="0",
+                          HISTORY_PATH=os.path.join(db_dir.name, "history"), HISTORY_INTERVAL="1",
+                          BOT_MODE="polling")
+        supervisor = Supervisor(run_worker, shard, TOKEN, telegram_api_url=telegram_url)
+        bot_task = asyncio.create_task(supervisor.run())
+        while not all(os.path.exists(shard.socket_path(i)) for i in range(workers)):
+            await asyncio.sleep(0.05)
+    else:
+        scheduler = Scheduler()
+        bot = Bot(TOKEN, scheduler, "load-test-key", Coordinates(lat=55.75, lon=37.62),
+                  db_path=os.path.join(db_dir.name, "chats.sqlite3"), telegram_api_url=telegram_url,
+                  send_rate=send_rate, chat_send_interval=chat_interval,
+                  weather_rate=rate, weather_api_url=str(yandex_server.make_url("/v1/")), weather_fallback=fallback)
+        scheduler.start()
+        bot_task = asyncio.create_task(bot.start())
+    while telegram.calls["getUpdates"] < 2:
+        await asyncio.sleep(0.01)
+
+    stats = Stats()
+    rng = random.Random(seed)
+    virtual_chats = [VirtualChat(1000 + i, telegram, timeout, random.Random(rng.random())) for i in range(chats)]
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    await asyncio.gather(*(chat.run(rounds, stats, think_time) for chat in virtual_chats))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    result = {
+        "chats": chats,
+        "workers": workers,
+        "rounds": rounds,
+        "upstream_latency_s": latency,
+        "upstream_error_rate": error_rate,
+        "elapsed_s": round(elapsed, 3),
+        "steps": sum(len(values) for values in stats.latencies.values()),
+        "timeouts": sum(stats.timeouts.values()),
+        "steps_per_sec": round(sum(len(values) for values in stats.latencies.values()) / elapsed, 1),
+        "latency": latency_report(list(itertools.chain(*stats.latencies.values())), sum(stats.timeouts.values())),
+        "latency_by_step": {name: latency_report(stats.latencies.get(name, []), stats.timeouts.get(name, 0))
+                            for name in {**stats.latencies, **stats.timeouts}},
+        "upstream": {"calls": yandex.calls, "errors": yandex.errors},
+        "telegram_calls": dict(telegram.calls),
+        "memory": {"rss_before": rss_before, "rss_after": rss_after, "rss_growth": rss_after - rss_before},
+    }
+
+    if bot is not None:
+        weather_api = bot._weather_api
+        result["upstream"].update(cache_hits=weather_api.hits, cache_misses=weather_api.misses,
+                                  coalesced=weather_api.flight.coalesced)
+        bot.stop()
+        await bot_task
+        await scheduler.stop()
+        await bot.close()
+    else:
+        supervisor.stop()
+        await bot_task
+    await telegram_server.close()
+    await yandex_server.close()
+    db_dir.cleanup()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the bot against local Telegram and Yandex stand-ins")
+    parser.add_argument("--chats", type=int, default=100, help="Virtual chats running at the same time")
+    parser.add_argument("--rounds", type=int, default=1, help="How many times each chat repeats the flow")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean weather API latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of weather API requests that fail")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between user actions, seconds")
+    parser.add_argument("--timeout", type=float, default=5.0, help="How long to wait for a reply, seconds")
+    parser.add_argument("--send-rate", type=float, default=10000, help="Bot send rate limit, messages per second")
+    parser.add_argument("--chat-interval", type=float, default=0.0, help="Bot pause between messages to one chat")
+    parser.add_argument("--fixture", default="yandex_informers.json", help="Weather payload from benchmarks/fixtures")
+    parser.add_argument("--fallback", action="append", default=[],
+                        help="Fallback weather provider (WeatherAPIType name, e.g. Stub), can be repeated")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes started by the supervisor")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    log.setup(args.log_level)
+    result = asyncio.run(simulate(chats=args.chats, rounds=args.rounds, latency=args.latency,
+                                  error_rate=args.error_rate, think_time=args.think_time, timeout=args.timeout,
+                                  send_rate=args.send_rate, chat_interval=args.chat_interval,
+                                  fixture=args.fixture, seed=args.seed, fallback=args.fallback,
+                                  workers=args.workers, log_level=args.log_level))
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Запускает все бенчмарки (benchmarks/bench_*.py) и пишет результаты в JSON.
+С --compare сравнивает с сохранёнными результатами и завершается с кодом 1, если что-то замедлилось
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json --threshold 0.2
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import ROOT
+
+BENCHMARKS_DIR = os.path.join(ROOT, "benchmarks")
+
+
+def discover(only: Optional[str] = None) -> List[str]:
+    names = sorted(name[:-3] for name in os.listdir(BENCHMARKS_DIR)
+                   if name.startswith("bench_") and name.endswith(".py"))
+    if only:
+        names = [name for name in names if only in name]
+    return names
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only: Optional[str] = None) -> Dict[str, Any]:
+    results = []
+    for name in discover(only):
+        print(f"Running {name}", file=sys.stderr)
+        module = importlib.import_module(f"benchmarks.{name}")
+        for result in module.run():
+            result["suite"] = name
+            results.append(result)
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Результаты, которые стали медленнее baseline больше чем на threshold (0.2 - на 20%)
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None or not old["ns_per_op"]:
+            continue
+        ratio = result["ns_per_op"] / old["ns_per_op"]
+        if ratio > 1 + threshold:
+            regressions.append({"name": result["name"], "before": old["ns_per_op"], "after": result["ns_per_op"],
+                                "ratio": round(ratio, 2)})
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the bot's hot paths")
+    parser.add_argument("--output", help="Write results to this file instead of stdout")
+    parser.add_argument("--only", help="Run only benchmarks whose module name contains this string")
+    parser.add_argument("--compare", help="Baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    current = run(args.only)
+    text = json.dumps(current, ensure_ascii=False, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']}: {regression['before']} -> {regression['after']} ns/op "
+                  f"(x{regression['ratio']})", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
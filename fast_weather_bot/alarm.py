@@ -0,0 +1,352 @@
+import asyncio
+import re
+import time
+import zlib
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from fast_weather_bot.entity import Coordinates, WeatherCondition
+from fast_weather_bot.scheduler import Scheduler, Job
+from fast_weather_bot.weather_api.grid import Cell, cell_of, cell_center
+from fast_weather_bot.weather_api.hourly import HourlyForecast
+from fast_weather_bot.weather_api.weather_base import WeatherAPIBase
+
+Notify = Callable[[List[int], "AlarmRule", HourlyForecast], Awaitable[None]]
+
+_CONDITION_WORDS = {
+    "гроза": (WeatherCondition.Thunderstorm,), "thunderstorm": (WeatherCondition.Thunderstorm,),
+    "морось": (WeatherCondition.Drizzle,), "drizzle": (WeatherCondition.Drizzle,),
+    "дождь": (WeatherCondition.Rain,), "rain": (WeatherCondition.Rain,),
+    "снег": (WeatherCondition.Snow,), "snow": (WeatherCondition.Snow,),
+    "осадки": (WeatherCondition.Thunderstorm, WeatherCondition.Drizzle, WeatherCondition.Rain, WeatherCondition.Snow),
+    "precipitation": (WeatherCondition.Thunderstorm, WeatherCondition.Drizzle, WeatherCondition.Rain,
+                      WeatherCondition.Snow),
+}
+_CONDITION_NAMES = {WeatherCondition.Thunderstorm: "гроза", WeatherCondition.Drizzle: "морось",
+                    WeatherCondition.Rain: "дождь", WeatherCondition.Snow: "снег"}
+_PRECIPITATION = frozenset(_CONDITION_WORDS["осадки"])
+_TEMPERATURE = re.compile(r"(?:t|т|temp|температура)([<>])(-?\d+(?:[.,]\d+)?)")
+_WIND = re.compile(r"(?:ветер|wind)>(\d+(?:[.,]\d+)?)")
+_HOURS = re.compile(r"(\d{1,2})-(\d{1,2})")
+
+_CODES = max(c.value for c in WeatherCondition) + 1
+
+
+def _number(text: str) -> float:
+    return float(text.replace(",", "."))
+
+
+class AlarmRule:
+    """
+    Правило оповещения: срабатывает на час, в который выполняются все его условия. Текст правила - слова
+    через пробел:
+    - t<-10, t>30 - температура ниже или выше порога;
+    - ветер>15 (wind>15) - ветер сильнее порога в м/с;
+    - гроза, морось, дождь, снег, осадки - одно из перечисленных состояний погоды;
+    - 7-22 - только в эти часы по местному времени, 22-7 - ночью
+    """
+    __slots__ = ("conditions", "temp_below", "temp_above", "wind_above", "hours", "_text")
+
+    def __init__(self, conditions: FrozenSet[WeatherCondition] = frozenset(),
+                 temp_below: Optional[float] = None,
+                 temp_above: Optional[float] = None,
+                 wind_above: Optional[float] = None,
+                 hours: Optional[Tuple[int, int]] = None,
+                 ):
+        self.conditions = frozenset(conditions)
+        self.temp_below = temp_below
+        self.temp_above = temp_above
+        self.wind_above = wind_above
+        self.hours = hours
+        self._text = self._format()
+
+    @classmethod
+    def parse(cls, text: str) -> "AlarmRule":
+        """
+        :raises ValueError: Если в тексте есть непонятное слово или нет ни одного условия
+        """
+        return _parse(" ".join(text.lower().split()))
+
+    def _format(self) -> str:
+        words = []
+        if self.conditions == _PRECIPITATION:
+            words.append("осадки")
+        else:
+            words += [name for condition, name in _CONDITION_NAMES.items() if condition in self.conditions]
+        if self.temp_below is not None:
+            words.append(f"t<{self.temp_below:g}")
+        if self.temp_above is not None:
+            words.append(f"t>{self.temp_above:g}")
+        if self.wind_above is not None:
+            words.append(f"ветер>{self.wind_above:g}")
+        if self.hours is not None:
+            words.append(f"{self.hours[0]}-{self.hours[1]}")
+        return " ".join(words)
+
+    def __str__(self) -> str:
+        return self._text
+
+    def __repr__(self) -> str:
+        return f"<AlarmRule {self._text}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AlarmRule) and self._text == other._text
+
+    def __hash__(self) -> int:
+        return hash(self._text)
+
+
+@lru_cache(maxsize=4096)
+def _parse(text: str) -> AlarmRule:
+    conditions = set()
+    options = {}
+    for word in text.split():
+        if word in _CONDITION_WORDS:
+            conditions.update(_CONDITION_WORDS[word])
+        elif match := _TEMPERATURE.fullmatch(word):
+            options["temp_below" if match[1] == "<" else "temp_above"] = _number(match[2])
+        elif match := _WIND.fullmatch(word):
+            options["wind_above"] = _number(match[1])
+        elif match := _HOURS.fullmatch(word):
+            start, end = int(match[1]), int(match[2])
+            if start > 23 or end > 24 or start == end:
+                raise ValueError(f"Invalid hours: {word}")
+            options["hours"] = (start, end)
+        else:
+            raise ValueError(f"Unknown alarm rule word: {word}")
+    if not conditions and not options.keys() - {"hours"}:
+        raise ValueError(f"Alarm rule has no conditions: {text}")
+    return AlarmRule(frozenset(conditions), **options)
+
+
+# Погода хуже облачной - правило для чатов, которые не задали своих
+BAD_WEATHER = AlarmRule(_PRECIPITATION)
+
+
+class CompiledRules:
+    """
+    Правила, собранные в массивы порогов и масок. Все правила проверяются по всем часам прогноза
+    одним проходом numpy, без цикла по правилам
+    """
+
+    def __init__(self, rules: Sequence[AlarmRule]):
+        self.rules = list(rules)
+
+        def column(name: str, default: float) -> np.ndarray:
+            values = [getattr(rule, name) for rule in self.rules]
+            return np.array([default if v is None else v for v in values], dtype=np.float32).reshape(-1, 1)
+
+        self._temp_below = column("temp_below", np.inf)
+        self._temp_above = column("temp_above", -np.inf)
+        self._wind_above = column("wind_above", -np.inf)
+        self._conditions = np.ones((len(self.rules), _CODES), dtype=bool)
+        self._hours = np.ones((len(self.rules), 24), dtype=bool)
+        for i, rule in enumerate(self.rules):
+            if rule.conditions:
+                self._conditions[i] = False
+                self._conditions[i, [condition.value for condition in rule.conditions]] = True
+            if rule.hours is not None:
+                start, end = rule.hours
+                hours = np.arange(24)
+                self._hours[i] = (hours >= start) & (hours < end) if start < end else (hours >= start) | (hours < end)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def evaluate(self, hourly: HourlyForecast) -> np.ndarray:
+        """
+        :return: Маска формы (число правил, число часов): выполняется ли правило в этот час
+        """
+        return ((hourly.temperature < self._temp_below) & (hourly.temperature > self._temp_above)
+                & (hourly.wind_speed > self._wind_above)
+                & self._conditions[:, hourly.condition] & self._hours[:, hourly.local_hour()])
+
+
+def find_bad_weather(hourly: HourlyForecast, now: float, horizon: float) -> Optional[HourlyForecast]:
+    """
+    Первый отрезок подряд идущих часов с погодой хуже облачной в ближайшие horizon часов
+    """
+    window = hourly.window(now, horizon)
+    runs = window.runs(window.bad_weather())
+    if not len(runs):
+        return None
+    start, stop = runs[0]
+    return window[start:stop]
+
+
+class _Cell:
+    """
+    Подписки одной ячейки. Одинаковые правила разных чатов проверяются один раз
+    """
+    __slots__ = ("chats", "compiled", "subscribers", "active", "pending", "checked", "job")
+
+    def __init__(self):
+        self.chats: Dict[int, Tuple[AlarmRule, ...]] = {}
+        self.compiled: Optional[CompiledRules] = None
+        self.subscribers: List[List[int]] = []
+        # Правила, которые выполнялись при прошлой проверке
+        self.active: Set[AlarmRule] = set()
+        # Новые подписки: о правиле, которое уже выполняется, им ещё не сообщали
+        self.pending: Dict[AlarmRule, Set[int]] = {}
+        self.checked = False  # Проверялась ли ячейка с момента создания
+        self.job: Optional[Job] = None
+
+    def add(self, chat_id: int, rules: Tuple[AlarmRule, ...]) -> None:
+        old = self.chats.get(chat_id, ())
+        self.chats[chat_id] = rules
+        for rule in rules:
+            if rule not in old:
+                self.pending.setdefault(rule, set()).add(chat_id)
+        self.compiled = None
+
+    def remove(self, chat_id: int) -> None:
+        for rule in self.chats.pop(chat_id, ()):
+            self.pending.get(rule, set()).discard(chat_id)
+        self.compiled = None
+
+    def compile(self) -> CompiledRules:
+        if self.compiled is None:
+            subscribers: Dict[AlarmRule, List[int]] = {}
+            for chat_id, rules in self.chats.items():
+                for rule in rules:
+                    subscribers.setdefault(rule, []).append(chat_id)
+            self.compiled = CompiledRules(list(subscribers))
+            self.subscribers = list(subscribers.values())
+            self.active.intersection_update(subscribers)
+        return self.compiled
+
+
+class AlarmEngine:
+    """
+    Оповещения по правилам. Подписчики группируются по ячейкам сетки: на ячейку приходится одна задача
+    и один запрос прогноза за цикл, сколько бы чатов в ней ни было. Циклы разных ячеек сдвинуты по фазе,
+    чтобы запросы не уходили пачкой.
+    Оповещение отправляется только когда правило начинает выполняться, пока оно выполняется, повторов нет
+    """
+
+    def __init__(self, scheduler: Scheduler, weather_api: WeatherAPIBase, notify: Notify,
+                 interval: float = 5,
+                 grid_step: float = 0.05,
+                 horizon: float = 12,
+                 ):
+        """
+        :param horizon: На сколько часов вперёд проверять правила
+        """
+        self._scheduler = scheduler
+        self._weather_api = weather_api
+        self._notify = notify
+        self._interval = interval
+        self._grid_step = grid_step
+        self._horizon = horizon
+        self._cells: Dict[Cell, _Cell] = {}
+        self._chat_cell: Dict[int, Cell] = {}
+        # Правила, о которых чатам сообщили до перезапуска, см. restore
+        self._notified: Dict[int, Tuple[str, ...]] = {}
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._chat_cell)
+
+    @property
+    def cells(self) -> int:
+        return len(self._cells)
+
+    @property
+    def rules(self) -> int:
+        """
+        Сколько разных правил проверяется за цикл по всем ячейкам
+        """
+        return sum(len(cell.compile()) for cell in self._cells.values())
+
+    def _phase(self, cell: Cell) -> float:
+        return zlib.crc32(repr(cell).encode()) % 1000 / 1000 * self._interval
+
+    def subscribe(self, chat_id: int, coordinates: Coordinates, rules: Sequence[AlarmRule] = (BAD_WEATHER,)) -> None:
+        """
+        Подписывает чат на оповещения. Повторный вызов переносит подписку на новые координаты или правила
+        """
+        key = cell_of(coordinates, self._grid_step)
+        rules = tuple(dict.fromkeys(rules)) or (BAD_WEATHER,)
+        if self._chat_cell.get(chat_id) == key:
+            cell = self._cells[key]
+            if cell.chats[chat_id] != rules:
+                cell.add(chat_id, rules)
+            return
+        self.unsubscribe(chat_id)
+        self._chat_cell[chat_id] = key
+        cell = self._cells.get(key)
+        if cell is None:
+            cell = self._cells[key] = _Cell()
+            cell.job = self._scheduler.every(self._interval, self._evaluate, key, first=time.time() + self._phase(key))
+        cell.add(chat_id, rules)
+        notified = self._notified.pop(chat_id, ())
+        for rule in rules:
+            if str(rule) in notified:
+                cell.pending.get(rule, set()).discard(chat_id)
+                if not cell.checked:
+                    cell.active.add(rule)
+
+    def unsubscribe(self, chat_id: int) -> None:
+        key = self._chat_cell.pop(chat_id, None)
+        if key is None:
+            return
+        cell = self._cells[key]
+        cell.remove(chat_id)
+        if not cell.chats:
+            del self._cells[key]
+            self._scheduler.cancel(cell.job)
+
+    def notified(self) -> Dict[int, Tuple[str, ...]]:
+        """
+        Выполняющиеся правила, о которых чатам уже сообщили. Сохраняется в снимок при остановке
+        """
+        notified: Dict[int, List[str]] = {}
+        for cell in self._cells.values():
+            for rule in cell.active:
+                pending = cell.pending.get(rule, ())
+                for chat_id, rules in cell.chats.items():
+                    if rule in rules and chat_id not in pending:
+                        notified.setdefault(chat_id, []).append(str(rule))
+        # Чаты, которые после перезапуска ещё не успели подписаться
+        for chat_id, rules in self._notified.items():
+            if chat_id not in self._chat_cell:
+                notified.setdefault(chat_id, []).extend(rules)
+        return {chat_id: tuple(rules) for chat_id, rules in notified.items()}
+
+    def restore(self, notified: Dict[int, Sequence[str]]) -> None:
+        """
+        Восстанавливает состояние после перезапуска, чтобы уже выполняющиеся правила не сработали повторно.
+        Вызывается до подписки чатов
+        """
+        self._notified = {chat_id: tuple(rules) for chat_id, rules in notified.items()}
+
+    async def _evaluate(self, key: Cell) -> None:
+        hourly = await self._weather_api.hourly(cell_center(key, self._grid_step))
+        cell = self._cells.get(key)
+        if cell is None:
+            return
+        compiled = cell.compile()
+        window = hourly.window(time.time(), self._horizon)
+        matches = compiled.evaluate(window)
+        firing = np.flatnonzero(matches.any(axis=1))
+        pending, cell.pending = cell.pending, {}
+        cell.checked = True
+        notifications = []
+        for i in firing.tolist():
+            rule = compiled.rules[i]
+            chats = list(pending.get(rule, ())) if rule in cell.active else cell.subscribers[i]
+            if chats:
+                start, stop = window.runs(matches[i])[0]
+                notifications.append((chats, rule, window[start:stop]))
+        cell.active = {compiled.rules[i] for i in firing.tolist()}
+        if not notifications:
+            return
+        self.fired += len(notifications)
+        results = await asyncio.gather(*(self._notify(*notification) for notification in notifications),
+                                       return_exceptions=True)
+        for (chats, rule, _), result in zip(notifications, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to notify {len(chats)} chats about '{rule}': {result}")
@@ -1,21 +1,41 @@
 import asyncio
 import datetime
+import hashlib
+import os
+import time
 from enum import Enum
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Sequence, List, Awaitable
 
 import aiogram
-import schedule
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+import numpy as np
 from aiogram.dispatcher import FSMContext
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.dispatcher.filters.state import StatesGroup, State
 from aiogram.types import KeyboardButton, Message, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton, \
-    CallbackQuery
+    CallbackQuery, ContentType, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from loguru import logger
 
-from fast_weather_bot.entity import Coordinates, WeatherPoint, WeatherCondition, Forecast
+from fast_weather_bot.alarm import AlarmEngine, AlarmRule, BAD_WEATHER
+from fast_weather_bot.chat_store import ChatStore, ChatSettings
+from fast_weather_bot.entity import Coordinates, WeatherPoint, Forecast
+from fast_weather_bot.fsm_storage import BoundedStorage, StorageOptions
+from fast_weather_bot.gazetteer import Place, default_gazetteer, normalize
+from fast_weather_bot.history import History, HistoryOptions
+from fast_weather_bot.inline import InlineAnswers, InlineOptions
+from fast_weather_bot.metrics import REGISTRY
+from fast_weather_bot.scheduler import Scheduler, Job
+from fast_weather_bot.sender import Sender, Priority
+from fast_weather_bot.sharding import ShardOptions
+from fast_weather_bot.snapshot import Snapshot, write as write_snapshot
+from fast_weather_bot.webhook import WebhookServer, WebhookOptions, ShardListener
+from fast_weather_bot.weather_api import WeatherFactory, WeatherAPIType, CacheOptions, HTTPOptions, HedgeOptions, \
+    Prefetcher, PrefetchOptions
+from fast_weather_bot.weather_api.grid import cell_of
+from fast_weather_bot.weather_api.hourly import HourlyForecast, HOUR
 from log import logit
 from symbols import wind_direction2arrow, wind_direction2text, weather_condition2text, day_part2text
-from weather_api import WeatherFactory, WeatherAPIType
+
+DAY = 24 * HOUR
 
 
 class BotReplyAction(Enum):
@@ -67,22 +87,146 @@ class Bot:
         InlineKeyboardButton(BotSettingsAction.ChangeCoord.value, callback_data=BotSettingsAction.ChangeCoord.name)
     )
 
+    _commands = (("/start", "Начать работу с ботом"),
+                 ("/current", "Текущая погода"),
+                 ("/forecast", "Прогноз, можно указать число часов: /forecast 48"),
+                 ("/alarm", "Правила оповещения: /alarm снег t<-10 7-22"),
+                 ("/history", "История погоды, можно указать число дней: /history 7"),
+                 ("/settings", "Настройки"),
+                 )
+
+    # Раз в столько чатов восстановление задач отдаёт управление циклу событий
+    restore_batch = 100
+    # Состояние оповещений из более старого снимка не восстанавливается: за это время погода могла смениться
+    snapshot_max_age = 3600
+    history_max_days = 366
+    # Как часто запоминать в базе, до какого момента отправки по расписанию уже выполнены
+    schedule_checkpoint = 60.0
+
     def __init__(self, token: str,
-                 scheduler: schedule.Scheduler,
+                 scheduler: Scheduler,
                  weather_api_token: str,
                  coordinates: Coordinates,
+                 weather_cache: Optional[CacheOptions] = None,
+                 weather_http: Optional[HTTPOptions] = None,
+                 db_path: str = "weather_bot.sqlite3",
+                 alarm_interval: float = 5,
+                 telegram_api_url: Optional[str] = None,
+                 send_rate: float = 30,
+                 chat_send_interval: float = 1.0,
+                 webhook: Optional[WebhookOptions] = None,
+                 weather_rate: str = "informers",
+                 forecast_days: int = 3,
+                 forecast_hours: int = 24,
+                 alarm_horizon: float = 12,
+                 weather_api_url: Optional[str] = None,
+                 fsm: Optional[StorageOptions] = None,
+                 weather_fallback: Sequence[str] = (),
+                 weather_hedge: Optional[HedgeOptions] = None,
+                 prefetch: Optional[PrefetchOptions] = None,
+                 shard: Optional[ShardOptions] = None,
+                 snapshot_path: Optional[str] = None,
+                 inline: Optional[InlineOptions] = None,
+                 history: Optional[HistoryOptions] = None,
                  ):
-        self._bot = aiogram.Bot(token=token)
-        self._dp = aiogram.Dispatcher(self._bot, storage=MemoryStorage())
+        """
+        :param shard: Если задан номер воркера, бот обслуживает только свои чаты и получает обновления
+                      от супервизора, см. supervisor.Supervisor
+        :param history: Если задан каталог, полученные от провайдера наблюдения и прогнозы записываются
+                        в историю, из которой отвечает /history
+        :param snapshot_path: Файл, в который при остановке сохраняются кэш погоды и состояние оповещений,
+                              чтобы после перезапуска не запрашивать погоду заново и не повторять оповещения
+        """
+        server = TelegramAPIServer.from_base(telegram_api_url) if telegram_api_url else TELEGRAM_PRODUCTION
+        self._bot = aiogram.Bot(token=token, server=server)
+        self._sender = Sender(self._bot.send_message, rate=send_rate, chat_interval=chat_send_interval)
+        self._dp = aiogram.Dispatcher(self._bot, storage=BoundedStorage(fsm))
         self._scheduler = scheduler
-        self._bad_weather_alarm: bool = False
-        self._chat_id: int = 0
-        self._weather_api_token = weather_api_token
-        self._coordinates = coordinates
-        self._current_keyboard = self._reply_keyboard_turn_on_alarm
-        self._alarm_job: Optional[schedule.Job] = None
-        self._schedule_jobs: Dict[datetime.time, schedule.Job] = {}
+        self._chats = ChatStore(db_path, coordinates)
+        self._weather_api = WeatherFactory.create(WeatherAPIType.Yandex, weather_api_token,
+                                                  http=weather_http, cache=weather_cache,
+                                                  rate=weather_rate, days=forecast_days, url=weather_api_url,
+                                                  fallback=[WeatherAPIType[name] for name in weather_fallback],
+                                                  hedge=weather_hedge)
+        self._forecast_hours = forecast_hours
+        self._grid_step = (weather_cache or CacheOptions()).grid_step
+        self._max_forecast_hours = forecast_days * 24
+        self._alarms = AlarmEngine(scheduler, self._weather_api, self._try_bad_weather_alarm,
+                                   interval=alarm_interval,
+                                   grid_step=(weather_cache or CacheOptions()).grid_step,
+                                   horizon=alarm_horizon)
+        self._schedule_jobs: Dict[Tuple[int, datetime.time], Job] = {}
+        self._checkpointing = False
+        self._prefetcher = Prefetcher(scheduler, self._weather_api, prefetch,
+                                      grid_step=(weather_cache or CacheOptions()).grid_step)
+        self._webhook_options = webhook
+        self._shard = shard or ShardOptions()
+        if self._shard.index is not None:
+            self._webhook = ShardListener(self._dp, self._shard.socket_path(self._shard.index),
+                                          queue_size=self._shard.queue_size)
+        else:
+            self._webhook = WebhookServer(self._dp, webhook) if webhook else None
+        self._history_options = history or HistoryOptions()
+        self._history: Optional[History] = None
+        if self._history_options.path:
+            self._history = History(self._history_options.path, writer=self._shard.index or 0,
+                                    forecast_hours=self._history_options.forecast_hours)
+        self._inline: InlineAnswers[List[InlineQueryResultArticle]] = InlineAnswers(inline)
+        self._snapshot_path = snapshot_path
+        self._snapshot: Optional[Snapshot] = None
+        self._stopped = asyncio.Event()
+        self._background: List[asyncio.Task] = []
         self._register_handlers()
+        self._register_metrics()
+
+    def _register_metrics(self) -> None:
+        api = self._weather_api
+        REGISTRY.gauge("weather_cache_hits_total", "Weather cache hits", lambda: api.hits, kind="counter")
+        REGISTRY.gauge("weather_cache_misses_total", "Weather cache misses", lambda: api.misses, kind="counter")
+        REGISTRY.gauge("weather_cache_hit_ratio", "Share of weather requests served from cache",
+                       lambda: api.hits / (api.hits + api.misses) if api.hits + api.misses else 0)
+        REGISTRY.gauge("weather_cache_stale_total", "Expired weather served while refreshing in background",
+                       lambda: api.stale, kind="counter")
+        REGISTRY.gauge("weather_prefetch_jobs", "Time and grid cell pairs refreshed before scheduled forecasts",
+                       lambda: len(self._prefetcher))
+        REGISTRY.gauge("weather_prefetch_total", "Weather refreshes before scheduled forecasts",
+                       lambda: self._prefetcher.prefetched, kind="counter")
+        REGISTRY.gauge("weather_prefetch_failed_total", "Failed weather refreshes before scheduled forecasts",
+                       lambda: self._prefetcher.failed, kind="counter")
+        REGISTRY.gauge("weather_cache_restored_total", "Grid cells restored from snapshot",
+                       lambda: api.restored, kind="counter")
+        REGISTRY.gauge("weather_cache_entries", "Grid cells in weather cache", lambda: len(api))
+        REGISTRY.gauge("weather_upstream_coalesced_total", "Upstream requests joined to an in-flight one",
+                       lambda: api.flight.coalesced, kind="counter")
+        REGISTRY.gauge("inline_answers_cached", "Inline query answers kept in memory", lambda: len(self._inline))
+        REGISTRY.gauge("inline_cache_hits_total", "Inline queries answered from cache", lambda: self._inline.hits,
+                       kind="counter")
+        REGISTRY.gauge("inline_cancelled_total", "Inline lookups cancelled by a newer query of the same user",
+                       lambda: self._inline.cancelled, kind="counter")
+        if self._history is not None:
+            history = self._history
+            REGISTRY.gauge("history_rows_appended_total", "Observation and forecast rows written to history",
+                           lambda: history.appended, kind="counter")
+        REGISTRY.gauge("sender_queue_depth", "Messages waiting to be sent", self._sender.qsize)
+        REGISTRY.gauge("sender_sent_total", "Messages sent to Telegram", lambda: self._sender.sent, kind="counter")
+        storage = self._dp.storage
+        REGISTRY.gauge("fsm_conversations", "Unfinished conversations kept in memory", lambda: len(storage))
+        REGISTRY.gauge("fsm_expired_total", "Conversations dropped after FSM_TTL", lambda: storage.expired,
+                       kind="counter")
+        REGISTRY.gauge("fsm_evicted_total", "Conversations pushed out of memory over FSM_CAPACITY",
+                       lambda: storage.evicted, kind="counter")
+        REGISTRY.gauge("alarm_subscribers", "Chats subscribed to bad weather alarms", lambda: len(self._alarms))
+        REGISTRY.gauge("alarm_cells", "Grid cells with alarm subscribers", lambda: self._alarms.cells)
+        REGISTRY.gauge("alarm_rules", "Distinct alarm rules evaluated per cycle", lambda: self._alarms.rules)
+        REGISTRY.gauge("alarm_fired_total", "Alarm rules that started to match", lambda: self._alarms.fired,
+                       kind="counter")
+        if self._webhook is not None:
+            REGISTRY.gauge("webhook_queue_depth", "Updates waiting to be processed", self._webhook.qsize)
+
+    def _keyboard(self, settings: ChatSettings) -> ReplyKeyboardMarkup:
+        if settings.alarm:
+            return self._reply_keyboard_turn_off_alarm
+        return self._reply_keyboard_turn_on_alarm
 
     @staticmethod
     def _format_weather(weather: WeatherPoint) -> str:
@@ -98,7 +242,8 @@ class Bot:
     def _format_forecast(forecast: Forecast) -> str:
         text = ""
         if forecast.part:
-            text += f"{day_part2text[forecast.part]}\n"
+            text += f"{day_part2text[forecast.part]}"
+            text += f", {forecast.time:%d.%m}\n" if forecast.time else "\n"
         else:
             raise NotImplemented
 
@@ -111,14 +256,18 @@ class Bot:
         return text
 
     @logit()
-    async def _set_command_list(self):
-        commands = [aiogram.types.BotCommand("/start", "Начать работу с ботом"),
-                    aiogram.types.BotCommand("/current", "Текущая погода"),
-                    aiogram.types.BotCommand("/forecast", "Прогноз"),
-                    aiogram.types.BotCommand("/alarm", "Включить/выключить предупреждение о плохой погоде"),
-                    aiogram.types.BotCommand("/settings", "Настройки"),
-                    ]
-        await self._bot.set_my_commands(commands)
+    async def _set_command_list(self) -> None:
+        """
+        Задаёт список команд, только если он изменился с прошлого запуска
+        """
+        fingerprint = hashlib.sha1(repr((self._bot.id, self._commands)).encode()).hexdigest()
+        if self._chats.get_meta("commands") == fingerprint:
+            logger.debug("Command list is up to date")
+            return
+        logger.info("Setting command list")
+        await self._bot.set_my_commands([aiogram.types.BotCommand(command, description)
+                                         for command, description in self._commands])
+        self._chats.set_meta("commands", fingerprint)
 
     @logit()
     def _register_handlers(self):
@@ -136,6 +285,8 @@ class Bot:
                                           lambda msg: msg.text == BotReplyAction.TurnOnAlarm.value)
         self._dp.register_message_handler(self._turn_off_alarm_handler,
                                           lambda msg: msg.text == BotReplyAction.TurnOffAlarm.value)
+        self._dp.register_message_handler(self._alarm_rules_handler, commands=["alarm"])
+        self._dp.register_message_handler(self._history_handler, commands=["history"])
 
         self._dp.register_message_handler(self._settings_handler,
                                           lambda msg: msg.text == BotReplyAction.Settings.value)
@@ -156,155 +307,513 @@ class Bot:
                                                  lambda cq: cq.data == BotSettingsAction.ChangeCoord.name)
         self._dp.register_message_handler(self._change_coordinates_handler,
                                           state=ChangeCoordiantesState.InputCoordinates)
+        self._dp.register_message_handler(self._location_handler, content_types=ContentType.LOCATION, state="*")
+
+        self._dp.register_inline_handler(self._inline_handler, state="*")
 
     @logit()
     async def _help_handler(self, msg: Message) -> None:
-        await msg.answer("HELP", reply_markup=self._current_keyboard)
+        self._sender.send(msg.chat.id, "HELP", reply_markup=self._keyboard(self._chats.get(msg.chat.id)))
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _start_handler(self, msg: Message) -> None:
         logger.trace(f"Handle /start: {msg}")
-        self._chat_id = msg.chat.id
+        self._chats.save(self._chats.get(msg.chat.id))
         await self._help_handler(msg)
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _current_handler(self, msg: Message) -> None:
-        api = WeatherFactory.create(WeatherAPIType.Yandex, self._weather_api_token)
-        weather = await api.current(self._coordinates)
-        await msg.answer(self._format_weather(weather))
+        coordinates = self._chats.get(msg.chat.id).coordinates
+        yesterday = ""
+        if self._history is None:
+            weather = await self._weather_api.current(coordinates)
+        else:
+            weather, yesterday = await asyncio.gather(self._weather_api.current(coordinates),
+                                                      self._yesterday(coordinates))
+        self._sender.send(msg.chat.id, self._format_weather(weather) + yesterday)
+
+    async def _yesterday(self, coordinates: Coordinates) -> str:
+        """
+        Сравнение со вчерашним днём для /current. Выборка из истории читает файлы, поэтому идёт в исполнителе,
+        а её ошибка не мешает ответить текущей погодой
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self._yesterday_text, coordinates)
+        except Exception:
+            logger.exception("Failed to read weather history")
+            return ""
+
+    def _yesterday_text(self, coordinates: Coordinates) -> str:
+        """
+        Сравнение последнего наблюдения с наблюдением сутки назад, если оба есть в истории
+        """
+        cell = cell_of(coordinates, self._grid_step)
+        now = time.time()
+        latest = self._history.scan(cell, now - 3 * HOUR, now + HOUR)
+        if not len(latest):
+            return ""
+        at = int(latest.time[-1]) - DAY
+        before = self._history.scan(cell, at - HOUR, at + HOUR)
+        if not len(before):
+            return ""
+        current, previous = float(latest.temperature[-1]), float(before.temperature[np.abs(before.time - at).argmin()])
+        return f"Вчера в это время: {previous:.0f}℃ ({current - previous:+.0f})\n"
+
+    def _history_text(self, coordinates: Coordinates, days: int) -> str:
+        cell = cell_of(coordinates, self._grid_step)
+        now = time.time()
+        if days == 1:
+            temperature = self._history.scan(cell, now - DAY, now).temperature
+            if not len(temperature):
+                return "Для этих координат история пока пуста"
+            return f"За сутки: от {temperature.min():.0f} до {temperature.max():.0f}℃, " \
+                   f"в среднем {temperature.mean():.0f}℃\n" + self._yesterday_text(coordinates)
+        # Сутки считаются по часовому поясу расписания
+        utc_offset = int(datetime.datetime.now(datetime.timezone.utc).astimezone(self._scheduler.tz)
+                         .utcoffset().total_seconds())
+        aggregate = self._history.aggregate(cell, now - days * DAY, now, step=DAY, utc_offset=utc_offset)
+        if not len(aggregate.time):
+            return "Для этих координат история пока пуста"
+        text = ""
+        for start, low, high, mean in zip(aggregate.time.tolist(), aggregate.min.tolist(), aggregate.max.tolist(),
+                                          aggregate.mean.tolist()):
+            day = datetime.datetime.fromtimestamp(start + utc_offset, datetime.timezone.utc)
+            text += f"{day:%d.%m}: от {low:.0f} до {high:.0f}℃, в среднем {mean:.0f}℃\n"
+        return text
 
-    @logit()
-    async def _forecast_handler(self, msg: Message) -> None:
-        api = WeatherFactory.create(WeatherAPIType.Yandex, self._weather_api_token)
-        forecasts = await api.forecast(self._coordinates)
+    @logit(metric="bot_handler")
+    async def _history_handler(self, msg: Message) -> None:
+        if self._history is None:
+            self._sender.send(msg.chat.id, "История погоды не ведётся")
+            return
+        args = msg.get_args()
+        days = 1
+        if args:
+            try:
+                days = int(args)
+            except ValueError:
+                days = 0
+            if not 1 <= days <= self.history_max_days:
+                self._sender.send(msg.chat.id, f"Укажите число дней от 1 до {self.history_max_days}. "
+                                               f"Пример: /history 7")
+                return
+        text = await asyncio.get_running_loop().run_in_executor(None, self._history_text,
+                                                                self._chats.get(msg.chat.id).coordinates, days)
+        self._sender.send(msg.chat.id, text)
+
+    async def _record_history(self) -> None:
+        fetched = self._weather_api.take_fetched()
+        await asyncio.get_running_loop().run_in_executor(None, self._history.append, fetched)
+
+    async def _compact_history(self) -> None:
+        written = await asyncio.get_running_loop().run_in_executor(None, self._history.compact)
+        if written:
+            logger.info(f"Compacted {written} history segments")
+
+    async def _forecast_text(self, coordinates: Coordinates, hours: Optional[int] = None) -> str:
+        """
+        Прогноз по частям суток на ближайшие hours часов
+        """
+        hourly = await self._weather_api.hourly(coordinates)
+        window = hourly.window(time.time(), hours or self._forecast_hours)
+        if not len(window):
+            return "Прогноз недоступен"
         text = ""
-        for forecast in forecasts:
+        for forecast in window.summary().forecasts():
             text += self._format_forecast(forecast)
             text += "\n"
-        aiogram.Bot.set_current(self._bot)
-        await msg.answer(text)
+        return text
 
-    @logit()
+    @logit(metric="bot_handler")
+    async def _forecast_handler(self, msg: Message) -> None:
+        args = msg.get_args() if msg.is_command() else ""
+        hours = None
+        if args:
+            try:
+                hours = int(args)
+            except ValueError:
+                hours = 0
+            if not 1 <= hours <= self._max_forecast_hours:
+                self._sender.send(msg.chat.id, f"Укажите число часов от 1 до {self._max_forecast_hours}. "
+                                               f"Пример: /forecast 48")
+                return
+        self._sender.send(msg.chat.id, await self._forecast_text(self._chats.get(msg.chat.id).coordinates, hours))
+
+    @logit(sample=0.01)
+    async def _send_forecast(self, chat_id: int) -> None:
+        text = await self._forecast_text(self._chats.get(chat_id).coordinates)
+        self._sender.send(chat_id, text, priority=Priority.Scheduled)
+
+    def _add_schedule_job(self, chat_id: int, t: datetime.time, coordinates: Coordinates,
+                          since: Optional[float] = None) -> None:
+        if (chat_id, t) not in self._schedule_jobs:
+            self._schedule_jobs[chat_id, t] = self._scheduler.daily(t, self._send_forecast, chat_id, since=since)
+        self._prefetcher.add((chat_id, t), t, coordinates)
+
+    async def _restore_jobs(self) -> None:
+        """
+        Восстанавливает расписания и оповещения после перезапуска. Идёт в фоне, пока бот уже отвечает,
+        поэтому повторное добавление задачи, которую чат успел создать сам, ничего не меняет
+        """
+        started = time.time()
+        # Отправки, время которых наступило, пока бот не работал или восстанавливал задачи, выполнятся
+        # с опозданием, если оно не больше misfire_grace планировщика
+        checked = self._chats.get_meta(self._checkpoint_key)
+        since = min(float(checked), started) if checked else started
+        restored = 0
+        for settings in self._chats.iter_active():
+            if not self._shard.owns(settings.chat_id):
+                continue
+            if settings.alarm:
+                self._subscribe_alarm(settings)
+            for t in settings.schedule_times():
+                self._add_schedule_job(settings.chat_id, t, settings.coordinates, since=since)
+            restored += 1
+            if restored % self.restore_batch == 0:
+                await asyncio.sleep(0)
+        # Остальные чаты из снимка с тех пор выключили оповещения
+        self._alarms.restore({})
+        # Пока задачи не восстановлены, сохранённый момент нельзя сдвигать: пропущенные отправки потерялись бы
+        self._checkpointing = True
+        self._scheduler.every(self.schedule_checkpoint, self._save_schedule_checkpoint)
+        logger.info(f"Restored jobs of {restored} chats in {time.time() - started:.2f}s")
+
+    @property
+    def _checkpoint_key(self) -> str:
+        # Чаты воркеров не пересекаются, поэтому и момент у каждого свой
+        return "schedule_checked" if self._shard.index is None else f"schedule_checked.{self._shard.index}"
+
+    async def _save_schedule_checkpoint(self) -> None:
+        checked = self._scheduler.checked
+        if checked is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._chats.set_meta, self._checkpoint_key,
+                                                             repr(checked))
+
+    def _subscribe_alarm(self, settings: ChatSettings) -> None:
+        rules = []
+        for text in settings.rules:
+            try:
+                rules.append(AlarmRule.parse(text))
+            except ValueError as e:
+                logger.error(f"Skipping alarm rule of chat {settings.chat_id}: {e}")
+        self._alarms.subscribe(settings.chat_id, settings.coordinates, rules)
+
+    @logit(metric="bot_handler")
     async def _turn_on_alarm_handler(self, msg: Message) -> None:
-        self._bad_weather_alarm = True
-        self._current_keyboard = self._reply_keyboard_turn_off_alarm
-        loop = asyncio.get_event_loop()
-        self._alarm_job = self._scheduler.every(5).seconds.do(
-            lambda x: asyncio.run_coroutine_threadsafe(x(), loop), self._try_bad_weather_alarm)
-        self._jobs = {"Alarm"}
-        await msg.answer("Оповещение включено", reply_markup=self._current_keyboard)
-
-    @logit()
+        settings = self._chats.get(msg.chat.id)
+        if not settings.alarm:
+            settings.alarm = True
+            self._chats.save(settings)
+            self._subscribe_alarm(settings)
+        self._sender.send(msg.chat.id, "Оповещение включено", reply_markup=self._keyboard(settings))
+
+    @logit(metric="bot_handler")
     async def _turn_off_alarm_handler(self, msg: Message) -> None:
-        self._bad_weather_alarm = False
-        self._scheduler.cancel_job(self._alarm_job)
-        self._current_keyboard = self._reply_keyboard_turn_on_alarm
-        await msg.answer("Оповещение отключено", reply_markup=self._current_keyboard)
+        settings = self._chats.get(msg.chat.id)
+        settings.alarm = False
+        self._chats.save(settings)
+        self._alarms.unsubscribe(settings.chat_id)
+        self._sender.send(msg.chat.id, "Оповещение отключено", reply_markup=self._keyboard(settings))
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _settings_handler(self, msg: Message) -> None:
-        await msg.answer("Настройки", reply_markup=self._inner_settings_keyboard)
+        self._sender.send(msg.chat.id, "Настройки", reply_markup=self._inner_settings_keyboard)
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _schedule_add_callback_handler(self, callback_query: CallbackQuery) -> None:
         await AddScheduleEntryState.next()
-        await self._bot.send_message(callback_query.from_user.id, "Введите время в формате часы:минуты (14:48)")
+        self._sender.send(callback_query.from_user.id, "Введите время в формате часы:минуты (14:48)")
         await callback_query.answer()
 
+    @logit(metric="bot_handler")
     async def _schedule_add_input_time_handler(self, msg: Message, state: FSMContext) -> None:
         await state.finish()
         try:
             hour, minute = (int(x.strip()) for x in msg.text.split(":"))
             t = datetime.time(hour, minute)
         except ValueError:
-            await msg.answer("Неверные формат данных")
+            self._sender.send(msg.chat.id, "Неверные формат данных")
             return
-        loop = asyncio.get_event_loop()
-        Message()
-        self._schedule_jobs[t] = self._scheduler.every().day.at(t.strftime("%H:%M")).do(
-            lambda x: asyncio.run_coroutine_threadsafe(x(msg), loop), self._forecast_handler
-        )
-        await msg.answer("Успешно добавлено")
+        settings = self._chats.get(msg.chat.id)
+        if settings.add_time(t):
+            self._chats.save(settings)
+            self._add_schedule_job(settings.chat_id, t, settings.coordinates)
+        self._sender.send(msg.chat.id, "Успешно добавлено")
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _schedule_del_callback_handler(self, callback_query: CallbackQuery) -> None:
         await DelScheduleEntryState.next()
-        await self._bot.send_message(callback_query.from_user.id, "Введите время в формате часы:минуты (14:48)")
+        self._sender.send(callback_query.from_user.id, "Введите время в формате часы:минуты (14:48)")
         await callback_query.answer()
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _schedule_del_input_time_handler(self, msg: Message, state: FSMContext) -> None:
         await state.finish()
         try:
             hour, minute = (int(x.strip()) for x in msg.text.split(":"))
             t = datetime.time(hour, minute)
         except ValueError:
-            await msg.answer("Неверные формат данных")
+            self._sender.send(msg.chat.id, "Неверные формат данных")
             return
-        job = self._schedule_jobs.get(t)
+        settings = self._chats.get(msg.chat.id)
+        if settings.remove_time(t):
+            self._chats.save(settings)
+        job = self._schedule_jobs.pop((settings.chat_id, t), None)
         if job:
-            self._scheduler.cancel_job(job)
-            del self._schedule_jobs[t]
+            self._scheduler.cancel(job)
+        self._prefetcher.remove((settings.chat_id, t))
 
     @logit()
-    def _build_schedule_keyboard(self) -> InlineKeyboardMarkup:
+    def _build_schedule_keyboard(self, settings: ChatSettings) -> InlineKeyboardMarkup:
         schedule_markup = InlineKeyboardMarkup()
-        for time in sorted(self._schedule_jobs.keys()):
+        for time in settings.schedule_times():
             schedule_markup.row(InlineKeyboardButton(time.strftime("%H:%M"), callback_data=time.strftime("%H:%M")))
         return schedule_markup
 
-    @logit()
+    @logit(metric="bot_handler")
     async def _schedule_callback_handler(self, callback_query: CallbackQuery) -> None:
-        schedule_markup = self._build_schedule_keyboard()
+        schedule_markup = self._build_schedule_keyboard(self._chats.get(callback_query.message.chat.id))
         schedule_markup.row(InlineKeyboardButton(BotScheduleAction.Add.value, callback_data=BotScheduleAction.Add.name))
         schedule_markup.row(InlineKeyboardButton(BotScheduleAction.Del.value, callback_data=BotScheduleAction.Del.name))
-        await self._bot.send_message(callback_query.from_user.id, "Расписание", reply_markup=schedule_markup)
+        self._sender.send(callback_query.from_user.id, "Расписание", reply_markup=schedule_markup)
         await callback_query.answer()
 
-    @logit()
-    async def _try_bad_weather_alarm(self):
-        bad, forecast = await self._is_bad_weather()
-        if bad:
-            await self._bot.send_message(self._chat_id, "Ожидается плохая погода")
-            await self._bot.send_message(self._chat_id, self._format_forecast(forecast))
-
-    @logit()
-    async def _is_bad_weather(self) -> Tuple[bool, Optional[Forecast]]:
-        api = WeatherFactory.create(WeatherAPIType.Yandex, self._weather_api_token)
-        forecasts = await api.forecast(self._coordinates)
-        for forecast in forecasts:
-            if forecast.condition not in (WeatherCondition.Clear, WeatherCondition.Clouds):
-                return True, forecast
-        return False, None
-
-    @logit()
+    @logit(metric="bot_handler")
+    async def _alarm_rules_handler(self, msg: Message) -> None:
+        args = msg.get_args().strip()
+        settings = self._chats.get(msg.chat.id)
+        if args.lower().startswith(("del", "удалить")):
+            try:
+                index = int(args.split()[1]) - 1
+                rules = list(settings.rules)
+                rules.pop(index)
+            except (ValueError, IndexError):
+                self._sender.send(msg.chat.id, "Укажите номер правила. Пример: /alarm del 1")
+                return
+            settings.rules = tuple(rules)
+        elif args:
+            try:
+                rule = AlarmRule.parse(args)
+            except ValueError:
+                self._sender.send(msg.chat.id, "Не удалось разобрать правило. "
+                                               "Пример: /alarm снег t<-10 ветер>15 7-22")
+                return
+            if str(rule) not in settings.rules:
+                settings.rules += (str(rule),)
+            settings.alarm = True
+        else:
+            rules = "\n".join(f"{i}. {rule}" for i, rule in enumerate(settings.rules, 1)) \
+                or f"{BAD_WEATHER} (по умолчанию)"
+            self._sender.send(msg.chat.id, f"Правила оповещения:\n{rules}\n\n"
+                                           f"Добавить: /alarm снег t<-10 ветер>15 7-22\nУдалить: /alarm del 1",
+                              reply_markup=self._keyboard(settings))
+            return
+        self._chats.save(settings)
+        if settings.alarm:
+            self._subscribe_alarm(settings)
+        self._sender.send(msg.chat.id, "Правила оповещения изменены", reply_markup=self._keyboard(settings))
+
+    @logit(sample=0.01)
+    async def _try_bad_weather_alarm(self, chat_ids: List[int], rule: AlarmRule, matched: HourlyForecast):
+        # Отрезок, на котором выполняется правило, сводится в одну запись, текст один на все чаты
+        forecast = matched.summary(np.zeros(1, dtype=np.intp)).forecasts()[0]
+        end = forecast.time + datetime.timedelta(hours=len(matched))
+        title = "Ожидается плохая погода" if rule == BAD_WEATHER else f"Сработало правило «{rule}»"
+        text = f"{title} с {forecast.time:%H:%M} до {end:%H:%M}\n\n{self._format_forecast(forecast)}"
+        for chat_id in chat_ids:
+            self._sender.send(chat_id, text, priority=Priority.Alarm)
+
+    @logit(metric="bot_handler")
     async def _change_coordinates_callback_handler(self, callback_query: CallbackQuery) -> None:
         await ChangeCoordiantesState.next()
-        await self._bot.send_message(callback_query.from_user.id, "Введите координаты. Пример: 55.833333 37.616667")
+        self._sender.send(callback_query.from_user.id, "Введите координаты или название города. "
+                                                       "Пример: 55.833333 37.616667 или Москва. "
+                                                       "Можно просто отправить геопозицию")
         await callback_query.answer()
 
-    @logit()
+    def _set_coordinates(self, chat_id: int, coordinates: Coordinates) -> None:
+        settings = self._chats.get(chat_id)
+        settings.coordinates = coordinates
+        self._chats.save(settings)
+        if settings.alarm:
+            self._subscribe_alarm(settings)
+        for t in settings.schedule_times():
+            self._prefetcher.add((settings.chat_id, t), t, settings.coordinates)
+
+    @staticmethod
+    def _place_text(coordinates: Coordinates) -> str:
+        place = default_gazetteer().nearest(coordinates, max_distance_km=50)
+        return f" ({place.name})" if place is not None else ""
+
+    @logit(metric="bot_handler")
     async def _change_coordinates_handler(self, msg: Message, state: FSMContext) -> None:
         await state.finish()
         try:
-            lat, lon = (float(x) for x in msg.text.split())
-        except (IndexError, ValueError):
-            await msg.answer("Неверный формат данных")
+            lat, lon = msg.text.split()
+            coordinates = Coordinates(lat=lat, lon=lon)
+        except ValueError:
+            coordinates = await self._weather_api.coords_by_city(msg.text)
+        if coordinates is None:
+            self._sender.send(msg.chat.id, "Неверный формат данных или неизвестный город")
+            return
+        self._set_coordinates(msg.chat.id, coordinates)
+        self._sender.send(msg.chat.id, "Успешно изменено" + self._place_text(coordinates))
+
+    @logit(metric="bot_handler")
+    async def _location_handler(self, msg: Message, state: FSMContext) -> None:
+        await state.finish()
+        coordinates = Coordinates(lat=msg.location.latitude, lon=msg.location.longitude)
+        self._set_coordinates(msg.chat.id, coordinates)
+        self._sender.send(msg.chat.id, "Координаты изменены" + self._place_text(coordinates))
+
+    async def _inline_results(self, places: Sequence[Place]) -> List[InlineQueryResultArticle]:
+        """
+        Карточки текущей погоды и прогноза для каждого места
+        """
+        weather = await asyncio.gather(*(self._weather_api.current(place.coordinates) for place in places))
+        forecasts = await asyncio.gather(*(self._forecast_text(place.coordinates) for place in places))
+        results = []
+        for place, current, forecast in zip(places, weather, forecasts):
+            key = f"{place.coordinates.lat:.4f},{place.coordinates.lon:.4f}"
+            results.append(InlineQueryResultArticle(
+                id=f"c{key}", title=f"{place.name}: {current.temperature}℃",
+                description=weather_condition2text[current.condition],
+                input_message_content=InputTextMessageContent(f"{place.name}\n{self._format_weather(current)}")))
+            results.append(InlineQueryResultArticle(
+                id=f"f{key}", title=f"{place.name}: прогноз", description=f"На {self._forecast_hours} ч",
+                input_message_content=InputTextMessageContent(f"{place.name}\n{forecast}")))
+        return results
+
+    def _inline_places(self, key: str, user_id: int) -> List[Place]:
+        if key:
+            return default_gazetteer().search(key, limit=self._inline.options.places)
+        # Пустой запрос - погода в координатах из настроек пользователя
+        coordinates = self._chats.get(user_id).coordinates
+        place = default_gazetteer().nearest(coordinates, max_distance_km=50)
+        return [Place(place.name if place is not None else "Ваши координаты", coordinates, 0)]
+
+    @logit(metric="bot_handler")
+    async def _inline_handler(self, query: InlineQuery) -> None:
+        key = normalize(query.query)
+        results = self._inline.get(key) if key else None
+        if results is None:
+            # Разные начала названия часто находят одни и те же города, тогда и карточки у них общие
+            places = self._inline_places(key, query.from_user.id)
+            places_key = tuple((place.name, place.coordinates.lat, place.coordinates.lon) for place in places)
+            results = self._inline.get(places_key)
+            if results is None:
+                results = await self._inline.latest(query.from_user.id, places_key,
+                                                  lambda: self._inline_results(places))
+                if results is None:
+                    # Пользователь уже набрал следующий запрос
+                    return
+                self._inline.put(places_key, results)
+            if key:
+                self._inline.put(key, results)
+        await query.answer(results, cache_time=self._inline.options.cache_time, is_personal=not key)
+
+    def _run_in_background(self, coro: Awaitable, what: str) -> None:
+        async def run():
+            try:
+                await coro
+            except Exception:
+                logger.exception(f"Failed to {what}")
+
+        self._background.append(asyncio.create_task(run()))
+
+    def _open_snapshot(self) -> None:
+        if not self._snapshot_path or not os.path.exists(self._snapshot_path):
+            return
+        try:
+            self._snapshot = Snapshot(self._snapshot_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring snapshot {self._snapshot_path}: {e}")
             return
-        self._coordinates = Coordinates(lat=lat, lon=lon)
-        await msg.answer("Успешно изменено")
+        self._weather_api.warm(self._snapshot)
+        if self._snapshot.age < self.snapshot_max_age:
+            try:
+                self._alarms.restore(self._snapshot.alarms())
+            except Exception:
+                logger.exception(f"Failed to restore alarms from snapshot {self._snapshot_path}")
+        logger.info(f"Opened snapshot of {len(self._snapshot)} weather cells, {self._snapshot.age:.0f}s old")
+
+    def _save_snapshot(self) -> None:
+        started = time.time()
+        try:
+            size = write_snapshot(self._snapshot_path, self._weather_api.decoded(), self._alarms.notified())
+        except Exception:
+            logger.exception(f"Failed to save snapshot {self._snapshot_path}")
+        else:
+            logger.info(f"Saved snapshot of {size} bytes in {time.time() - started:.2f}s")
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
 
     @logit()
     async def start(self) -> None:
-        logger.info("Setting command list")
-        await self._set_command_list()
-        logger.info("Skipping updates")
-        await self._dp.skip_updates()
-        logger.info("Starting telegram bot")
-        await self._dp.start_polling()
+        await self._chats.start()
+        await self._weather_api.open()
+        self._open_snapshot()
+        if self._history is not None:
+            # Первый вызов включает запоминание ответов провайдера
+            self._weather_api.take_fetched()
+            self._scheduler.every(self._history_options.interval, self._record_history)
+            if not self._shard.index:
+                # Сжимает историю один процесс, файлы часов остальных он забирает сам
+                self._scheduler.every(HOUR, self._compact_history, first=time.time() + 60)
+        self._sender.start()
+        # Бот начинает принимать обновления сразу, задачи чатов и список команд догоняют в фоне
+        self._run_in_background(self._restore_jobs(), "restore jobs")
+        if not self._shard.index:
+            # Команды одни на весь бот, из воркеров их задаёт первый
+            self._run_in_background(self._set_command_list(), "set command list")
+        if self._shard.index is not None:
+            logger.info(f"Starting worker {self._shard.index}")
+            await self._webhook.start()
+            await self._stopped.wait()
+        elif self._webhook is not None:
+            logger.info("Setting webhook")
+            await self._bot.set_webhook(self._webhook_options.url, secret_token=self._webhook_options.secret,
+                                        drop_pending_updates=True)
+            await self._webhook.start()
+            logger.info("Starting telegram bot")
+            await self._stopped.wait()
+        else:
+            logger.info("Skipping updates")
+            await self._dp.skip_updates()
+            logger.info("Starting telegram bot")
+            # skip_updates уже удалил webhook
+            await self._dp.start_polling(reset_webhook=False)
 
     def stop(self) -> None:
-        self._dp.stop_polling()
+        if self._webhook is not None:
+            self._stopped.set()
+        else:
+            self._dp.stop_polling()
 
     async def close(self) -> None:
-        await self._dp.wait_closed()
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+        if self._webhook is not None:
+            await self._webhook.stop()
+        else:
+            # Без polling'а dispatcher не закрывается, и wait_closed ждал бы вечно
+            await self._dp.wait_closed()
+        await self._dp.storage.close()
+        await self._sender.stop()
+        await self._inline.close()
+        if self._history is not None:
+            try:
+                self._history.append(self._weather_api.take_fetched())
+            except Exception:
+                logger.exception("Failed to record weather history")
+            self._history.close()
+        if self._snapshot_path:
+            self._save_snapshot()
+        await WeatherFactory.close_all()
+        if self._checkpointing:
+            await self._save_schedule_checkpoint()
+        await self._chats.close()
+        await (await self._bot.get_session()).close()
@@ -0,0 +1,240 @@
+import asyncio
+import datetime
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from fast_weather_bot.entity import Coordinates
+
+
+class ChatSettings:
+    """
+    Настройки одного чата. Расписание хранится как отсортированный массив минут от начала суток,
+    правила оповещения - как их текст
+    """
+    __slots__ = ("chat_id", "lat", "lon", "alarm", "schedule", "rules")
+
+    def __init__(self, chat_id: int, lat: float, lon: float, alarm: bool = False,
+                 schedule: Optional[array] = None, rules: Tuple[str, ...] = ()):
+        self.chat_id = chat_id
+        self.lat = lat
+        self.lon = lon
+        self.alarm = alarm
+        self.schedule = schedule if schedule is not None else array("H")
+        self.rules = rules
+
+    @property
+    def coordinates(self) -> Coordinates:
+        return Coordinates.construct(lat=self.lat, lon=self.lon)
+
+    @coordinates.setter
+    def coordinates(self, coordinates: Coordinates) -> None:
+        self.lat = coordinates.lat
+        self.lon = coordinates.lon
+
+    def schedule_times(self) -> List[datetime.time]:
+        return [datetime.time(minute // 60, minute % 60) for minute in self.schedule]
+
+    def add_time(self, t: datetime.time) -> bool:
+        minute = t.hour * 60 + t.minute
+        if minute in self.schedule:
+            return False
+        self.schedule.append(minute)
+        self.schedule = array("H", sorted(self.schedule))
+        return True
+
+    def remove_time(self, t: datetime.time) -> bool:
+        minute = t.hour * 60 + t.minute
+        if minute not in self.schedule:
+            return False
+        self.schedule.remove(minute)
+        return True
+
+
+class ChatStore:
+    """
+    Хранилище настроек чатов. Недавно использованные записи держатся в памяти (LRU),
+    остальные читаются из SQLite по требованию. Изменения пишутся в базу пачками в фоне.
+    Чтение идёт через отдельное соединение: в режиме WAL оно не ждёт, пока фоновая запись зафиксирует пачку
+    """
+
+    def __init__(self, path: str, default_coordinates: Coordinates,
+                 cache_size: int = 100000,
+                 flush_interval: float = 1.0,
+                 batch_size: int = 500,
+                 ):
+        self._path = path
+        self._default = default_coordinates
+        self._cache_size = cache_size
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._cache: "OrderedDict[int, ChatSettings]" = OrderedDict()
+        self._dirty: Dict[int, ChatSettings] = {}
+        self._flushing: Dict[int, ChatSettings] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        # Соединение записи общее у цикла событий и потока исполнителя
+        self._lock = threading.Lock()
+        self._flush_needed: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Запись пачки в потоке исполнителя, которую не прерывает отмена flush
+        self._writing: Optional[asyncio.Future] = None
+
+    def open(self) -> None:
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chats ("
+                               "chat_id INTEGER PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL, "
+                               "alarm INTEGER NOT NULL DEFAULT 0, schedule BLOB, rules TEXT)")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chats)")}
+            if "rules" not in columns:
+                self._conn.execute("ALTER TABLE chats ADD COLUMN rules TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chats_active ON chats(chat_id) "
+                               "WHERE alarm = 1 OR schedule IS NOT NULL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+        self._reader = sqlite3.connect(self._path, check_same_thread=False)
+        self._reader.execute("PRAGMA query_only=1")
+
+    async def start(self) -> None:
+        """
+        Открывает базу и запускает фоновую запись изменений
+        """
+        if self._conn is None:
+            self.open()
+        self._flush_needed = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._writing is not None:
+            # Отмена прервала только ожидание, соединение закрываем после того, как поток допишет пачку
+            try:
+                await self._writing
+            except sqlite3.Error as e:
+                logger.error(f"Failed to flush chat settings: {e}")
+            self._writing = None
+        await self.flush()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _from_row(row) -> ChatSettings:
+        chat_id, lat, lon, alarm, schedule, rules = row
+        return ChatSettings(chat_id, lat, lon, bool(alarm), array("H", schedule) if schedule else None,
+                            tuple(rules.split("\n")) if rules else ())
+
+    def _remember(self, settings: ChatSettings) -> None:
+        self._cache[settings.chat_id] = settings
+        self._cache.move_to_end(settings.chat_id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, chat_id: int) -> ChatSettings:
+        """
+        Настройки чата. Для нового чата возвращаются настройки по умолчанию, в базу они попадут после save
+        """
+        settings = self._cache.get(chat_id)
+        if settings is not None:
+            self._cache.move_to_end(chat_id)
+            return settings
+        settings = self._dirty.get(chat_id) or self._flushing.get(chat_id)
+        if settings is None:
+            row = self._reader.execute("SELECT chat_id, lat, lon, alarm, schedule, rules FROM chats "
+                                       "WHERE chat_id = ?",
+                                       (chat_id,)).fetchone()
+            if row is not None:
+                settings = self._from_row(row)
+            else:
+                settings = ChatSettings(chat_id, self._default.lat, self._default.lon)
+        self._remember(settings)
+        return settings
+
+    def save(self, settings: ChatSettings) -> None:
+        self._dirty[settings.chat_id] = settings
+        self._remember(settings)
+        if len(self._dirty) >= self._batch_size and self._flush_needed is not None:
+            self._flush_needed.set()
+
+    def iter_active(self) -> Iterator[ChatSettings]:
+        """
+        Чаты с включённым оповещением или непустым расписанием. Нужны, чтобы восстановить задачи после перезапуска
+        """
+        rows = self._reader.execute("SELECT chat_id, lat, lon, alarm, schedule, rules FROM chats "
+                                    "WHERE alarm = 1 OR schedule IS NOT NULL").fetchall()
+        seen = set()
+        for row in rows:
+            settings = self._dirty.get(row[0]) or self._cache.get(row[0]) or self._from_row(row)
+            seen.add(settings.chat_id)
+            if settings.alarm or settings.schedule:
+                yield settings
+        for settings in list(self._dirty.values()):
+            if settings.chat_id not in seen and (settings.alarm or settings.schedule):
+                yield settings
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """
+        Служебное значение бота, например отпечаток списка команд
+        """
+        row = self._reader.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def _write(self, rows: List[tuple]) -> None:
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chats (chat_id, lat, lon, alarm, schedule, rules) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    async def flush(self) -> None:
+        if not self._dirty or self._conn is None:
+            return
+        self._flushing = self._dirty
+        self._dirty = {}
+        records = list(self._flushing.values())
+        rows = [(s.chat_id, s.lat, s.lon, int(s.alarm), s.schedule.tobytes() if s.schedule else None,
+                 "\n".join(s.rules) or None) for s in records]
+        self._writing = asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+        try:
+            await asyncio.shield(self._writing)
+        except BaseException:
+            # При отмене пачка может быть ещё не записана: повторная запись той же строки ничего не портит
+            for settings in records:
+                self._dirty.setdefault(settings.chat_id, settings)
+            raise
+        finally:
+            if self._writing.done():
+                self._writing = None
+            self._flushing = {}
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to flush chat settings: {e}")
@@ -1,7 +1,26 @@
+import datetime
 import os
+import secrets
 from dataclasses import dataclass
+from typing import Optional, Dict, Tuple
+from zoneinfo import ZoneInfo
 
 from fast_weather_bot.entity import Coordinates
+# Настройки берутся из модуля без тяжёлых зависимостей: конфиг читается до того, как нужны сами компоненты
+from fast_weather_bot.options import CacheOptions, HedgeOptions, HistoryOptions, HTTPOptions, InlineOptions, \
+    PrefetchOptions, ShardOptions, StorageOptions, WebhookOptions
+
+
+def _parse_levels(spec: Optional[str]) -> Dict[str, str]:
+    """
+    Разбирает строку вида "fast_weather_bot.bot=DEBUG,weather_api=TRACE"
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            module, level = item.split("=", 1)
+            levels[module.strip()] = level.strip().upper()
+    return levels
 
 
 @dataclass
@@ -9,6 +28,33 @@ class Config:
     telegram_token: str
     weather_api_token: str
     coordinates: Coordinates
+    weather_cache: CacheOptions
+    weather_http: HTTPOptions
+    weather_fallback: Tuple[str, ...]  # Имена WeatherAPIType запасных провайдеров
+    weather_hedge: HedgeOptions
+    prefetch: PrefetchOptions
+    db_path: str
+    fsm: StorageOptions
+    timezone: Optional[datetime.tzinfo]
+    alarm_interval: float
+    alarm_horizon: float
+    weather_rate: str
+    weather_api_url: Optional[str]
+    forecast_days: int
+    forecast_hours: int
+    telegram_api_url: Optional[str]
+    send_rate: float
+    chat_send_interval: float
+    webhook: Optional[WebhookOptions]  # None - получать обновления long polling'ом
+    log_level: str
+    log_levels: Dict[str, str]
+    log_json: bool
+    metrics_host: str
+    metrics_port: int  # 0 - не отдавать метрики
+    shard: ShardOptions
+    inline: InlineOptions
+    history: HistoryOptions
+    snapshot_path: Optional[str]  # None - не сохранять кэш погоды и состояние оповещений при остановке
 
     @staticmethod
     def load() -> "Config":
@@ -18,8 +64,87 @@ class Config:
         """
 
         lat, lon = (float(x) for x in os.getenv("COORDINATES").split())
+        webhook = None
+        if os.getenv("BOT_MODE", "polling") == "webhook":
+            webhook = WebhookOptions(
+                url=os.environ["WEBHOOK_URL"],
+                secret=os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32),
+                host=os.getenv("WEBHOOK_HOST", WebhookOptions.host),
+                port=int(os.getenv("WEBHOOK_PORT", WebhookOptions.port)),
+                path=os.getenv("WEBHOOK_PATH", WebhookOptions.path),
+                queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", WebhookOptions.queue_size)),
+                workers=int(os.getenv("WEBHOOK_WORKERS", WebhookOptions.workers)),
+            )
+        workers = int(os.getenv("WORKERS", ShardOptions.workers))
         return Config(
             telegram_token=os.getenv("TELEGRAM_TOKEN"),
             weather_api_token=os.getenv("YANDEX_KEY"),
-            coordinates=Coordinates(lat=lat, lon=lon)
+            coordinates=Coordinates(lat=lat, lon=lon),
+            weather_cache=CacheOptions(
+                grid_step=float(os.getenv("WEATHER_CACHE_GRID", CacheOptions.grid_step)),
+                current_ttl=float(os.getenv("WEATHER_CACHE_CURRENT_TTL", CacheOptions.current_ttl)),
+                forecast_ttl=float(os.getenv("WEATHER_CACHE_FORECAST_TTL", CacheOptions.forecast_ttl)),
+                max_size=int(os.getenv("WEATHER_CACHE_SIZE", CacheOptions.max_size)),
+                stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL", CacheOptions.stale_ttl)),
+                shared_path=os.getenv("WEATHER_SHARED_CACHE") or ("weather_cache.sqlite3" if workers > 1 else None),
+            ),
+            weather_http=HTTPOptions(
+                limit=int(os.getenv("WEATHER_HTTP_LIMIT", HTTPOptions.limit)),
+                limit_per_host=int(os.getenv("WEATHER_HTTP_LIMIT_PER_HOST", HTTPOptions.limit_per_host)),
+                keepalive_timeout=float(os.getenv("WEATHER_HTTP_KEEPALIVE", HTTPOptions.keepalive_timeout)),
+                dns_cache_ttl=int(os.getenv("WEATHER_HTTP_DNS_TTL", HTTPOptions.dns_cache_ttl)),
+                timeout=float(os.getenv("WEATHER_HTTP_TIMEOUT", HTTPOptions.timeout)),
+                connect_timeout=float(os.getenv("WEATHER_HTTP_CONNECT_TIMEOUT", HTTPOptions.connect_timeout)),
+            ),
+            weather_fallback=tuple(name.strip() for name in os.getenv("WEATHER_FALLBACK", "").split(",")
+                                   if name.strip()),
+            weather_hedge=HedgeOptions(
+                quantile=float(os.getenv("WEATHER_HEDGE_QUANTILE", HedgeOptions.quantile)),
+                min_delay=float(os.getenv("WEATHER_HEDGE_MIN_DELAY", HedgeOptions.min_delay)),
+                failures=int(os.getenv("WEATHER_BREAKER_FAILURES", HedgeOptions.failures)),
+                reset_timeout=float(os.getenv("WEATHER_BREAKER_RESET", HedgeOptions.reset_timeout)),
+            ),
+            prefetch=PrefetchOptions(
+                lead=float(os.getenv("PREFETCH_LEAD", PrefetchOptions.lead)),
+                jitter=float(os.getenv("PREFETCH_JITTER", PrefetchOptions.jitter)),
+            ),
+            db_path=os.getenv("DB_PATH", "weather_bot.sqlite3"),
+            fsm=StorageOptions(
+                ttl=float(os.getenv("FSM_TTL", StorageOptions.ttl)),
+                capacity=int(os.getenv("FSM_CAPACITY", StorageOptions.capacity)),
+                path=os.getenv("FSM_PATH") or None,
+            ),
+            alarm_interval=float(os.getenv("ALARM_INTERVAL", 5)),
+            alarm_horizon=float(os.getenv("ALARM_HORIZON", 12)),
+            weather_rate=os.getenv("YANDEX_RATE", "informers"),
+            weather_api_url=os.getenv("YANDEX_API_URL"),
+            forecast_days=int(os.getenv("FORECAST_DAYS", 3)),
+            forecast_hours=int(os.getenv("FORECAST_HOURS", 24)),
+            telegram_api_url=os.getenv("TELEGRAM_API_URL"),
+            send_rate=float(os.getenv("TELEGRAM_SEND_RATE", 30)),
+            chat_send_interval=float(os.getenv("TELEGRAM_CHAT_INTERVAL", 1)),
+            webhook=webhook,
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            log_levels=_parse_levels(os.getenv("LOG_LEVELS")),
+            log_json=os.getenv("LOG_JSON", "") not in ("", "0", "false"),
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            metrics_port=int(os.getenv("METRICS_PORT", 0)),
+            timezone=ZoneInfo(os.environ["TIMEZONE"]) if os.getenv("TIMEZONE") else None,
+            shard=ShardOptions(
+                workers=workers,
+                socket_dir=os.getenv("WORKER_SOCKET_DIR", ShardOptions.socket_dir),
+                queue_size=int(os.getenv("WORKER_QUEUE_SIZE", ShardOptions.queue_size)),
+            ),
+            inline=InlineOptions(
+                cache_time=int(os.getenv("INLINE_CACHE_TIME", InlineOptions.cache_time)),
+                ttl=float(os.getenv("INLINE_TTL", InlineOptions.ttl)),
+                debounce=float(os.getenv("INLINE_DEBOUNCE", InlineOptions.debounce)),
+                places=int(os.getenv("INLINE_PLACES", InlineOptions.places)),
+            ),
+            history=HistoryOptions(
+                path=os.getenv("HISTORY_PATH") or None,
+                interval=float(os.getenv("HISTORY_INTERVAL", HistoryOptions.interval)),
+                forecast_hours=int(os.getenv("HISTORY_FORECAST_HOURS", HistoryOptions.forecast_hours)),
+            ),
+            snapshot_path=os.getenv("SNAPSHOT_PATH") or None,
         )
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Бот импортирует log и symbols напрямую, остальные модули - как fast_weather_bot.*
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+if PACKAGE not in sys.path:
+    sys.path.insert(0, PACKAGE)
@@ -1,13 +1,186 @@
 import datetime
+import linecache
+import math
 from enum import Enum, auto
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple, Type, TypeVar
 
-from pydantic import BaseModel
+Converter = Callable[[Any], Any]
+E = TypeVar("E", bound="_Entity")
 
 
-class Coordinates(BaseModel):
-    lat: float  # широта
-    lon: float  # долгота
+class _Entity:
+    """
+    Неизменяемая запись со слотами. Конструктор проверяет и приводит поля - для данных извне.
+    construct создаёт запись без проверок - для данных, которые собирает сам бот.
+    Хэш считается один раз, поэтому записи можно использовать как ключи кэша
+    """
+    __slots__ = ("_hash",)
+
+    # Имя поля -> функция, которая проверяет и приводит значение
+    _converters: Dict[str, Converter] = {}
+    # Значения необязательных полей по умолчанию
+    _defaults: Dict[str, Any] = {}
+    _fields: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(cls._converters)
+        cls.construct = classmethod(_make_construct(cls))
+
+    def __init__(self, **values):
+        unknown = values.keys() - self._converters.keys()
+        if unknown:
+            raise TypeError(f"{type(self).__name__}: unknown fields {', '.join(sorted(unknown))}")
+        for name, convert in self._converters.items():
+            if name in values:
+                value = convert(values[name])
+            elif name in self._defaults:
+                value = self._defaults[name]
+            else:
+                raise ValueError(f"{type(self).__name__}.{name}: field required")
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_hash", None)
+
+    @classmethod
+    def construct(cls: Type[E], **values: Any) -> E:
+        """
+        Создаёт запись без проверки полей. Наследники получают ту же функцию, собранную под их поля без цикла
+        и словаря, см. _make_construct
+        """
+        unknown = values.keys() - cls._converters.keys()
+        if unknown:
+            raise TypeError(f"{cls.__name__}: unknown fields {', '.join(sorted(unknown))}")
+        self = object.__new__(cls)
+        for name in cls._fields:
+            if name in values:
+                value = values[name]
+            elif name in cls._defaults:
+                value = cls._defaults[name]
+            else:
+                raise TypeError(f"{cls.__name__}.construct: missing field {name}")
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_hash", None)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = hash(self._values())
+            object.__setattr__(self, "_hash", h)
+        return h
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        return _restore, (type(self), {name: getattr(self, name) for name in self._fields})
+
+
+def _restore(cls, values):
+    return cls.construct(**values)
+
+
+def _make_construct(cls) -> Callable:
+    """
+    Собирает construct с явными именованными параметрами: поля пишутся напрямую через дескрипторы слотов,
+    в обход запрещающего __setattr__. Так создание записи стоит примерно как у обычного класса
+    """
+    namespace = {"new": object.__new__, "set__hash": cls._hash.__set__}
+    params = []
+    body = []
+    for name in cls._fields:
+        namespace[f"set_{name}"] = getattr(cls, name).__set__
+        params.append(f"{name}=_defaults[{name!r}]" if name in cls._defaults else name)
+        body.append(f"    set_{name}(self, {name})\n")
+    namespace["_defaults"] = cls._defaults
+    # Параметры без значений по умолчанию идут первыми, поэтому все они только именованные
+    source = (f"def construct(cls, *, {', '.join(params)}):\n"
+              f"    self = new(cls)\n"
+              + "".join(body) +
+              f"    set__hash(self, None)\n"
+              f"    return self\n")
+    # Исходник кладётся в linecache, чтобы его показывали inspect.getsource и трассировки
+    filename = f"<{cls.__module__}.{cls.__qualname__}.construct>"
+    exec(compile(source, filename, "exec"), namespace)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    construct = namespace["construct"]
+    construct.__qualname__ = f"{cls.__qualname__}.construct"
+    construct.__doc__ = _Entity.construct.__doc__
+    return construct
+
+
+def _number(type_: type) -> Converter:
+    def convert(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"expected {type_.__name__}, got {value!r}")
+        if type_ is int and isinstance(value, int):
+            return value
+        result = float(value)
+        if not math.isfinite(result):
+            raise ValueError(f"expected finite number, got {value!r}")
+        if type_ is int:
+            if not result.is_integer():
+                raise ValueError(f"expected int, got {value!r}")
+            return int(result)
+        return result
+
+    return convert
+
+
+def _bounded(convert: Converter, low: float, high: float) -> Converter:
+    def check(value):
+        value = convert(value)
+        if not low <= value <= high:
+            raise ValueError(f"{value} is out of range [{low}, {high}]")
+        return value
+
+    return check
+
+
+def _instance(type_: type) -> Converter:
+    def check(value):
+        if not isinstance(value, type_):
+            raise ValueError(f"expected {type_.__name__}, got {value!r}")
+        return value
+
+    return check
+
+
+def _optional(convert: Converter) -> Converter:
+    def check(value):
+        return None if value is None else convert(value)
+
+    return check
+
+
+_int = _number(int)
+_float = _number(float)
+
+
+class Coordinates(_Entity):
+    __slots__ = ("lat", "lon")
+    _converters = {
+        "lat": _bounded(_float, -90, 90),  # широта
+        "lon": _bounded(_float, -180, 180),  # долгота
+    }
+
+    lat: float
+    lon: float
 
 
 class WeatherCondition(Enum):
@@ -28,16 +201,28 @@ class WindDirection(Enum):
     S = auto()
     SW = auto()
     W = auto()
+    C = auto()  # Штиль
 
 
-class WeatherPoint(BaseModel):
-    time: datetime.datetime  # Время измерения
-    temperature: int  # Температура в градусах Цельсия
-    pressure: int  # Давление в мм ртутного столба
-    condition: WeatherCondition  # Состояние погоды
-    wind_speed: float  # Скорость ветра (м/с)
-    wind_direction: WindDirection  # Направление ветра
-    humidity: int  # Относительная влажность  (%)
+class WeatherPoint(_Entity):
+    __slots__ = ("time", "temperature", "pressure", "condition", "wind_speed", "wind_direction", "humidity")
+    _converters = {
+        "time": _instance(datetime.datetime),  # Время измерения
+        "temperature": _int,  # Температура в градусах Цельсия
+        "pressure": _int,  # Давление в мм ртутного столба
+        "condition": _instance(WeatherCondition),  # Состояние погоды
+        "wind_speed": _float,  # Скорость ветра (м/с)
+        "wind_direction": _instance(WindDirection),  # Направление ветра
+        "humidity": _int,  # Относительная влажность  (%)
+    }
+
+    time: datetime.datetime
+    temperature: int
+    pressure: int
+    condition: WeatherCondition
+    wind_speed: float
+    wind_direction: WindDirection
+    humidity: int
 
 
 class DayPart(Enum):
@@ -47,13 +232,28 @@ class DayPart(Enum):
     Night = auto()
 
 
-class Forecast(BaseModel):
-    time: Optional[datetime.datetime] = None  # Время измерения
-    part: Optional[DayPart] = None  # Часть суток
-    min_temperature: int  # Минимальная температура в градусах Цельсия
-    max_temperature: int  # Максимальная температура в градусах Цельсия
-    pressure: int  # Давление в мм ртутного столба
-    condition: WeatherCondition  # Состояние погоды
-    wind_speed: float  # Скорость ветра (м/с)
-    wind_direction: WindDirection  # Направление ветра
-    humidity: int  # Относительная влажность  (%)
+class Forecast(_Entity):
+    __slots__ = ("time", "part", "min_temperature", "max_temperature", "pressure", "condition", "wind_speed",
+                 "wind_direction", "humidity")
+    _converters = {
+        "time": _optional(_instance(datetime.datetime)),  # Время измерения
+        "part": _optional(_instance(DayPart)),  # Часть суток
+        "min_temperature": _int,  # Минимальная температура в градусах Цельсия
+        "max_temperature": _int,  # Максимальная температура в градусах Цельсия
+        "pressure": _int,  # Давление в мм ртутного столба
+        "condition": _instance(WeatherCondition),  # Состояние погоды
+        "wind_speed": _float,  # Скорость ветра (м/с)
+        "wind_direction": _instance(WindDirection),  # Направление ветра
+        "humidity": _int,  # Относительная влажность  (%)
+    }
+    _defaults = {"time": None, "part": None}
+
+    time: Optional[datetime.datetime]
+    part: Optional[DayPart]
+    min_temperature: int
+    max_temperature: int
+    pressure: int
+    condition: WeatherCondition
+    wind_speed: float
+    wind_direction: WindDirection
+    humidity: int
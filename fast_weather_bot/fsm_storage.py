@@ -0,0 +1,259 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from aiogram.dispatcher.storage import BaseStorage
+from loguru import logger
+
+from fast_weather_bot.options import StorageOptions
+
+Address = Union[str, int, None]
+Key = Tuple[int, int]
+
+
+class _Record:
+    """
+    Диалог одного пользователя. Состояние хранится номером в таблице состояний хранилища,
+    данные - строкой JSON или None, если они пусты
+    """
+    __slots__ = ("state", "data", "bucket", "touched")
+
+    def __init__(self, state: int = 0, data: Optional[str] = None, bucket: Optional[str] = None,
+                 touched: float = 0.0):
+        self.state = state
+        self.data = data
+        self.bucket = bucket
+        self.touched = touched  # Время последнего изменения, от него отсчитывается ttl
+
+    def empty(self) -> bool:
+        return not self.state and self.data is None and self.bucket is None
+
+
+def _encode(data: Optional[dict]) -> Optional[str]:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+
+
+def _decode(raw: Optional[str]) -> dict:
+    # Каждый раз получается новый словарь, поэтому копировать его, как MemoryStorage, не нужно
+    return json.loads(raw) if raw is not None else {}
+
+
+class BoundedStorage(BaseStorage):
+    """
+    Хранилище состояний FSM с ограниченным размером. Диалог удаляется, если к нему не обращались ttl секунд.
+    Сверх capacity самые давние диалоги вытесняются из памяти: в SQLite, если задан path, иначе теряются.
+    В отличие от MemoryStorage, чтение состояния не создаёт записей, а завершённый диалог удаляется сразу
+    """
+
+    def __init__(self, options: Optional[StorageOptions] = None):
+        options = options or StorageOptions()
+        self._ttl = options.ttl
+        self._capacity = options.capacity
+        # Записи в порядке последнего изменения: в начале - самые давние, их и проверяем на ttl
+        self._records: "OrderedDict[Key, _Record]" = OrderedDict()
+        self._states: List[Optional[str]] = [None]
+        self._state_codes: Dict[Optional[str], int] = {None: 0}
+        self._sweep_interval = min(60.0, self._ttl / 10)
+        self._next_sweep = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        # Ключи диалогов на диске: промах по остальным не обращается к SQLite
+        self._on_disk: Set[Key] = set()
+        # Диалоги, переехавшие с диска в память. Их строки удаляются пачкой при следующей записи на диск
+        self._moved: List[Key] = []
+        self.expired = 0  # Диалоги, удалённые по ttl
+        self.evicted = 0  # Диалоги, вытесненные из памяти сверх capacity
+        if options.path:
+            self._conn = sqlite3.connect(options.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS fsm ("
+                               "chat INTEGER NOT NULL, user INTEGER NOT NULL, state TEXT, data TEXT, bucket TEXT, "
+                               "touched REAL NOT NULL, PRIMARY KEY (chat, user)) WITHOUT ROWID")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_touched ON fsm(touched)")
+            self._conn.commit()
+            self._on_disk = set(self._conn.execute("SELECT chat, user FROM fsm"))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _key(self, chat: Address, user: Address) -> Key:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _state_code(self, state: Optional[str]) -> int:
+        code = self._state_codes.get(state)
+        if code is None:
+            code = self._state_codes[state] = len(self._states)
+            self._states.append(state)
+        return code
+
+    # Память и диск
+
+    def _load(self, key: Key, now: float) -> Optional[_Record]:
+        if key not in self._on_disk:
+            return None
+        self._on_disk.discard(key)
+        row = self._conn.execute("SELECT state, data, bucket, touched FROM fsm WHERE chat = ? AND user = ?",
+                                 key).fetchone()
+        if row is None:
+            return None
+        # Запись переезжает в память, на диске остаётся только то, что не поместилось
+        self._moved.append(key)
+        state, data, bucket, touched = row
+        if now - touched > self._ttl:
+            self.expired += 1
+            return None
+        # Пользователь вернулся к диалогу: запись встаёт в конец порядка по времени, и время у неё должно быть
+        # текущим, иначе очистка по ttl остановится на ней раньше времени
+        record = _Record(self._state_code(state), data, bucket, now)
+        self._records[key] = record
+        self._evict()
+        return record
+
+    def _delete_moved(self) -> None:
+        if self._moved:
+            self._conn.executemany("DELETE FROM fsm WHERE chat = ? AND user = ?", self._moved)
+            self._moved = []
+
+    def _spill(self, items: List[Tuple[Key, _Record]]) -> None:
+        # Сначала удаляются старые строки: вытесняемая запись могла недавно переехать с диска
+        self._delete_moved()
+        self._on_disk.update(key for key, _ in items)
+        self._conn.executemany("INSERT OR REPLACE INTO fsm (chat, user, state, data, bucket, touched) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               [(*key, self._states[r.state], r.data, r.bucket, r.touched) for key, r in items])
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        overflow = len(self._records) - self._capacity
+        if overflow <= 0:
+            return
+        items = [self._records.popitem(last=False) for _ in range(overflow)]
+        self.evicted += overflow
+        if self._conn is not None:
+            self._spill(items)
+
+    def _sweep(self, now: float) -> None:
+        """
+        Удаляет брошенные диалоги. Записи упорядочены по времени изменения, поэтому проверяются только
+        просроченные, и один проход стоит O(число удалённых)
+        """
+        self._next_sweep = now + self._sweep_interval
+        records = self._records
+        deadline = now - self._ttl
+        while records:
+            key = next(iter(records))
+            if records[key].touched >= deadline:
+                break
+            del records[key]
+            self.expired += 1
+        if self._conn is not None:
+            self._delete_moved()
+            expired = self._conn.execute("SELECT chat, user FROM fsm WHERE touched < ?", (deadline,)).fetchall()
+            if expired:
+                self._conn.execute("DELETE FROM fsm WHERE touched < ?", (deadline,))
+                self._on_disk.difference_update(expired)
+                self.expired += len(expired)
+            self._conn.commit()
+
+    def _get(self, key: Key) -> Optional[_Record]:
+        now = time.time()
+        record = self._records.get(key)
+        if record is None:
+            return self._load(key, now) if self._conn is not None else None
+        if now - record.touched > self._ttl:
+            del self._records[key]
+            self.expired += 1
+            return None
+        return record
+
+    def _update(self, key: Key, **fields) -> None:
+        now = time.time()
+        record = self._get(key)
+        if record is None:
+            record = _Record()
+        for name, value in fields.items():
+            setattr(record, name, value)
+        if record.empty():
+            self._records.pop(key, None)
+            return
+        record.touched = now
+        self._records[key] = record
+        self._records.move_to_end(key)
+        self._evict()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    # BaseStorage
+
+    async def close(self) -> None:
+        if self._conn is None:
+            self._records.clear()
+            return
+        # Незавершённые диалоги переживут перезапуск
+        try:
+            self._spill(list(self._records.items()))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save FSM states: {e}")
+        self._records.clear()
+        self._conn.close()
+        self._conn = None
+
+    async def wait_closed(self) -> None:
+        pass
+
+    async def get_state(self, *, chat: Address = None, user: Address = None,
+                        default: Optional[str] = None) -> Optional[str]:
+        record = self._get(self._key(chat, user))
+        if record is None or not record.state:
+            return self.resolve_state(default)
+        return self._states[record.state]
+
+    async def set_state(self, *, chat: Address = None, user: Address = None, state=None) -> None:
+        self._update(self._key(chat, user), state=self._state_code(self.resolve_state(state)))
+
+    async def get_data(self, *, chat: Address = None, user: Address = None, default: Optional[dict] = None) -> dict:
+        record = self._get(self._key(chat, user))
+        if record is None or record.data is None:
+            return dict(default or {})
+        return _decode(record.data)
+
+    async def set_data(self, *, chat: Address = None, user: Address = None, data: Optional[dict] = None) -> None:
+        self._update(self._key(chat, user), data=_encode(data))
+
+    async def update_data(self, *, chat: Address = None, user: Address = None, data: Optional[dict] = None,
+                          **kwargs) -> None:
+        key = self._key(chat, user)
+        record = self._get(key)
+        merged = _decode(record.data if record is not None else None)
+        merged.update(data or {}, **kwargs)
+        self._update(key, data=_encode(merged))
+
+    async def reset_state(self, *, chat: Address = None, user: Address = None,
+                          with_data: Optional[bool] = True) -> None:
+        if with_data:
+            self._update(self._key(chat, user), state=0, data=None)
+        else:
+            self._update(self._key(chat, user), state=0)
+
+    def has_bucket(self) -> bool:
+        return True
+
+    async def get_bucket(self, *, chat: Address = None, user: Address = None,
+                         default: Optional[dict] = None) -> dict:
+        record = self._get(self._key(chat, user))
+        if record is None or record.bucket is None:
+            return dict(default or {})
+        return _decode(record.bucket)
+
+    async def set_bucket(self, *, chat: Address = None, user: Address = None, bucket: Optional[dict] = None) -> None:
+        self._update(self._key(chat, user), bucket=_encode(bucket))
+
+    async def update_bucket(self, *, chat: Address = None, user: Address = None, bucket: Optional[dict] = None,
+                            **kwargs) -> None:
+        key = self._key(chat, user)
+        record = self._get(key)
+        merged = _decode(record.bucket if record is not None else None)
+        merged.update(bucket or {}, **kwargs)
+        self._update(key, bucket=_encode(merged))
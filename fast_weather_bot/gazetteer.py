@@ -0,0 +1,292 @@
+"""
+Офлайн-справочник городов: поиск по названию и ближайший город к точке.
+Файл справочника собирается из data/cities.tsv командой
+
+    python -m fast_weather_bot.gazetteer data/cities.tsv data/gazetteer.bin
+
+и открывается через mmap: при запуске ничего не разбирается, в память попадают только прочитанные страницы
+"""
+import math
+import mmap
+import os
+import struct
+import sys
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from fast_weather_bot.entity import Coordinates
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_PATH = os.path.join(DATA_DIR, "gazetteer.bin")
+
+MAGIC = b"GZT1"
+# Магия, число городов, число ключей поиска и смещения разделов файла
+_HEADER = struct.Struct("<4sII6I")
+
+_RECORD = np.dtype([("lat", "<f4"), ("lon", "<f4"), ("population", "<u4"), ("name_start", "<u4"),
+                    ("name_len", "<u2"), ("_pad", "<u2")])
+_KEY = np.dtype([("start", "<u4"), ("record", "<u4"), ("len", "<u2"), ("_pad", "<u2")])
+_KD = np.dtype([("xyz", "<f4", (3,)), ("record", "<u4")])
+
+EARTH_RADIUS_KM = 6371.0
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t",
+    "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "",
+    "э": "e", "ю": "yu", "я": "ya", "і": "i", "ї": "i", "є": "e", "ґ": "g",
+}
+_TRANSLIT_TABLE = str.maketrans({**_TRANSLIT, **{c: c for c in "abcdefghijklmnopqrstuvwxyz0123456789"}})
+
+
+def normalize(text: str) -> str:
+    """
+    Ключ поиска: латиница в нижнем регистре без пробелов и знаков. Кириллица транслитерируется,
+    поэтому "Москва", "moskva" и "МОСКВА" дают один ключ
+    """
+    return "".join(c for c in text.lower().translate(_TRANSLIT_TABLE) if c.isascii() and c.isalnum())
+
+
+def _xyz(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+def _distance(max_edits: int, a: str, b: str) -> int:
+    """
+    Расстояние Левенштейна, но не больше max_edits + 1: дальше считать незачем
+    """
+    if abs(len(a) - len(b)) > max_edits:
+        return max_edits + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_edits:
+            return max_edits + 1
+        previous = current
+    return previous[-1]
+
+
+class Place:
+    __slots__ = ("name", "coordinates", "population")
+
+    def __init__(self, name: str, coordinates: Coordinates, population: int):
+        self.name = name
+        self.coordinates = coordinates
+        self.population = population
+
+    def __repr__(self) -> str:
+        return f"<Place {self.name} {self.coordinates.lat:.4f} {self.coordinates.lon:.4f}>"
+
+
+class Gazetteer:
+    """
+    Справочник городов поверх mmap файла. Два индекса:
+    - отсортированные ключи названий: поиск по префиксу двоичным поиском, а при опечатке - по расстоянию
+      Левенштейна среди ключей с той же первой буквой;
+    - неявное k-d дерево по точкам на единичной сфере для поиска ближайшего города
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_records, n_keys, records, names, keys, key_blob, kd, end = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+        self._records = np.frombuffer(self._mm, _RECORD, n_records, records)
+        self._names = memoryview(self._mm)[names:keys]
+        self._keys = np.frombuffer(self._mm, _KEY, n_keys, keys)
+        self._key_blob = memoryview(self._mm)[key_blob:kd]
+        self._kd = np.frombuffer(self._mm, _KD, n_records, kd)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def close(self) -> None:
+        self._records = self._keys = self._kd = None
+        self._names.release()
+        self._key_blob.release()
+        self._mm.close()
+
+    def _place(self, i: int) -> Place:
+        record = self._records[i]
+        start = int(record["name_start"])
+        name = bytes(self._names[start:start + int(record["name_len"])]).decode()
+        coordinates = Coordinates.construct(lat=round(float(record["lat"]), 4), lon=round(float(record["lon"]), 4))
+        return Place(name, coordinates, int(record["population"]))
+
+    def _key(self, i: int) -> bytes:
+        key = self._keys[i]
+        start = int(key["start"])
+        return bytes(self._key_blob[start:start + int(key["len"])])
+
+    def _lower_bound(self, prefix: bytes) -> int:
+        lo, hi = 0, len(self._keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _prefix_range(self, prefix: bytes) -> Tuple[int, int]:
+        start = self._lower_bound(prefix)
+        # Все ключи с префиксом лежат до первого ключа, который больше любого продолжения префикса
+        stop = self._lower_bound(prefix + b"\xff")
+        return start, stop
+
+    def _ranked(self, key_indexes: Iterable[int], limit: int) -> List[Place]:
+        records = sorted({int(self._keys[i]["record"]) for i in key_indexes},
+                         key=lambda r: -int(self._records[r]["population"]))
+        return [self._place(r) for r in records[:limit]]
+
+    def search(self, query: str, limit: int = 5) -> List[Place]:
+        """
+        Города, название которых начинается с query, крупные первыми. Если таких нет,
+        города с названием на расстоянии не больше пары опечаток
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        start, stop = self._prefix_range(key.encode())
+        if start < stop:
+            # Точное совпадение важнее префиксного: "орел" - это Орёл, а не Орелград
+            exact = [i for i in range(start, stop) if self._key(i) == key.encode()]
+            return self._ranked(exact or range(start, stop), limit)
+        max_edits = 1 if len(key) <= 5 else 2
+        start, stop = self._prefix_range(key[:1].encode())
+        close = []
+        for i in range(start, stop):
+            distance = _distance(max_edits, key, self._key(i).decode())
+            if distance <= max_edits:
+                close.append((distance, i))
+        best = min((distance for distance, _ in close), default=None)
+        return self._ranked((i for distance, i in close if distance == best), limit)
+
+    def coords_by_city(self, city: str) -> Optional[Coordinates]:
+        places = self.search(city, limit=1)
+        return places[0].coordinates if places else None
+
+    def nearest(self, coordinates: Coordinates, max_distance_km: Optional[float] = None) -> Optional[Place]:
+        """
+        Ближайший город. Поиск идёт по хордовому расстоянию между точками единичной сферы,
+        оно монотонно с расстоянием по поверхности
+        """
+        if not len(self._kd):
+            return None
+        target = _xyz(np.array(coordinates.lat), np.array(coordinates.lon)).tolist()
+        xyz = self._kd["xyz"]
+        best_index, best = -1, math.inf
+        stack = [(0, len(self._kd), 0)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            point = xyz[mid]
+            dx, dy, dz = point[0] - target[0], point[1] - target[1], point[2] - target[2]
+            d = dx * dx + dy * dy + dz * dz
+            if d < best:
+                best_index, best = mid, d
+            diff = target[axis] - point[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            if diff * diff < best:
+                stack.append((*far, (axis + 1) % 3))
+            stack.append((*near, (axis + 1) % 3))
+        distance = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(best) / 2))
+        if max_distance_km is not None and distance > max_distance_km:
+            return None
+        return self._place(int(self._kd[best_index]["record"]))
+
+
+@lru_cache(maxsize=None)
+def default_gazetteer() -> Gazetteer:
+    return Gazetteer(DEFAULT_PATH)
+
+
+# Сборка файла
+
+
+def _read_source(path: str) -> List[Tuple[str, float, float, int, List[str]]]:
+    cities = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            name, name_en, lat, lon, population = fields[:5]
+            aliases = [a for a in fields[5].split(",") if a] if len(fields) > 5 else []
+            cities.append((name, float(lat), float(lon), int(population), [name, name_en] + aliases))
+    return cities
+
+
+def _kd_order(points: np.ndarray, ids: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    Раскладывает точки в порядке неявного k-d дерева: корень отрезка [lo, hi) лежит в его середине
+    """
+    if len(ids) <= 1:
+        return ids
+    ids = ids[np.argsort(points[ids, axis], kind="stable")]
+    mid = len(ids) // 2
+    following = (axis + 1) % 3
+    return np.concatenate((_kd_order(points, ids[:mid], following), ids[mid:mid + 1],
+                           _kd_order(points, ids[mid + 1:], following)))
+
+
+def build(source: str, target: str) -> int:
+    """
+    Собирает файл справочника из TSV: название, английское название, широта, долгота, население, синонимы
+    :return: Число городов
+    """
+    cities = _read_source(source)
+    records = np.zeros(len(cities), _RECORD)
+    names = bytearray()
+    keys = {}
+    for i, (name, lat, lon, population, aliases) in enumerate(cities):
+        encoded = name.encode()
+        records[i] = (lat, lon, population, len(names), len(encoded), 0)
+        names += encoded
+        for alias in aliases:
+            key = normalize(alias)
+            # Из городов с одинаковым ключом остаётся крупнейший
+            if key and (key not in keys or cities[keys[key]][3] < population):
+                keys[key] = i
+    key_table = np.zeros(len(keys), _KEY)
+    key_blob = bytearray()
+    for j, key in enumerate(sorted(keys, key=str.encode)):
+        encoded = key.encode()
+        key_table[j] = (len(key_blob), keys[key], len(encoded), 0)
+        key_blob += encoded
+
+    points = _xyz(records["lat"].astype(np.float64), records["lon"].astype(np.float64))
+    order = _kd_order(points, np.arange(len(cities)))
+    kd = np.zeros(len(cities), _KD)
+    kd["xyz"] = points[order]
+    kd["record"] = order
+
+    def align(offset: int) -> int:
+        return (offset + 7) // 8 * 8
+
+    offsets = [align(_HEADER.size)]
+    for section in (records.tobytes(), bytes(names), key_table.tobytes(), bytes(key_blob), kd.tobytes()):
+        offsets.append(align(offsets[-1] + len(section)))
+    with open(target, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(cities), len(keys), *offsets))
+        for offset, section in zip(offsets, (records.tobytes(), bytes(names), key_table.tobytes(), bytes(key_blob),
+                                             kd.tobytes())):
+            f.seek(offset)
+            f.write(section)
+        f.truncate(offsets[-1])
+    return len(cities)
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(DATA_DIR, "cities.tsv")
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    print(f"{build(source, target)} cities written to {target}")
@@ -0,0 +1,400 @@
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from fast_weather_bot.options import HistoryOptions
+from fast_weather_bot.weather_api.grid import Cell, cell_key
+from fast_weather_bot.weather_api.hourly import HourlyForecast, HOUR
+from fast_weather_bot.weather_api.shared import Decoded
+
+OBSERVATION = 0
+FORECAST = 1
+
+MAGIC = b"WBHIST"
+VERSION = 1
+
+# Заголовок сегмента: магия, версия, число строк
+_HEADER = struct.Struct("<6sHQ")
+# Строка истории: ячейка, вид (наблюдение или прогноз), время получения ответа и колонки почасового прогноза
+_ROW = np.dtype([(name, np.dtype(dtype).newbyteorder("<")) for name, dtype in
+                 {"key": np.int64, "kind": np.int8, "issued": np.int64, **HourlyForecast.columns}.items()])
+# Разбиение по времени (UTC): файлы часов дописываются, сегменты дней и месяцев пишутся при сжатии
+_FORMATS = {10: "%Y%m%d%H", 8: "%Y%m%d", 6: "%Y%m"}
+
+
+class Aggregate(NamedTuple):
+    time: np.ndarray  # Начало интервала
+    count: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+@lru_cache(maxsize=4096)
+def _bounds(name: str) -> Tuple[float, float]:
+    """
+    Начало и конец интервала, который покрывает файл с таким именем
+    """
+    start = datetime.datetime.strptime(name, _FORMATS[len(name)]).replace(tzinfo=datetime.timezone.utc)
+    if len(name) == 10:
+        end = start + datetime.timedelta(hours=1)
+    elif len(name) == 8:
+        end = start + datetime.timedelta(days=1)
+    else:
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.timestamp(), end.timestamp()
+
+
+def _parse_name(filename: str) -> Optional[Tuple[str, str]]:
+    """
+    Имя интервала и тип файла: "2026101707.0.live" - часть часа от записывающего 0, "20261017.seg" - сегмент дня
+    """
+    parts = filename.split(".")
+    if parts[-1] not in ("live", "seg") or len(parts[0]) not in _FORMATS or not parts[0].isdigit():
+        return None
+    return parts[0], parts[-1]
+
+
+def _compacted(rows: np.ndarray) -> np.ndarray:
+    """
+    Сортирует строки по ячейке, виду и времени. Из повторов (одинаковые ячейка, вид и время) остаётся
+    последний полученный: наблюдение приходит в нескольких ответах подряд, а прогноз на час уточняется
+    """
+    rows = rows[np.lexsort((rows["issued"], rows["time"], rows["kind"], rows["key"]))]
+    if len(rows) < 2:
+        return rows
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = ((rows["key"][1:] != rows["key"][:-1]) | (rows["kind"][1:] != rows["kind"][:-1])
+                 | (rows["time"][1:] != rows["time"][:-1]))
+    return rows[last]
+
+
+def _read_live(path: str) -> np.ndarray:
+    # Строка, которую другой процесс дописывает прямо сейчас, не читается
+    with open(path, "rb") as f:
+        data = f.read()
+    return np.frombuffer(data, _ROW, len(data) // _ROW.itemsize)
+
+
+def _copy_rows(columns: Dict[str, np.ndarray], index: slice) -> np.ndarray:
+    rows = np.empty(len(columns["key"][index]), _ROW)
+    for name, column in columns.items():
+        rows[name] = column[index]
+    return rows
+
+
+def _write_segment(path: str, rows: np.ndarray) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(rows)))
+        offset = _HEADER.size
+        for name in _ROW.names:
+            f.write(b"\0" * (_align(offset) - offset))
+            data = np.ascontiguousarray(rows[name]).tobytes()
+            f.write(data)
+            offset = _align(offset) + len(data)
+    os.replace(tmp, path)
+
+
+class _Segment:
+    """
+    Сжатый сегмент, отображённый в память: колонки друг за другом, строки отсортированы по ячейке, виду и времени
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count = _HEADER.unpack_from(self._mmap)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Unsupported history segment {magic!r} version {version}")
+            self.columns: Dict[str, np.ndarray] = {}
+            offset = _HEADER.size
+            for name in _ROW.names:
+                dtype = _ROW.fields[name][0]
+                self.columns[name] = np.frombuffer(self._mmap, dtype, count, _align(offset))
+                offset = _align(offset) + count * dtype.itemsize
+        except (ValueError, struct.error):
+            self.columns = {}
+            self._mmap.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self.columns["key"])
+
+    def locate(self, key: int, kind: int, start: float, end: float) -> slice:
+        """
+        Номера строк ячейки key вида kind со временем в [start, end)
+        """
+        keys = self.columns["key"]
+        lo, hi = np.searchsorted(keys, key, "left"), np.searchsorted(keys, key, "right")
+        kinds = self.columns["kind"][lo:hi]
+        lo, hi = lo + np.searchsorted(kinds, kind, "left"), lo + np.searchsorted(kinds, kind, "right")
+        times = self.columns["time"][lo:hi]
+        lo, hi = lo + np.searchsorted(times, start, "left"), lo + np.searchsorted(times, end, "left")
+        return slice(int(lo), int(hi))
+
+    def rows(self, index: slice = slice(None)) -> np.ndarray:
+        return _copy_rows(self.columns, index)
+
+    def close(self) -> None:
+        # Массивы колонок ссылаются на память mmap, без них mmap не закрыть
+        self.columns = {}
+        self._mmap.close()
+
+
+class History:
+    """
+    Архив наблюдений и прогнозов по ячейкам сетки. Запись только дописывается: строки фиксированного размера
+    ложатся в файл своего часа, у каждого записывающего процесса свой. Закрытые часы сжимаются в сегмент дня,
+    закрытые дни - в сегмент месяца: колонки подряд, строки отсортированы по ячейке и времени, повторы убраны.
+    Выборка по ячейке и интервалу читает только сегменты нужных дней и месяцев и ищет в них двоичным поиском
+    """
+
+    # Через столько секунд после конца часа в его файл уже никто не пишет и его можно сжимать
+    compact_delay = 2 * HOUR
+    # Сколько раз повторять выборку, если файлы сжали, пока она шла
+    scan_retries = 3
+
+    def __init__(self, path: str, writer: int = 0, forecast_hours: int = 6):
+        """
+        :param writer: Номер записывающего процесса, у каждого процесса свои файлы часов
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._writer = writer
+        self._forecast_hours = forecast_hours
+        self._segments: Dict[str, _Segment] = {}
+        # Выборки идут из потоков исполнителя, а кэш сегментов у них общий
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.rescans = 0  # Сколько выборок повторено из-за сжатия
+
+    def _live_path(self, hour: int) -> str:
+        name = datetime.datetime.fromtimestamp(hour, datetime.timezone.utc).strftime(_FORMATS[10])
+        return os.path.join(self._path, f"{name}.{self._writer}.live")
+
+    def append(self, records: Iterable[Tuple[Cell, float, Decoded]]) -> int:
+        """
+        Дописывает наблюдение и прогноз на forecast_hours часов из каждого ответа
+        :param records: Ячейка, время получения ответа (time.time()), ответ
+        :return: Число записанных строк
+        """
+        observations = []
+        forecasts = []
+        for cell, fetched_at, (current, _, hourly) in records:
+            key = cell_key(cell)
+            # Поля в порядке _ROW, осадков в наблюдении нет
+            observations.append((key, OBSERVATION, fetched_at, current.time.timestamp(), current.temperature,
+                                 np.nan, np.nan, current.wind_speed, current.wind_direction.value, current.pressure,
+                                 current.humidity, current.condition.value))
+            if hourly is not None:
+                forecasts.append((key, fetched_at, hourly.window(fetched_at, self._forecast_hours)))
+        if not observations:
+            return 0
+        sizes = [len(window) for _, _, window in forecasts]
+        forecast = np.empty(sum(sizes), _ROW)
+        if forecasts:
+            forecast["key"] = np.repeat([key for key, _, _ in forecasts], sizes)
+            forecast["kind"] = FORECAST
+            forecast["issued"] = np.repeat([fetched_at for _, fetched_at, _ in forecasts], sizes)
+            for name in HourlyForecast.columns:
+                forecast[name] = np.concatenate([getattr(window, name) for _, _, window in forecasts])
+        rows = np.concatenate((np.array(observations, _ROW), forecast))
+        hours = rows["time"] // HOUR * HOUR
+        for hour in np.unique(hours).tolist():
+            with open(self._live_path(hour), "ab") as f:
+                f.write(rows[hours == hour].tobytes())
+        self.appended += len(rows)
+        return len(rows)
+
+    def _segment(self, name: str, inode: int) -> Optional[_Segment]:
+        # Сжатие заменяет файл сегмента, поэтому открытый сегмент узнаётся по inode
+        cached = self._segments.get(name)
+        if cached is not None and cached.inode == inode:
+            return cached
+        try:
+            segment = _Segment(os.path.join(self._path, name))
+        except FileNotFoundError:
+            # Сегмент заменили или удалили после просмотра каталога, выборка повторится
+            raise
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping history segment {name}: {e}")
+            return None
+        # Старый сегмент не закрывается: его колонки может копировать другая выборка, mmap освободится вместе
+        # с последней ссылкой
+        self._segments[name] = segment
+        return segment
+
+    def _listing(self, start: float, end: float) -> Dict[str, int]:
+        """
+        Файлы с записями из [start, end) и их inode
+        """
+        files = {}
+        with os.scandir(self._path) as entries:
+            for entry in entries:
+                parsed = _parse_name(entry.name)
+                if parsed is None:
+                    continue
+                first, last = _bounds(parsed[0])
+                if last > start and first < end:
+                    files[entry.name] = entry.inode()
+        return files
+
+    def _locate(self, files: Dict[str, int], key: int, kind: int,
+                start: float, end: float) -> List[Tuple[str, Optional[Dict[str, np.ndarray]], slice]]:
+        """
+        Что читать из каждого файла: для сегмента - его колонки и номера строк, для файла часа - весь файл.
+        Вызывается под блокировкой, а копирование строк идёт уже без неё
+        """
+        sources = []
+        for filename, inode in files.items():
+            if filename.endswith(".seg"):
+                segment = self._segment(filename, inode)
+                if segment is not None:
+                    sources.append((filename, segment.columns, segment.locate(key, kind, start, end)))
+            else:
+                sources.append((filename, None, slice(None)))
+        # Вытесняет сегменты, которые сжатие заменило сегментом длиннее (дни в месяц)
+        for name in [name for name in self._segments if name not in files]:
+            first, last = _bounds(name.split(".")[0])
+            if last > start and first < end:
+                del self._segments[name]
+        return sources
+
+    def _read(self, sources: List[Tuple[str, Optional[Dict[str, np.ndarray]], slice]], key: int, kind: int,
+              start: float, end: float) -> np.ndarray:
+        parts = []
+        for filename, columns, index in sources:
+            first = _bounds(filename.split(".")[0])[0]
+            if columns is not None:
+                # Сегмент, вытесненный из кэша другой выборкой, остаётся отображён, пока на его колонки есть ссылки
+                parts.append((first, _copy_rows(columns, index)))
+            else:
+                rows = _read_live(os.path.join(self._path, filename))
+                parts.append((first, rows[(rows["key"] == key) & (rows["kind"] == kind)
+                                          & (rows["time"] >= start) & (rows["time"] < end)]))
+        parts.sort(key=lambda part: part[0])
+        return np.concatenate([part for _, part in parts]) if parts else np.empty(0, _ROW)
+
+    def scan(self, cell: Cell, start: float, end: float, kind: int = OBSERVATION) -> HourlyForecast:
+        """
+        Записи ячейки со временем в [start, end), по одной на час прогноза или на время наблюдения.
+        Читает файлы, поэтому из цикла событий вызывается в исполнителе
+        """
+        key = cell_key(cell)
+        rows = np.empty(0, _ROW)
+        for _ in range(self.scan_retries):
+            files = self._listing(start, end)
+            try:
+                # Под блокировкой только кэш сегментов и поиск строк, копирование и чтение файлов часов - без неё
+                with self._lock:
+                    sources = self._locate(files, key, kind, start, end)
+                rows = self._read(sources, key, kind, start, end)
+            except FileNotFoundError:
+                # Файл часа или сегмент сжали между просмотром каталога и чтением
+                with self._lock:
+                    self.rescans += 1
+                continue
+            # Сжатие сначала заменяет сегмент, потом удаляет исходные файлы. Если за время выборки набор
+            # файлов не изменился, она видела либо всё до сжатия, либо всё после
+            if self._listing(start, end) == files:
+                break
+            with self._lock:
+                self.rescans += 1
+        # Интервалы сегментов не пересекаются, и их строки уже без повторов. Сортировать нужно, только если
+        # попались файлы часов от нескольких процессов или повторы
+        if len(rows) > 1 and not (rows["time"][1:] > rows["time"][:-1]).all():
+            rows = _compacted(rows)
+        return HourlyForecast(*(rows[name] for name in HourlyForecast.columns))
+
+    def aggregate(self, cell: Cell, start: float, end: float, step: float = HOUR, column: str = "temperature",
+                  kind: int = OBSERVATION, utc_offset: int = 0) -> Aggregate:
+        """
+        Минимум, максимум и среднее column по интервалам длиной step. Интервалы без записей пропускаются
+        :param utc_offset: Сдвиг границ интервалов: для суток по местному времени - смещение пояса от UTC
+        """
+        history = self.scan(cell, start, end, kind)
+        values = getattr(history, column).astype(np.float64)
+        buckets = (history.time + utc_offset) // step * step - utc_offset
+        if not len(buckets):
+            empty = np.empty(0)
+            return Aggregate(buckets, empty.astype(np.int64), empty, empty, empty)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        count = np.diff(np.r_[starts, len(values)])
+        return Aggregate(buckets[starts], count, np.minimum.reduceat(values, starts),
+                         np.maximum.reduceat(values, starts), np.add.reduceat(values, starts) / count)
+
+    def _merge(self, name: str, sources: List[str]) -> None:
+        """
+        Сжимает файлы sources в сегмент name и удаляет их. Существующий сегмент name входит в sources
+        """
+        parts = []
+        for path in sources:
+            if path.endswith(".live"):
+                parts.append(_read_live(path))
+            else:
+                segment = _Segment(path)
+                parts.append(segment.rows())
+                segment.close()
+        target = os.path.join(self._path, f"{name}.seg")
+        _write_segment(target, _compacted(np.concatenate(parts)))
+        for path in sources:
+            if path != target:
+                os.unlink(path)
+
+    def _closed(self, closed: float) -> Dict[str, List[str]]:
+        """
+        Закрытые к времени closed файлы по интервалам
+        """
+        files: Dict[str, List[str]] = {}
+        with os.scandir(self._path) as entries:
+            for entry in entries:
+                parsed = _parse_name(entry.name)
+                if parsed is not None and _bounds(parsed[0])[1] <= closed:
+                    files.setdefault(parsed[0], []).append(entry.path)
+        return files
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Сжимает закрытые часы в сегменты дней, закрытые дни - в сегменты месяцев. Можно выполнять в другом
+        потоке или процессе, пока идёт запись и выборка: текущие часы не трогает, сегмент заменяет целиком до
+        удаления исходных файлов, а выборка, заставшая сжатие, повторяется
+        :return: Сколько сегментов записано
+        """
+        closed = (time.time() if now is None else now) - self.compact_delay
+        written = 0
+        for length in (8, 6):
+            groups: Dict[str, List[str]] = {}
+            for name, paths in self._closed(closed).items():
+                if len(name) > length:
+                    groups.setdefault(name[:length], []).extend(paths)
+            for name, sources in sorted(groups.items()):
+                # Сегмент незакрытого дня сжимается заново каждый раз, сегмент месяца - только после его конца
+                if length == 6 and _bounds(name)[1] > closed:
+                    continue
+                existing = os.path.join(self._path, f"{name}.seg")
+                if os.path.exists(existing):
+                    sources.append(existing)
+                self._merge(name, sources)
+                written += 1
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
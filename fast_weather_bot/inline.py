@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from fast_weather_bot.options import InlineOptions
+
+T = TypeVar("T")
+
+
+class _Lookup:
+    __slots__ = ("key", "task", "waiters")
+
+    def __init__(self, key: Hashable, task: asyncio.Task):
+        self.key = key
+        self.task = task
+        self.waiters = 0  # Сколько обработчиков ждут этот поиск
+
+
+class InlineAnswers(Generic[T]):
+    """
+    Готовые ответы на inline-запросы. Запросы приходят на каждое нажатие клавиши, поэтому поиск ответа
+    начинается только после паузы debounce, а новый запрос того же пользователя отменяет поиск по старому,
+    если только ему не нужен тот же ответ. Ответы хранятся ttl секунд по нормализованному тексту запроса:
+    все, кто набирает одно и то же начало названия, получают ответ без поиска
+    """
+
+    def __init__(self, options: Optional[InlineOptions] = None):
+        self.options = options or InlineOptions()
+        self._answers: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self._lookups: Dict[int, _Lookup] = {}
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0  # Сколько поисков отменено более новым запросом
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        found = self._answers.get(key)
+        if found is None or found[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._answers.move_to_end(key)
+        self.hits += 1
+        return found[1]
+
+    def put(self, key: Hashable, answer: T) -> None:
+        self._answers[key] = (time.monotonic() + self.options.ttl, answer)
+        self._answers.move_to_end(key)
+        while len(self._answers) > self.options.max_size:
+            self._answers.popitem(last=False)
+
+    async def _debounced(self, lookup: Callable[[], Awaitable[T]]) -> T:
+        await asyncio.sleep(self.options.debounce)
+        return await lookup()
+
+    async def latest(self, user_id: int, key: Hashable, lookup: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Выполняет lookup, если за время поиска от пользователя не пришёл запрос с другим key. Запрос с тем же key
+        дожидается уже идущего поиска
+        :return: Результат lookup или None, если поиск отменён новым запросом
+        """
+        running = self._lookups.get(user_id)
+        if running is not None and (running.task.done() or running.key != key):
+            if not running.task.done():
+                running.task.cancel()
+                self.cancelled += 1
+            running = None
+        if running is None:
+            running = self._lookups[user_id] = _Lookup(key, asyncio.create_task(self._debounced(lookup)))
+        task = running.task
+        running.waiters += 1
+        try:
+            # wait, в отличие от await задачи, не передаёт отмену поиска в обработчик
+            await asyncio.wait((task,))
+        except asyncio.CancelledError:
+            # Поиск отменяется вместе с последним обработчиком, который его ждёт
+            if running.waiters == 1:
+                task.cancel()
+            raise
+        finally:
+            running.waiters -= 1
+            if self._lookups.get(user_id) is running and task.done():
+                del self._lookups[user_id]
+        if task.cancelled():
+            return None
+        return task.result()
+
+    async def close(self) -> None:
+        tasks = [running.task for running in self._lookups.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lookups = {}
@@ -1,10 +1,17 @@
+import asyncio
 import inspect
+import random
 import sys
 from functools import wraps
-from typing import TypeVar, Callable, Any
+from typing import TypeVar, Callable, Any, Dict, List, Optional
 
 from loguru import logger
 
+from fast_weather_bot.metrics import REGISTRY, Timer
+
+# Длиннее этого repr аргументов обрезается
+MAX_REPR = 200
+
 
 def arglist(*args, **kwargs):
     s = ""
@@ -12,43 +19,151 @@ def arglist(*args, **kwargs):
         if hasattr(a, "__len__") and len(a) > 80:
             s += f"{type(a)} length={len(a)}, "
         else:
-            s += repr(a) + ", "
+            s += _short_repr(a) + ", "
     for k, v in kwargs.items():
-        s += "{k}={v}, ".format(k=k, v=repr(v))
+        s += "{k}={v}, ".format(k=k, v=_short_repr(v))
     return "({s})".format(s=s[:-2])
 
 
+def _short_repr(a: Any) -> str:
+    r = repr(a)
+    if len(r) > MAX_REPR:
+        return r[:MAX_REPR] + "..."
+    return r
+
+
 F = TypeVar("F", bound=Callable[..., Any])
 
-logger.remove()
-logger.add(sys.stdout, colorize=True, enqueue=True, format="{time} | {level} | {message}", level="TRACE")
+
+class _Gate:
+    """
+    Включено ли логирование для одной обёрнутой функции. Пересчитывается в setup,
+    чтобы во время вызова проверка стоила одного обращения к атрибуту
+    """
+    __slots__ = ("module", "level_no", "enabled", "logger")
+
+    def __init__(self, module: str, function: str, level: str):
+        self.module = module
+        self.level_no = logger.level(level).no
+        self.enabled = True
+        self.logger = logger.patch(lambda record: record.update(name=module, function=function))
+
+
+_gates: List[_Gate] = []
+# До setup обёртки logit пишут только INFO и выше, как после setup() по умолчанию
+_default_level_no = logger.level("INFO").no
+_module_levels: Dict[str, int] = {}
+
+
+def _threshold(module: str) -> int:
+    """
+    Уровень для модуля: ищется самый длинный настроенный префикс имени модуля
+    """
+    name = module
+    while name:
+        if name in _module_levels:
+            return _module_levels[name]
+        name = name.rpartition(".")[0]
+    return _default_level_no
+
+
+def _update_gate(gate: _Gate) -> None:
+    gate.enabled = gate.level_no >= _threshold(gate.module)
+
+
+def setup(level: str = "INFO", levels: Optional[Dict[str, str]] = None, json: bool = False) -> None:
+    """
+    Настраивает вывод логов. При импорте модуль логи не настраивает: это делает main, а до него
+    работает обработчик loguru по умолчанию
+    :param level: Уровень по умолчанию
+    :param levels: Уровни для отдельных модулей (и их подмодулей)
+    :param json: Писать структурированные записи в JSON вместо текста
+    """
+    global _default_level_no, _module_levels
+    levels = levels or {}
+    _default_level_no = logger.level(level).no
+    _module_levels = {module: logger.level(module_level).no for module, module_level in levels.items()}
+    for gate in _gates:
+        _update_gate(gate)
+
+    logger.remove()
+    sink_filter = {"": level}
+    sink_filter.update(levels)
+    sink_level = min([_default_level_no] + list(_module_levels.values()))
+    if json:
+        logger.add(sys.stdout, serialize=True, enqueue=True, level=sink_level, filter=sink_filter)
+    else:
+        logger.add(sys.stdout, colorize=True, enqueue=True, format="{time} | {level} | {message}",
+                   level=sink_level, filter=sink_filter)
 
 
 def log(level, msg, depth=1):
     logger.opt(depth=depth).log(level, msg)
 
 
-def logit(level: str = "TRACE") -> Callable[[F], F]:
+def logit(level: str = "TRACE", sample: float = 1.0, metric: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Логирует вызовы функции. Если уровень выключен для модуля функции, обёртка сразу вызывает функцию,
+    аргументы не форматируются
+    :param sample: Доля вызовов, которые попадут в лог. Для часто вызываемых функций
+    :param metric: Префикс метрик: длительность вызовов попадёт в гистограмму {metric}_seconds,
+                   исключения - в счётчик {metric}_errors_total, с меткой function
+    """
     def decorate(func: F) -> F:
+        name = f"{func.__module__}.{func.__name__}"
+        gate = _Gate(func.__module__, func.__name__, level)
+        _update_gate(gate)
+        _gates.append(gate)
+
+        target = func
+        if metric is not None:
+            histogram = REGISTRY.histogram(f"{metric}_seconds", f"Duration of {metric} calls",
+                                           ("function",)).labels(func.__qualname__)
+            errors = REGISTRY.counter(f"{metric}_errors_total", f"Failed {metric} calls",
+                                      ("function",)).labels(func.__qualname__)
+
+            if inspect.iscoroutinefunction(func):
+                async def target(*args, **kwargs):
+                    with Timer(histogram, errors):
+                        return await func(*args, **kwargs)
+            else:
+                def target(*args, **kwargs):
+                    with Timer(histogram, errors):
+                        return func(*args, **kwargs)
+
         if inspect.iscoroutinefunction(func):
-            @wraps(func)
-            async def wrapper(*args, **kwargs):
-                log(level, f"START AWAIT {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
-                ret = await func(*args, **kwargs)
-                log(level, f"END AWAIT {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
+            async def logged(*args, **kwargs):
+                args_text = arglist(*args, **kwargs)
+                gate.logger.log(level, "START AWAIT {}{}", name, args_text)
+                ret = await target(*args, **kwargs)
+                gate.logger.log(level, "END AWAIT {}{}", name, args_text)
                 return ret
 
+            # Обёртка не корутина: при выключенном логе она отдаёт корутину самой функции без лишнего кадра
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not gate.enabled or (sample < 1 and random.random() >= sample):
+                    return target(*args, **kwargs)
+                return logged(*args, **kwargs)
+
+            if hasattr(inspect, "markcoroutinefunction"):
+                inspect.markcoroutinefunction(wrapper)
+            else:
+                wrapper._is_coroutine = asyncio.coroutines._is_coroutine
             return wrapper
         else:
             @wraps(func)
             def wrapper(*args, **kwargs):
-                log(level, f"CALL {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
+                if not gate.enabled or (sample < 1 and random.random() >= sample):
+                    return target(*args, **kwargs)
+                args_text = arglist(*args, **kwargs)
+                gate.logger.log(level, "CALL {}{}", name, args_text)
                 try:
-                    ret = func(*args, **kwargs)
+                    ret = target(*args, **kwargs)
                 except Exception as e:
-                    log(level, f"EXCEPTION {e} FROM {func.__module__}.{func.__name__}" + arglist(*args, **kwargs))
+                    gate.logger.log(level, "EXCEPTION {} FROM {}{}", e, name, args_text)
                     raise e
-                log(level, f"RET FROM {func.__module__}.{func.__name__}" + arglist(*args, **kwargs) + f"VALUE {ret}")
+                gate.logger.log(level, "RET FROM {}{}VALUE {}", name, args_text, _short_repr(ret))
                 return ret
 
             return wrapper
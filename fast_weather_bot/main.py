@@ -1,44 +1,102 @@
 import asyncio
+import dataclasses
+import functools
 import signal
-import threading
-import time
+from typing import Optional
 
-import schedule
-
-from fast_weather_bot.bot import Bot
 from fast_weather_bot.config import Config
-from log import logger
-
+from fast_weather_bot.metrics import REGISTRY, MetricsServer
+from log import logger, setup as setup_logging
 
-def scheduler_thread(scheduler: schedule.Scheduler, lock: threading.Lock) -> None:
-    while not lock.locked():
-        logger.trace("Scheduler tick")
-        scheduler.run_pending()
-        time.sleep(1)
 
+async def main(cfg: Config, worker: Optional[int] = None):
+    """
+    :param worker: Номер воркера, если бот запущен супервизором
+    """
+    setup_logging(cfg.log_level, cfg.log_levels, cfg.log_json)
+    # Бот нужен только процессам, которые обрабатывают обновления, супервизору - нет
+    from fast_weather_bot.bot import Bot
+    from fast_weather_bot.scheduler import Scheduler
 
-async def main():
-    cfg = Config.load()
-    scheduler = schedule.Scheduler()
+    send_rate = cfg.send_rate
+    metrics_port = cfg.metrics_port
+    snapshot_path = cfg.snapshot_path
+    if worker is not None:
+        # Лимит Telegram общий на бота, а порт метрик и снимок у каждого процесса свои
+        send_rate /= cfg.shard.workers
+        metrics_port = metrics_port and metrics_port + 1 + worker
+        snapshot_path = snapshot_path and f"{snapshot_path}.{worker}"
+    scheduler = Scheduler(tz=cfg.timezone)
     telegram_bot = Bot(token=cfg.telegram_token, scheduler=scheduler, weather_api_token=cfg.weather_api_token,
-                       coordinates=cfg.coordinates)
-    lock = threading.Lock()
+                       coordinates=cfg.coordinates, weather_cache=cfg.weather_cache,
+                       weather_http=cfg.weather_http, db_path=cfg.db_path, fsm=cfg.fsm,
+                       alarm_interval=cfg.alarm_interval, telegram_api_url=cfg.telegram_api_url,
+                       send_rate=send_rate, chat_send_interval=cfg.chat_send_interval,
+                       webhook=cfg.webhook, weather_rate=cfg.weather_rate, forecast_days=cfg.forecast_days,
+                       forecast_hours=cfg.forecast_hours, alarm_horizon=cfg.alarm_horizon,
+                       weather_api_url=cfg.weather_api_url, weather_fallback=cfg.weather_fallback,
+                       weather_hedge=cfg.weather_hedge, prefetch=cfg.prefetch,
+                       shard=dataclasses.replace(cfg.shard, index=worker), snapshot_path=snapshot_path,
+                       inline=cfg.inline, history=cfg.history)
 
     def stop_bot():
-        nonlocal lock
         logger.info("Stop bot...")
         telegram_bot.stop()
-        asyncio.run_coroutine_threadsafe(telegram_bot.close(), loop)
-        logger.info("Bye")
-        lock.acquire()
-        exit()
 
     loop = asyncio.get_event_loop()
     loop.add_signal_handler(signal.SIGINT, stop_bot)
     loop.add_signal_handler(signal.SIGTERM, stop_bot)
-    loop.run_in_executor(None, scheduler_thread, scheduler, lock)
-    await telegram_bot.start()
+    metrics = MetricsServer(REGISTRY, cfg.metrics_host, metrics_port) if metrics_port else None
+    if metrics is not None:
+        await metrics.start()
+    scheduler.start()
+    try:
+        await telegram_bot.start()
+    finally:
+        await scheduler.stop()
+        if metrics is not None:
+            await metrics.stop()
+        await telegram_bot.close()
+        logger.info("Bye")
+
+
+def run_worker(index: int, cfg: Optional[Config] = None) -> None:
+    """
+    :param cfg: Конфиг супервизора. Без него воркер читает конфиг из окружения сам
+    """
+    # Ctrl+C получает вся группа процессов, воркеры останавливает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(main(cfg or Config.load(), index))
+
+
+async def supervise(cfg: Config):
+    setup_logging(cfg.log_level, cfg.log_levels, cfg.log_json)
+    from fast_weather_bot.supervisor import Supervisor
+
+    supervisor = Supervisor(functools.partial(run_worker, cfg=cfg), cfg.shard, cfg.telegram_token, telegram_api_url=cfg.telegram_api_url,
+                            webhook=cfg.webhook)
+
+    def stop_supervisor():
+        logger.info("Stop workers...")
+        supervisor.stop()
+
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGINT, stop_supervisor)
+    loop.add_signal_handler(signal.SIGTERM, stop_supervisor)
+    metrics = MetricsServer(REGISTRY, cfg.metrics_host, cfg.metrics_port) if cfg.metrics_port else None
+    if metrics is not None:
+        await metrics.start()
+    try:
+        await supervisor.run()
+    finally:
+        if metrics is not None:
+            await metrics.stop()
+        logger.info("Bye")
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    config = Config.load()
+    if config.shard.workers > 1:
+        asyncio.run(supervise(config))
+    else:
+        asyncio.run(main(config))
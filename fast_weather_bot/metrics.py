@@ -0,0 +1,208 @@
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, label_names: Sequence[str]):
+        self.name = name
+        self.help = help_
+        self.label_names = tuple(label_names)
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def _new(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Дочерняя метрика для набора меток. Её стоит получить один раз и сохранить, а не искать при каждом замере
+        """
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new()
+        return child
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, label_names: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help_, label_names)
+        self.buckets = tuple(buckets)
+
+    def _new(self) -> Histogram:
+        return Histogram(self.buckets)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for values, h in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), h.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = self._label_text(values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {h.sum}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {h.count}")
+        return lines
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def _new(self) -> Counter:
+        return Counter()
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for values, c in self.children.items():
+            lines.append(f"{self.name}{self._label_text(values)} {c.value}")
+        return lines
+
+
+class CallbackFamily(_Family):
+    """
+    Значение читается из функции в момент выгрузки, поэтому на горячем пути ничего не стоит
+    """
+
+    def __init__(self, name: str, help_: str, func: Callable[[], float], kind: str):
+        super().__init__(name, help_, ())
+        self.func = func
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {self.func()}"]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+
+    def histogram(self, name: str, help_: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS,
+                  ) -> HistogramFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = HistogramFamily(name, help_, labels, buckets)
+        return family
+
+    def counter(self, name: str, help_: str, labels: Sequence[str] = ()) -> CounterFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = CounterFamily(name, help_, labels)
+        return family
+
+    def gauge(self, name: str, help_: str, func: Callable[[], float], kind: str = "gauge") -> None:
+        """
+        Регистрирует метрику, значение которой берётся из func. Повторная регистрация заменяет функцию
+        """
+        self._families[name] = CallbackFamily(name, help_, func, kind)
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Timer:
+    """
+    Замеряет длительность блока в гистограмму и считает исключения
+    """
+    __slots__ = ("histogram", "errors", "start")
+
+    def __init__(self, histogram: Histogram, errors: Optional[Counter] = None):
+        self.histogram = histogram
+        self.errors = errors
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+        # CancelledError - не ошибка вызова, он наследуется от BaseException
+        if exc_type is not None and self.errors is not None and issubclass(exc_type, Exception):
+            self.errors.inc()
+
+
+class MetricsServer:
+    """
+    Отдаёт метрики в текстовом формате Prometheus по GET /metrics
+    """
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9100):
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._runner: Optional["web.AppRunner"] = None
+
+    async def _handle(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(body=self._registry.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self) -> None:
+        # aiohttp нужен, только если метрики отдаются, и не должен замедлять импорт
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,107 @@
+"""
+Настройки компонентов бота. Модуль не зависит от aiohttp, aiogram и numpy, поэтому конфиг можно прочитать,
+не загружая сами компоненты. Классы доступны и из модулей компонентов
+"""
+import os
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+@dataclass
+class HTTPOptions:
+    limit: int = 100  # Всего соединений в пуле
+    limit_per_host: int = 20  # Соединений с одним хостом
+    keepalive_timeout: float = 60  # Сколько секунд держать простаивающее соединение
+    dns_cache_ttl: int = 300  # Сколько секунд кэшировать ответы DNS
+    timeout: float = 10  # Таймаут запроса целиком в секундах
+    connect_timeout: float = 3  # Таймаут установки соединения в секундах
+
+
+@dataclass
+class CacheOptions:
+    grid_step: float = 0.05  # Размер ячейки сетки в градусах (~5 км)
+    current_ttl: float = 600  # Сколько секунд отдавать текущую погоду из кэша
+    forecast_ttl: float = 1800  # Сколько секунд отдавать прогноз из кэша
+    max_size: int = 10000  # Максимальное число ячеек в кэше
+    stale_ttl: float = 3600  # Сколько секунд после истечения ttl отдавать устаревший ответ, пока он обновляется в фоне
+    shared_path: Optional[str] = None  # Файл SQLite, через который процессы бота делятся ответами
+
+
+@dataclass
+class HedgeOptions:
+    quantile: float = 0.95  # Дублирующий запрос уходит, если первый дольше этого квантиля задержки провайдера
+    min_delay: float = 0.05  # Раньше этого дублирующий запрос не отправляется, в секундах
+    initial_delay: float = 1.0  # Задержка перед дублем, пока у провайдера мало замеров
+    window: int = 200  # По скольким последним запросам считается квантиль
+    ewma_alpha: float = 0.2  # Вес нового замера в скользящем среднем задержки
+    failures: int = 5  # После стольких ошибок подряд провайдер отключается
+    reset_timeout: float = 30  # Через сколько секунд отключённый провайдер получает пробный запрос
+
+
+@dataclass
+class PrefetchOptions:
+    lead: float = 300  # За сколько секунд до отправки обновлять прогноз
+    jitter: float = 240  # Разброс времени обновления: ячейки обновляются в разные моменты [lead, lead + jitter)
+
+
+@dataclass
+class StorageOptions:
+    ttl: float = 3600  # Через сколько секунд без активности диалог считается брошенным и удаляется
+    capacity: int = 100000  # Сколько диалогов держать в памяти
+    path: Optional[str] = None  # Файл SQLite для диалогов, вытесненных из памяти. None - вытесненные теряются
+
+
+@dataclass
+class WebhookOptions:
+    url: str  # Публичный адрес, на который Telegram шлёт обновления
+    secret: str  # Секрет, который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token
+    host: str = "0.0.0.0"
+    port: int = 8080
+    path: str = "/webhook"
+    queue_size: int = 1000  # Сколько обновлений может ждать обработки
+    workers: int = 16  # Сколько обновлений обрабатывается одновременно
+
+
+@dataclass
+class HistoryOptions:
+    path: Optional[str] = None  # Каталог истории, None - не записывать
+    interval: float = 60  # Как часто записывать полученные от провайдера ответы (с)
+    forecast_hours: int = 6  # На сколько часов вперёд записывать прогноз из каждого ответа
+
+
+@dataclass
+class InlineOptions:
+    cache_time: int = 60  # Сколько секунд Telegram может отдавать ответ на тот же запрос, не спрашивая бота
+    ttl: float = 60  # Сколько секунд хранить готовый ответ у себя
+    debounce: float = 0.1  # Сколько секунд ждать следующего нажатия клавиши, прежде чем искать ответ
+    places: int = 3  # Сколько городов показывать
+    max_size: int = 10000  # Сколько ответов хранить
+
+
+@lru_cache(maxsize=None)
+def _ring(nodes: int):
+    # Кольцо строится один раз на число воркеров, поэтому модуль sharding можно импортировать здесь
+    from fast_weather_bot.sharding import HashRing
+    return HashRing(nodes)
+
+
+@dataclass
+class ShardOptions:
+    workers: int = 1  # Сколько процессов-воркеров запускает супервизор, 1 - бот работает в одном процессе
+    socket_dir: str = ""  # Где воркеры слушают Unix-сокеты, по умолчанию во временном каталоге
+    queue_size: int = 1000  # Сколько обновлений может ждать отправки одному воркеру
+    index: Optional[int] = None  # Номер воркера, задаёт супервизор
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(self.socket_dir or tempfile.gettempdir(), f"weather-bot-{index}.sock")
+
+    def owner(self, chat_id: int) -> int:
+        return _ring(self.workers).owner(chat_id)
+
+    def owns(self, chat_id: int) -> bool:
+        """
+        Обслуживает ли этот процесс чат. Вне супервизора - любой
+        """
+        return self.index is None or self.owner(chat_id) == self.index
@@ -0,0 +1,268 @@
+import asyncio
+import datetime
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from loguru import logger
+
+from fast_weather_bot.metrics import REGISTRY
+
+Callback = Callable[..., Awaitable[Any]]
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 600.0)
+
+
+class Job:
+    __slots__ = ("deadline", "seq", "index", "callback", "args", "interval", "at", "tz", "name")
+
+    def __init__(self, deadline: float, seq: int, callback: Callback, args: tuple,
+                 interval: Optional[float] = None,
+                 at: Optional[datetime.time] = None,
+                 tz: Optional[datetime.tzinfo] = None,
+                 ):
+        self.deadline = deadline  # Unix-время ближайшего запуска
+        self.seq = seq
+        self.index = -1  # Позиция в куче, -1 если задача не запланирована
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.at = at
+        self.tz = tz
+        self.name = getattr(callback, "__name__", None) or repr(callback)
+
+    def __lt__(self, other: "Job") -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+    def __repr__(self) -> str:
+        when = f"every {self.interval}s" if self.interval is not None else f"daily at {self.at}"
+        return f"<Job {self.name}{self.args} {when}>"
+
+    @property
+    def scheduled(self) -> bool:
+        return self.index >= 0
+
+
+class LagStats:
+    """
+    Насколько позже назначенного времени запускались задачи
+    """
+    __slots__ = ("count", "total", "max", "last", "skipped")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.skipped = 0  # Пропущенные запуски, опоздавшие больше чем на misfire_grace
+
+    def observe(self, lag: float) -> None:
+        self.count += 1
+        self.total += lag
+        self.last = lag
+        if lag > self.max:
+            self.max = lag
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+def next_daily(at: datetime.time, after: float, tz: Optional[datetime.tzinfo] = None) -> float:
+    """
+    Unix-время первого наступления времени суток at строго после момента after.
+    Без tz используется локальный часовой пояс
+    """
+    now = datetime.datetime.fromtimestamp(after, tz)
+    candidate = datetime.datetime.combine(now.date(), at, tzinfo=tz)
+    if candidate.timestamp() <= after:
+        candidate = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), at, tzinfo=tz)
+    return candidate.timestamp()
+
+
+class Scheduler:
+    """
+    Планировщик задач внутри цикла событий. Задачи лежат в двоичной куче по времени запуска,
+    поэтому добавление и отмена стоят O(log n), а цикл просыпается только к ближайшему запуску
+    """
+
+    # Больше этого не спим, чтобы заметить перевод системных часов
+    max_sleep = 60.0
+
+    def __init__(self, tz: Optional[datetime.tzinfo] = None, misfire_grace: float = 600):
+        self._tz = tz
+        self._misfire_grace = misfire_grace
+        self._heap: List[Job] = []
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self.lag = LagStats()
+        self._lag_histogram = REGISTRY.histogram("scheduler_lag_seconds", "How late scheduled jobs fired",
+                                                 buckets=LAG_BUCKETS).labels()
+        self.lag_observers: List[Callable[[Job, float], None]] = []
+        # До какого момента запущены все наступившие задачи. Бот сохраняет его, чтобы после перезапуска
+        # догнать отправки, пропущенные за время простоя
+        self.checked: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def tz(self) -> Optional[datetime.tzinfo]:
+        return self._tz
+
+    # Операции над кучей. Каждая задача помнит свой индекс, поэтому её можно удалить из середины
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        heap[i].index = i
+        heap[j].index = j
+
+    def _sift_up(self, i: int) -> None:
+        heap = self._heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not heap[i] < heap[parent]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int) -> None:
+        heap = self._heap
+        n = len(heap)
+        while True:
+            smallest = i
+            left = 2 * i + 1
+            right = left + 1
+            if left < n and heap[left] < heap[smallest]:
+                smallest = left
+            if right < n and heap[right] < heap[smallest]:
+                smallest = right
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+    def _push(self, job: Job) -> Job:
+        job.index = len(self._heap)
+        self._heap.append(job)
+        self._sift_up(job.index)
+        if job.index == 0 and self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def _remove(self, job: Job) -> None:
+        i = job.index
+        last = len(self._heap) - 1
+        if i != last:
+            self._swap(i, last)
+        self._heap.pop()
+        job.index = -1
+        if i < len(self._heap):
+            self._sift_down(i)
+            self._sift_up(i)
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def every(self, interval: float, callback: Callback, *args, first: Optional[float] = None) -> Job:
+        """
+        Запускает callback(*args) каждые interval секунд
+        :param first: Unix-время первого запуска. По умолчанию через interval секунд
+        """
+        deadline = first if first is not None else time.time() + interval
+        return self._push(Job(deadline, self._next_seq(), callback, args, interval=interval))
+
+    def daily(self, at: datetime.time, callback: Callback, *args,
+              tz: Optional[datetime.tzinfo] = None,
+              since: Optional[float] = None,
+              ) -> Job:
+        """
+        Запускает callback(*args) каждый день в at по часовому поясу tz (по умолчанию - поясу планировщика)
+        :param since: Когда задача запускалась последний раз. Если с тех пор запуск был пропущен,
+                      но опоздание не больше misfire_grace, он будет выполнен сразу
+        """
+        tz = tz or self._tz
+        now = time.time()
+        # Из запусков, пропущенных за несколько дней, догнать можно только последний
+        since = now if since is None else max(since, now - 24 * 3600)
+        deadline = next_daily(at, since, tz)
+        return self._push(Job(deadline, self._next_seq(), callback, args, at=at, tz=tz))
+
+    def cancel(self, job: Job) -> None:
+        if job.scheduled and job.index < len(self._heap) and self._heap[job.index] is job:
+            self._remove(job)
+
+    def _reschedule(self, job: Job, now: float) -> None:
+        if job.interval is not None:
+            missed = max(0, int((now - job.deadline) // job.interval))
+            job.deadline += (missed + 1) * job.interval
+        else:
+            job.deadline = next_daily(job.at, max(now, job.deadline), job.tz)
+        job.seq = self._next_seq()
+        self._push(job)
+
+    def _fire(self, job: Job, now: float) -> None:
+        lag = now - job.deadline
+        if lag > self._misfire_grace:
+            self.lag.skipped += 1
+            logger.warning(f"Skip {job}: {lag:.1f}s late")
+            return
+        self.lag.observe(lag)
+        self._lag_histogram.observe(lag)
+        for observer in self.lag_observers:
+            observer(job, lag)
+        task = asyncio.ensure_future(job.callback(*job.args))
+        self._running.add(task)
+        task.add_done_callback(self._job_done)
+
+    def _job_done(self, task: asyncio.Future) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error("Scheduled job failed")
+
+    def run_pending(self, now: Optional[float] = None) -> int:
+        """
+        Запускает все задачи, время которых наступило
+        :return: Сколько задач было запущено
+        """
+        now = time.time() if now is None else now
+        fired = 0
+        heap = self._heap
+        while heap and heap[0].deadline <= now:
+            job = heap[0]
+            self._remove(job)
+            self._fire(job, now)
+            self._reschedule(job, now)
+            fired += 1
+        self.checked = now
+        return fired
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self.run_pending()
+            delay = self.max_sleep
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0].deadline - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
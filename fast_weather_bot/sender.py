@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.utils.exceptions import RetryAfter
+from loguru import logger
+
+SendFunc = Callable[..., Awaitable[Any]]
+
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+
+
+class Priority(IntEnum):
+    Interactive = 0  # Ответы на действия пользователя
+    Scheduled = 1  # Прогнозы по расписанию
+    Alarm = 2  # Оповещения о плохой погоде
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """
+        Через сколько секунд можно будет взять жетон
+        """
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    def take(self) -> None:
+        self._tokens -= 1
+
+
+class _Outgoing:
+    __slots__ = ("priority", "seq", "text", "reply_markup", "future", "attempts")
+
+    def __init__(self, priority: Priority, seq: int, text: str, reply_markup: Any, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.text = text
+        self.reply_markup = reply_markup
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other: "_Outgoing") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Chat:
+    __slots__ = ("pending", "next_at", "busy")
+
+    def __init__(self):
+        self.pending: List[_Outgoing] = []  # Куча по (priority, seq)
+        self.next_at = 0.0  # Раньше этого времени в чат не пишем
+        self.busy = False  # Отправка в чат уже идёт
+
+
+class Sender:
+    """
+    Очередь исходящих сообщений. Соблюдает общий лимит Telegram (token bucket) и паузу между сообщениями
+    в один чат, отдаёт предпочтение более важным сообщениям, склеивает накопившиеся сообщения одного чата
+    в одно и повторяет отправку после 429 Retry-After
+    """
+
+    def __init__(self, send: SendFunc,
+                 rate: float = 30,
+                 chat_interval: float = 1.0,
+                 max_attempts: int = 3,
+                 ):
+        self._send = send
+        self._bucket = TokenBucket(rate, rate)
+        self._chat_interval = chat_interval
+        self._max_attempts = max_attempts
+        self._chats: Dict[int, _Chat] = {}
+        self._ready: List[Tuple[int, int, int]] = []  # (priority, seq, chat_id) чатов, которым можно писать
+        self._waiting: List[Tuple[float, int]] = []  # (next_at, chat_id) чатов, ждущих паузы
+        self._seq = 0
+        self._size = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def send(self, chat_id: int, text: str, reply_markup: Any = None,
+             priority: Priority = Priority.Interactive,
+             ) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь
+        :return: Future, который завершится после доставки. Ждать его не обязательно, ошибки попадут в лог
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._log_failure)
+        self._seq += 1
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        was_idle = not chat.pending and not chat.busy
+        heapq.heappush(chat.pending, _Outgoing(priority, self._seq, text, reply_markup, future))
+        self._size += 1
+        if was_idle:
+            self._schedule_chat(chat_id, chat, time.monotonic())
+        elif not chat.busy and chat.next_at <= time.monotonic():
+            heapq.heappush(self._ready, (priority, self._seq, chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to send message: {future.exception()}")
+
+    def _schedule_chat(self, chat_id: int, chat: _Chat, now: float) -> None:
+        if chat.busy:
+            return
+        if chat.next_at > now:
+            # Пустой чат тоже ждёт конца паузы, иначе следующее сообщение уйдёт без неё
+            heapq.heappush(self._waiting, (chat.next_at, chat_id))
+        elif chat.pending:
+            head = chat.pending[0]
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        else:
+            del self._chats[chat_id]
+
+    def _take_batch(self, chat: _Chat) -> List[_Outgoing]:
+        """
+        Забирает из чата первое сообщение и склеивает с ним следующие, пока хватает длины.
+        Клавиатура может быть только у последнего сообщения пачки
+        """
+        batch = [heapq.heappop(chat.pending)]
+        length = len(batch[0].text)
+        while chat.pending and batch[-1].reply_markup is None:
+            head = chat.pending[0]
+            if length + 2 + len(head.text) > MESSAGE_LIMIT:
+                break
+            batch.append(heapq.heappop(chat.pending))
+            length += 2 + len(head.text)
+        self._size -= len(batch)
+        return batch
+
+    def _next_chat(self, now: float) -> Optional[int]:
+        while self._waiting and self._waiting[0][0] <= now:
+            next_at, chat_id = heapq.heappop(self._waiting)
+            chat = self._chats.get(chat_id)
+            if chat is not None and chat.next_at == next_at:
+                self._schedule_chat(chat_id, chat, now)
+        while self._ready:
+            _, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            # В куче могут остаться устаревшие записи, настоящая - та, что указывает на голову очереди чата
+            if chat is not None and not chat.busy and chat.pending and chat.pending[0].seq == seq:
+                return chat_id
+        return None
+
+    async def _deliver(self, chat_id: int, chat: _Chat, batch: List[_Outgoing]) -> None:
+        text = "\n\n".join(item.text for item in batch)
+        try:
+            result = await self._send(chat_id, text, reply_markup=batch[-1].reply_markup)
+        except RetryAfter as e:
+            self.retried += 1
+            chat.next_at = time.monotonic() + e.timeout
+            for item in batch:
+                item.attempts += 1
+                if item.attempts >= self._max_attempts:
+                    self.failed += 1
+                    item.future.set_exception(e)
+                else:
+                    heapq.heappush(chat.pending, item)
+                    self._size += 1
+        except Exception as e:
+            self.failed += len(batch)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        else:
+            self.sent += 1
+            self.coalesced += len(batch) - 1
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            chat.busy = False
+            self._schedule_chat(chat_id, chat, time.monotonic())
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            chat_id = self._next_chat(now)
+            if chat_id is None:
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._bucket.delay(now)
+            if delay > 0:
+                # Чат возвращается в очередь: пока ждём жетон, может прийти что-то важнее
+                head = self._chats[chat_id].pending[0]
+                heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+                await asyncio.sleep(delay)
+                continue
+            self._bucket.take()
+            chat = self._chats[chat_id]
+            chat.busy = True
+            chat.next_at = now + self._chat_interval
+            task = asyncio.ensure_future(self._deliver(chat_id, chat, self._take_batch(chat)))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5) -> None:
+        """
+        Дожидается отправки очереди (не дольше timeout секунд) и останавливает отправку
+        """
+        deadline = time.monotonic() + timeout
+        while (self._size or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,60 @@
+import asyncio
+import bisect
+import struct
+import zlib
+from typing import Any, Dict
+
+from fast_weather_bot.options import ShardOptions
+
+# Кадр между супервизором и воркером: длина и JSON обновления
+_FRAME = struct.Struct(">I")
+
+
+class HashRing:
+    """
+    Консистентное хэширование: у каждого узла replicas точек на кольце, ключ достаётся узлу с ближайшей
+    точкой по часовой стрелке. При изменении числа узлов переезжает только часть ключей
+    """
+
+    def __init__(self, nodes: int, replicas: int = 100):
+        points = sorted((self._hash(f"node-{node}-{i}"), node) for node in range(nodes) for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return zlib.crc32(key.encode())
+
+    def owner(self, key: int) -> int:
+        i = bisect.bisect(self._points, self._hash(str(key)))
+        return self._nodes[i % len(self._nodes)]
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """
+    Чат, к которому относится обновление Telegram. Для обновлений без чата - пользователь,
+    для совсем пустых - update_id, чтобы они распределялись равномерно
+    """
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat is not None:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user is not None:
+            return user["id"]
+    return update.get("update_id", 0)
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    :raises asyncio.IncompleteReadError: Если соединение закрылось
+    """
+    size, = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    return await reader.readexactly(size)
+
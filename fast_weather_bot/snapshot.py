@@ -0,0 +1,106 @@
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from fast_weather_bot.weather_api.grid import Cell, cell_key, key_cell
+from fast_weather_bot.weather_api.shared import Decoded
+
+MAGIC = b"WBSNAP"
+VERSION = 1
+
+# Заголовок: магия, версия, время создания, число ячеек погоды, смещение и длина состояния оповещений
+_HEADER = struct.Struct("<6sHdIQI")
+# Индекс погоды, отсортированный по ключу ячейки: данные ячейки лежат в файле по offset
+_INDEX = np.dtype([("key", "<i8"), ("fetched_at", "<f8"), ("offset", "<u8"), ("length", "<u4")])
+
+
+def write(path: str, weather: Iterable[Tuple[Cell, float, Decoded]], alarms: Dict[int, Sequence[str]]) -> int:
+    """
+    Записывает снимок: разобранную погоду по ячейкам (время получения - time.time()) и правила оповещения,
+    о срабатывании которых чатам уже сообщили. Файл заменяется целиком, недописанный снимок не читается
+    :return: Размер файла в байтах
+    """
+    items = sorted(((cell_key(cell), fetched_at, pickle.dumps(decoded, pickle.HIGHEST_PROTOCOL))
+                    for cell, fetched_at, decoded in weather), key=lambda item: item[0])
+    index = np.zeros(len(items), dtype=_INDEX)
+    offset = _HEADER.size + index.nbytes
+    for i, (key, fetched_at, data) in enumerate(items):
+        index[i] = (key, fetched_at, offset, len(data))
+        offset += len(data)
+    alarm_data = pickle.dumps({chat_id: tuple(rules) for chat_id, rules in alarms.items()},
+                              pickle.HIGHEST_PROTOCOL)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, time.time(), len(items), offset, len(alarm_data)))
+        f.write(index.tobytes())
+        for _, _, data in items:
+            f.write(data)
+        f.write(alarm_data)
+    os.replace(tmp, path)
+    return offset + len(alarm_data)
+
+
+class Snapshot:
+    """
+    Снимок, отображённый в память. Открывается за время чтения заголовка, погода ячейки разбирается
+    только при обращении к ней
+    """
+
+    def __init__(self, path: str):
+        """
+        :raises ValueError: Если файл не снимок или снимок другой версии
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < _HEADER.size:
+                raise ValueError("Snapshot is truncated")
+            magic, version, self.created, count, self._alarms_offset, self._alarms_length = \
+                _HEADER.unpack_from(self._mmap)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Unsupported snapshot {magic!r} version {version}")
+            self._index = np.frombuffer(self._mmap, dtype=_INDEX, count=count, offset=_HEADER.size)
+        except (ValueError, struct.error):
+            self._mmap.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+    def get(self, cell: Cell, max_age: float) -> Optional[Tuple[float, Decoded]]:
+        """
+        :return: Время получения ответа (time.time()) и сам ответ, если он моложе max_age секунд
+        """
+        key = cell_key(cell)
+        i = int(np.searchsorted(self._index["key"], key))
+        if i == len(self._index) or self._index["key"][i] != key:
+            return None
+        _, fetched_at, offset, length = self._index[i].tolist()
+        if time.time() - fetched_at >= max_age:
+            return None
+        return fetched_at, pickle.loads(self._mmap[offset:offset + length])
+
+    def items(self, max_age: float) -> Iterator[Tuple[Cell, float, Decoded]]:
+        """
+        Ответы моложе max_age секунд: ячейка, время получения, ответ
+        """
+        fresh = self._index[self._index["fetched_at"] > time.time() - max_age]
+        for key, fetched_at, offset, length in fresh.tolist():
+            yield key_cell(key), fetched_at, pickle.loads(self._mmap[offset:offset + length])
+
+    def alarms(self) -> Dict[int, Tuple[str, ...]]:
+        return pickle.loads(self._mmap[self._alarms_offset:self._alarms_offset + self._alarms_length])
+
+    def close(self) -> None:
+        # Массив индекса ссылается на память mmap, без него mmap не закрыть
+        self._index = None
+        self._mmap.close()
@@ -0,0 +1,238 @@
+import asyncio
+import hmac
+import multiprocessing
+import time
+from multiprocessing.process import BaseProcess
+from typing import Callable, List, Optional
+
+import aiohttp
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from aiohttp import web
+from loguru import logger
+
+from fast_weather_bot.metrics import REGISTRY
+from fast_weather_bot.sharding import ShardOptions, encode_frame, update_chat_id
+from fast_weather_bot.webhook import WebhookOptions, SECRET_HEADER
+from fast_weather_bot.weather_api.jsonlib import loads, dumps
+
+
+class Supervisor:
+    """
+    Запускает бота в нескольких процессах. Супервизор сам получает обновления Telegram (long polling'ом
+    или через webhook) и раздаёт их воркерам через Unix-сокеты: чат всегда попадает к одному воркеру
+    по консистентному хэшу chat_id. Упавший воркер перезапускается, расписания и оповещения своих чатов
+    он восстанавливает из общей базы, а обновления на время перезапуска копятся в очереди
+    """
+
+    restart_delay = 1.0
+    max_restart_delay = 30.0
+    # Воркер, который проработал дольше, считается здоровым, и задержка перезапуска сбрасывается
+    healthy_uptime = 60.0
+    poll_timeout = 25
+
+    def __init__(self, target: Callable[[int], None], shard: ShardOptions, token: str,
+                 telegram_api_url: Optional[str] = None,
+                 webhook: Optional[WebhookOptions] = None,
+                 ):
+        """
+        :param target: Функция, которая запускает воркер с номером из аргумента. Выполняется в новом процессе
+        """
+        self._target = target
+        self._shard = shard
+        self._token = token
+        self._server = TelegramAPIServer.from_base(telegram_api_url) if telegram_api_url else TELEGRAM_PRODUCTION
+        self._webhook = webhook
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[BaseProcess]] = [None] * shard.workers
+        self._started_at = [0.0] * shard.workers
+        self._next_start = [0.0] * shard.workers
+        self._delays = [self.restart_delay] * shard.workers
+        self._queues: List[asyncio.Queue] = []
+        self._stopped: Optional[asyncio.Event] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.routed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _register_metrics(self) -> None:
+        REGISTRY.gauge("supervisor_updates_routed_total", "Updates passed to workers", lambda: self.routed,
+                       kind="counter")
+        REGISTRY.gauge("supervisor_updates_rejected_total", "Webhook updates rejected because a worker queue is full",
+                       lambda: self.rejected, kind="counter")
+        REGISTRY.gauge("supervisor_restarts_total", "Worker processes restarted", lambda: self.restarts,
+                       kind="counter")
+        REGISTRY.gauge("supervisor_queue_depth", "Updates waiting for workers",
+                       lambda: sum(queue.qsize() for queue in self._queues))
+        REGISTRY.gauge("supervisor_workers_alive", "Running worker processes",
+                       lambda: sum(p is not None and p.is_alive() for p in self._processes))
+
+    # Процессы
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(target=self._target, args=(index,), name=f"weather-bot-{index}")
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    async def _watch(self) -> None:
+        while True:
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    # Воркер, который падает сразу после запуска, перезапускается всё реже
+                    if now - self._started_at[index] >= self.healthy_uptime:
+                        self._delays[index] = self.restart_delay
+                    else:
+                        self._delays[index] = min(self._delays[index] * 2, self.max_restart_delay)
+                    self._next_start[index] = now + self._delays[index]
+                    self._processes[index] = None
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, "
+                                 f"restarting in {self._delays[index]:.0f}s")
+                elif now >= self._next_start[index]:
+                    self.restarts += 1
+                    self._spawn(index)
+            await asyncio.sleep(0.5)
+
+    async def _terminate(self, timeout: float) -> None:
+        processes = [p for p in self._processes if p is not None and p.is_alive()]
+        for process in processes:
+            process.terminate()
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            await loop.run_in_executor(None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, killing")
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+
+    # Доставка воркерам
+
+    async def _forward(self, index: int) -> None:
+        """
+        Держит соединение с воркером и отправляет ему обновления из его очереди. Пока воркер недоступен,
+        обновления ждут в очереди
+        """
+        queue = self._queues[index]
+        path = self._shard.socket_path(index)
+        payload: Optional[bytes] = None
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(path)
+            except OSError:
+                await asyncio.sleep(0.2)
+                continue
+            try:
+                while True:
+                    if payload is None:
+                        payload = await queue.get()
+                    writer.write(encode_frame(payload))
+                    await writer.drain()
+                    payload = None
+            except OSError as e:
+                logger.warning(f"Lost connection to worker {index}: {e!r}")
+            finally:
+                writer.close()
+
+    def _queue_for(self, update: dict) -> asyncio.Queue:
+        return self._queues[self._shard.owner(update_chat_id(update))]
+
+    # Получение обновлений
+
+    async def _call(self, method: str, **params) -> dict:
+        async with self._session.post(self._server.api_url(self._token, method), json=params) as response:
+            result = loads(await response.read())
+        if not result.get("ok"):
+            raise RuntimeError(f"{method} failed: {result.get('description')}")
+        return result["result"]
+
+    async def _poll(self) -> None:
+        offset: Optional[int] = None
+        logger.info("Polling for updates")
+        while True:
+            try:
+                if offset is None:
+                    # Как и бот в одном процессе, накопившиеся за время простоя обновления пропускаем
+                    updates = await self._call("getUpdates", offset=-1, timeout=0)
+                    offset = updates[-1]["update_id"] + 1 if updates else 0
+                    continue
+                updates = await self._call("getUpdates", offset=offset, timeout=self.poll_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+                logger.error(f"Failed to get updates: {e!r}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                # Очередь воркера полна - ждём, новые обновления пока остаются у Telegram
+                await self._queue_for(update).put(dumps(update))
+                self.routed += 1
+                offset = update["update_id"] + 1
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self._webhook.secret):
+            return web.Response(status=403)
+        payload = await request.read()
+        try:
+            queue = self._queue_for(loads(payload))
+        except (ValueError, TypeError, KeyError):
+            return web.Response(status=400)
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=503)
+        self.routed += 1
+        return web.Response()
+
+    async def _serve_webhook(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post(self._webhook.path, self._handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self._webhook.host, self._webhook.port).start()
+        await self._call("setWebhook", url=self._webhook.url, secret_token=self._webhook.secret,
+                         drop_pending_updates=True)
+        logger.info(f"Listening for webhook on {self._webhook.host}:{self._webhook.port}{self._webhook.path}")
+        return runner
+
+    async def run(self, drain_timeout: float = 5, stop_timeout: float = 15) -> None:
+        """
+        Работает до вызова stop. При остановке даёт воркерам забрать накопленные обновления и завершает
+        их по SIGTERM, чтобы они сохранили настройки чатов
+        """
+        self._stopped = asyncio.Event()
+        self._queues = [asyncio.Queue(self._shard.queue_size) for _ in range(self._shard.workers)]
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.poll_timeout + 10))
+        self._register_metrics()
+        for index in range(self._shard.workers):
+            self._spawn(index)
+        watch = asyncio.create_task(self._watch())
+        tasks = [watch] + [asyncio.create_task(self._forward(index)) for index in range(self._shard.workers)]
+        runner = intake = None
+        try:
+            if self._webhook is not None:
+                runner = await self._serve_webhook()
+            else:
+                tasks.append(asyncio.create_task(self._poll()))
+                intake = tasks[-1]
+            await self._stopped.wait()
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+            if intake is not None:
+                intake.cancel()
+            deadline = time.monotonic() + drain_timeout
+            while any(queue.qsize() for queue in self._queues) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            watch.cancel()
+            await self._terminate(stop_timeout)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._session.close()
+
+    def stop(self) -> None:
+        if self._stopped is not None:
+            self._stopped.set()
@@ -11,6 +11,7 @@ wind_direction2arrow: Dict[WindDirection, str] = {
     WindDirection.S: "⬇️",
     WindDirection.SW: "↙️",
     WindDirection.W: "⬅️",
+    WindDirection.C: "⏺",
 }
 
 wind_direction2text: Dict[WindDirection, str] = {
@@ -22,6 +23,7 @@ wind_direction2text: Dict[WindDirection, str] = {
     WindDirection.S: "Ю",
     WindDirection.SW: "ЮЗ",
     WindDirection.W: "З",
+    WindDirection.C: "штиль",
 }
 
 day_part2text: Dict[DayPart, str] = {
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+from fast_weather_bot.alarm import AlarmEngine, AlarmRule, CompiledRules, BAD_WEATHER, find_bad_weather
+from fast_weather_bot.entity import Coordinates, WeatherCondition, WindDirection
+from fast_weather_bot.scheduler import Scheduler
+from fast_weather_bot.weather_api.hourly import HourlyForecast
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class FakeForecastAPI:
+    def __init__(self, condition: WeatherCondition):
+        self.condition = condition
+        self.calls = 0
+
+    async def hourly(self, coordinates: Coordinates):
+        self.calls += 1
+        return hourly([self.condition] * 24)
+
+
+def hourly(conditions, start=None) -> HourlyForecast:
+    start = int(time.time()) // 3600 * 3600 if start is None else start
+    return HourlyForecast.from_rows((start + i * 3600, 5, 0, 0, 1, WindDirection.N.value, 750, 50, condition.value)
+                                    for i, condition in enumerate(conditions))
+
+
+@pytest.mark.asyncio
+async def test_one_fetch_per_cell():
+    scheduler = Scheduler()
+    api = FakeForecastAPI(WeatherCondition.Rain)
+    notified = []
+
+    async def notify(chat_ids, rule, forecast):
+        notified.extend(chat_ids)
+
+    engine = AlarmEngine(scheduler, api, notify, interval=5, grid_step=1)
+    for chat_id in range(10):
+        engine.subscribe(chat_id, Coordinates(lat=55.5, lon=37.5))
+    engine.subscribe(100, Coordinates(lat=10.5, lon=10.5))
+    assert (len(engine), engine.cells, len(scheduler)) == (11, 2, 2)
+
+    for job in list(scheduler._heap):
+        await job.callback(*job.args)
+    assert api.calls == 2
+    assert sorted(notified) == list(range(10)) + [100]
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_cancels_cell_job():
+    scheduler = Scheduler()
+    engine = AlarmEngine(scheduler, FakeForecastAPI(WeatherCondition.Clear), None, grid_step=1)
+    engine.subscribe(1, Coordinates(lat=55.5, lon=37.5))
+    engine.subscribe(2, Coordinates(lat=55.5, lon=37.5))
+    engine.subscribe(2, Coordinates(lat=1.5, lon=1.5))
+    assert engine.cells == 2
+    engine.unsubscribe(1)
+    engine.unsubscribe(2)
+    assert (len(engine), engine.cells, len(scheduler)) == (0, 0, 0)
+
+
+def test_find_bad_weather_in_horizon():
+    start = 1634418000
+    forecast = hourly([WeatherCondition.Clear] * 5 + [WeatherCondition.Rain] * 3 + [WeatherCondition.Clouds], start)
+    bad = find_bad_weather(forecast, start + 1800, horizon=12)
+    assert bad.time.tolist() == [start + h * 3600 for h in (5, 6, 7)]
+    assert find_bad_weather(forecast, start + 1800, horizon=4) is None
+
+
+async def run_jobs(scheduler):
+    for job in list(scheduler._heap):
+        await job.callback(*job.args)
+
+
+@pytest.mark.asyncio
+async def test_edge_triggered():
+    scheduler = Scheduler()
+    api = FakeForecastAPI(WeatherCondition.Rain)
+    notified = []
+
+    async def notify(chat_ids, rule, forecast):
+        notified.append((sorted(chat_ids), str(rule)))
+
+    engine = AlarmEngine(scheduler, api, notify, grid_step=1)
+    snow = AlarmRule.parse("снег")
+    engine.subscribe(1, Coordinates(lat=55.5, lon=37.5))
+    engine.subscribe(2, Coordinates(lat=55.5, lon=37.5), [BAD_WEATHER, snow])
+    await run_jobs(scheduler)
+    assert notified == [([1, 2], "осадки")]
+    assert engine.rules == 2
+
+    # Пока правило выполняется, повторов нет, новый подписчик узнаёт о нём один раз
+    notified.clear()
+    await run_jobs(scheduler)
+    engine.subscribe(3, Coordinates(lat=55.5, lon=37.5))
+    await run_jobs(scheduler)
+    await run_jobs(scheduler)
+    assert notified == [([3], "осадки")]
+
+    # После того как правило перестало выполняться, оно снова срабатывает для всех
+    notified.clear()
+    api.condition = WeatherCondition.Clear
+    await run_jobs(scheduler)
+    api.condition = WeatherCondition.Snow
+    await run_jobs(scheduler)
+    assert sorted(notified) == [([1, 2, 3], "осадки"), ([2], "снег")]
+    assert engine.fired == 4
+
+
+@pytest.mark.asyncio
+async def test_restore_notified():
+    scheduler = Scheduler()
+    api = FakeForecastAPI(WeatherCondition.Rain)
+    notified = []
+
+    async def notify(chat_ids, rule, forecast):
+        notified.append((sorted(chat_ids), str(rule)))
+
+    engine = AlarmEngine(scheduler, api, notify, grid_step=1)
+    engine.subscribe(1, Coordinates(lat=55.5, lon=37.5))
+    engine.subscribe(2, Coordinates(lat=55.5, lon=37.5))
+    await run_jobs(scheduler)
+    engine.subscribe(3, Coordinates(lat=55.5, lon=37.5))
+    # Чату 3 о дожде ещё не сообщили
+    state = engine.notified()
+    assert state == {1: ("осадки",), 2: ("осадки",)}
+
+    # После перезапуска уже выполняющееся правило не срабатывает повторно
+    notified.clear()
+    scheduler = Scheduler()
+    engine = AlarmEngine(scheduler, api, notify, grid_step=1)
+    engine.restore({**state, 4: ("осадки",)})
+    for chat_id in (1, 2, 3):
+        engine.subscribe(chat_id, Coordinates(lat=55.5, lon=37.5))
+    assert engine.notified() == {1: ("осадки",), 2: ("осадки",), 4: ("осадки",)}
+    await run_jobs(scheduler)
+    assert notified == [([3], "осадки")]
+
+
+def test_parse_rule():
+    rule = AlarmRule.parse("Снег  T<-10,5 wind>15 22-7")
+    assert str(rule) == "снег t<-10.5 ветер>15 22-7"
+    assert rule == AlarmRule.parse(str(rule))
+    assert str(AlarmRule.parse("дождь снег морось гроза")) == str(BAD_WEATHER) == "осадки"
+    for text in ("", "7-22", "туман", "t=5", "25-3"):
+        with pytest.raises(ValueError):
+            AlarmRule.parse(text)
+
+
+def test_compiled_rules():
+    start = 1634342400  # 00:00 по UTC
+    forecast = HourlyForecast.from_rows(
+        (start + h * 3600, temperature, 0, 0, wind, WindDirection.N.value, 750, 50, condition.value)
+        for h, (temperature, wind, condition) in enumerate([(-15, 2, WeatherCondition.Snow),
+                                                            (-5, 20, WeatherCondition.Clear),
+                                                            (3, 5, WeatherCondition.Rain),
+                                                            (-12, 1, WeatherCondition.Clouds)]))
+    rules = CompiledRules([AlarmRule.parse(text) for text in ("t<-10", "ветер>15", "снег 1-24", "осадки 22-3")])
+    assert rules.evaluate(forecast).astype(int).tolist() == [[1, 0, 0, 1],
+                                                             [0, 1, 0, 0],
+                                                             [0, 0, 0, 0],
+                                                             [1, 0, 1, 0]]
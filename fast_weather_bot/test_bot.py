@@ -0,0 +1,142 @@
+import datetime
+import time
+
+import pytest
+from aiogram.types import Chat, Message
+
+from fast_weather_bot.bot import Bot, DAY
+from fast_weather_bot.entity import Coordinates, WeatherPoint, WeatherCondition, WindDirection
+from fast_weather_bot.history import HistoryOptions
+from fast_weather_bot.scheduler import Scheduler
+from fast_weather_bot.weather_api.grid import cell_of
+
+pytest_plugins = ('pytest_asyncio',)
+
+COORDINATES = Coordinates(lat=55.75, lon=37.62)
+
+
+def observation(t: float, temperature: float) -> WeatherPoint:
+    return WeatherPoint.construct(time=datetime.datetime.fromtimestamp(t), temperature=temperature, pressure=750,
+                                  condition=WeatherCondition.Clear, wind_speed=1, wind_direction=WindDirection.N,
+                                  humidity=50)
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id: int, text: str, *args, **kwargs) -> None:
+        self.sent.append((chat_id, text))
+
+
+class FakeWeatherAPI:
+    async def current(self, coordinates: Coordinates) -> WeatherPoint:
+        return observation(time.time(), 5)
+
+
+def message(text: str) -> Message:
+    return Message(message_id=1, date=int(time.time()), chat=Chat(id=1, type="private"), text=text)
+
+
+@pytest.fixture
+def make_bot(tmp_path):
+    bots = []
+
+    def make(history: bool = True) -> Bot:
+        bot = Bot("123:abc", Scheduler(), "token", COORDINATES, db_path=str(tmp_path / "chats.sqlite3"),
+                  history=HistoryOptions(path=str(tmp_path / "history") if history else None))
+        bot._chats.open()
+        bot._sender = FakeSender()
+        bot._weather_api = FakeWeatherAPI()
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        if bot._history is not None:
+            bot._history.close()
+
+
+def fill(bot: Bot, now: float) -> None:
+    # Наблюдения раз в час за три дня: сутки назад было 2℃, сейчас 5℃
+    cell = cell_of(COORDINATES, bot._grid_step)
+    bot._history.append((cell, t, (observation(t, 2 if t <= now - DAY else 5), (), None))
+                        for t in range(int(now) - 3 * DAY, int(now) + 1, 3600))
+
+
+@pytest.mark.asyncio
+async def test_history_disabled(make_bot):
+    bot = make_bot(history=False)
+    await bot._history_handler(message("/history"))
+    await bot._current_handler(message("/current"))
+    assert bot._sender.sent[0] == (1, "История погоды не ведётся")
+    assert "Вчера" not in bot._sender.sent[1][1]
+
+
+@pytest.mark.asyncio
+async def test_history_handler(make_bot):
+    bot = make_bot()
+    await bot._history_handler(message("/history"))
+    assert bot._sender.sent[-1] == (1, "Для этих координат история пока пуста")
+
+    fill(bot, time.time())
+    await bot._history_handler(message("/history"))
+    text = bot._sender.sent[-1][1]
+    assert text.startswith("За сутки: от 5 до 5℃") and "Вчера в это время: 2℃ (+3)" in text
+
+    await bot._history_handler(message("/history 2"))
+    lines = bot._sender.sent[-1][1].splitlines()
+    assert 2 <= len(lines) <= 3 and all(": от " in line for line in lines)
+
+    for args in ("0", "367", "неделя"):
+        await bot._history_handler(message(f"/history {args}"))
+        assert bot._sender.sent[-1][1].startswith("Укажите число дней от 1 до 366")
+
+
+@pytest.mark.asyncio
+async def test_current_compares_with_yesterday(make_bot):
+    bot = make_bot()
+    await bot._current_handler(message("/current"))
+    assert "Вчера" not in bot._sender.sent[-1][1]
+    fill(bot, time.time())
+    await bot._current_handler(message("/current"))
+    text = bot._sender.sent[-1][1]
+    assert "Температура: 5℃" in text and text.endswith("Вчера в это время: 2℃ (+3)\n")
+
+
+@pytest.mark.asyncio
+async def test_current_without_history(make_bot, monkeypatch):
+    bot = make_bot()
+    fill(bot, time.time())
+
+    def broken(*args, **kwargs):
+        raise OSError("disk error")
+
+    monkeypatch.setattr(bot._history, "scan", broken)
+    await bot._current_handler(message("/current"))
+    text = bot._sender.sent[-1][1]
+    assert "Температура: 5℃" in text and "Вчера" not in text
+
+
+@pytest.mark.asyncio
+async def test_restore_catches_up_missed_sends(make_bot):
+    bot = make_bot(history=False)
+    now = time.time()
+    t = datetime.datetime.fromtimestamp(now - 180).time().replace(second=0, microsecond=0)
+    settings = bot._chats.get(1)
+    settings.add_time(t)
+    bot._chats.save(settings)
+    await bot._chats.flush()
+
+    # Без сохранённого момента отправка, время которой прошло, ждёт следующего дня
+    await bot._restore_jobs()
+    assert bot._schedule_jobs[1, t].deadline > now
+    bot._scheduler.cancel(bot._schedule_jobs.pop((1, t)))
+
+    # Бот остановился за 10 минут до перезапуска: пропущенная отправка выполнится сразу
+    bot._chats.set_meta("schedule_checked", repr(now - 600))
+    await bot._restore_jobs()
+    assert bot._schedule_jobs[1, t].deadline < now
+    bot._scheduler.checked = now
+    await bot._save_schedule_checkpoint()
+    assert bot._chats.get_meta("schedule_checked") == repr(now)
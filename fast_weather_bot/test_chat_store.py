@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+from fast_weather_bot.chat_store import ChatStore
+from fast_weather_bot.entity import Coordinates
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_settings_persist(tmp_path):
+    path = str(tmp_path / "chats.sqlite3")
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    settings = store.get(10)
+    assert (settings.lat, settings.lon, settings.alarm) == (1, 2, False)
+    settings.coordinates = Coordinates(lat=55.8, lon=37.6)
+    settings.alarm = True
+    settings.add_time(datetime.time(8, 30))
+    settings.add_time(datetime.time(7, 0))
+    settings.rules = ("снег", "t<-10 7-22")
+    store.save(settings)
+    await store.close()
+
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    settings = store.get(10)
+    assert (settings.lat, settings.lon, settings.alarm) == (55.8, 37.6, True)
+    assert settings.schedule_times() == [datetime.time(7, 0), datetime.time(8, 30)]
+    assert settings.rules == ("снег", "t<-10 7-22")
+    assert [s.chat_id for s in store.iter_active()] == [10]
+    assert store.get(11).lat == 1
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_evicted_dirty_record_not_lost(tmp_path):
+    store = ChatStore(str(tmp_path / "chats.sqlite3"), Coordinates(lat=1, lon=2), cache_size=1)
+    await store.start()
+    first = store.get(1)
+    first.alarm = True
+    store.save(first)
+    store.get(2)
+    assert store.get(1).alarm
+    await store.flush()
+    store.get(2)
+    assert store.get(1).alarm
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_meta(tmp_path):
+    path = str(tmp_path / "chats.sqlite3")
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    assert store.get_meta("commands") is None
+    store.set_meta("commands", "abc")
+    await store.close()
+
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    assert store.get_meta("commands") == "abc"
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_read_during_flush(tmp_path):
+    store = ChatStore(str(tmp_path / "chats.sqlite3"), Coordinates(lat=1, lon=2), cache_size=1)
+    await store.start()
+    settings = store.get(1)
+    settings.alarm = True
+    store.save(settings)
+    await store.flush()
+    store.get(2)
+    # Пока фоновая запись держит соединение записи, чтение из базы не ждёт её
+    with store._lock:
+        assert store.get(1).alarm
+        assert [s.chat_id for s in store.iter_active()] == [1]
+        assert store.get_meta("commands") is None
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_close_during_write(tmp_path):
+    path = str(tmp_path / "chats.sqlite3")
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    started = threading.Event()
+    release = threading.Event()
+    write = store._write
+
+    def slow_write(rows):
+        started.set()
+        release.wait()
+        write(rows)
+
+    store._write = slow_write
+    settings = store.get(1)
+    settings.alarm = True
+    store.save(settings)
+    store._flush_needed.set()
+    await asyncio.get_running_loop().run_in_executor(None, started.wait)
+    # close отменяет фоновую запись, пока поток ещё пишет пачку
+    closing = asyncio.create_task(store.close())
+    try:
+        await asyncio.sleep(0.05)
+        assert not closing.done()
+    finally:
+        release.set()
+    await closing
+
+    store = ChatStore(path, Coordinates(lat=1, lon=2))
+    await store.start()
+    assert store.get(1).alarm
+    await store.close()
@@ -0,0 +1,51 @@
+import inspect
+import pickle
+
+import pytest
+
+from fast_weather_bot.entity import Coordinates, Forecast, DayPart, WeatherCondition, WindDirection, _Entity
+
+FIELDS = dict(part=DayPart.Day, min_temperature=-3, max_temperature=2, pressure=745,
+              condition=WeatherCondition.Snow, wind_speed=4, wind_direction=WindDirection.NW, humidity=87)
+
+
+def test_validation():
+    coordinates = Coordinates(lat="55.5", lon=37)
+    assert coordinates.lat == 55.5 and isinstance(coordinates.lon, float)
+    for bad in (dict(lat=91, lon=0), dict(lat="north", lon=0), dict(lat=1), dict(lat=1, lon=float("nan"))):
+        with pytest.raises(ValueError):
+            Coordinates(**bad)
+    with pytest.raises(TypeError):
+        Coordinates(lat=1, lon=2, alt=3)
+    with pytest.raises(ValueError):
+        Forecast(**dict(FIELDS, condition="snow"))
+
+
+def test_construct_matches_validated():
+    trusted = Forecast.construct(**FIELDS)
+    assert trusted.time is None
+    assert trusted == Forecast(**FIELDS)
+    assert hash(trusted) == hash(Forecast(**FIELDS))
+    assert repr(trusted).startswith("Forecast(time=None, part=<DayPart.Day")
+    with pytest.raises(TypeError):
+        Forecast.construct(**dict(FIELDS, alt=1))
+
+
+def test_immutable_and_hashable():
+    coordinates = Coordinates.construct(lat=1.0, lon=2.0)
+    with pytest.raises(AttributeError):
+        coordinates.lat = 3
+    assert {coordinates: 1}[Coordinates(lat=1, lon=2)] == 1
+    assert pickle.loads(pickle.dumps(coordinates)) == coordinates
+
+
+def test_generic_construct():
+    # Общая версия construct из _Entity и собранная для наследника создают одинаковые записи
+    generic = _Entity.construct.__func__
+    assert generic(Forecast, **FIELDS) == Forecast.construct(**FIELDS)
+    assert generic(Coordinates, lat=1.0, lon=2.0) == Coordinates.construct(lat=1.0, lon=2.0)
+    for bad in (dict(lat=1.0), dict(lat=1.0, lon=2.0, alt=3.0)):
+        with pytest.raises(TypeError):
+            generic(Coordinates, **bad)
+    assert type(_Entity.construct()) is _Entity
+    assert "set_lat(self, lat)" in inspect.getsource(Coordinates.construct)
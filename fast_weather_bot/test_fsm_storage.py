@@ -0,0 +1,115 @@
+import pytest
+
+from fast_weather_bot import fsm_storage
+from fast_weather_bot.fsm_storage import BoundedStorage, StorageOptions
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fsm_storage.time, "time", clock.time)
+    return clock
+
+
+@pytest.mark.asyncio
+async def test_state_and_data():
+    storage = BoundedStorage()
+    assert await storage.get_state(chat=1) is None
+    assert len(storage) == 0  # Чтение не создаёт записей
+    await storage.set_state(chat=1, state="AddScheduleEntryState:InputTime")
+    await storage.update_data(chat=1, data={"a": 1}, b="x")
+    assert await storage.get_state(chat=1) == "AddScheduleEntryState:InputTime"
+    data = await storage.get_data(chat=1)
+    assert data == {"a": 1, "b": "x"}
+    data["a"] = 2
+    assert (await storage.get_data(chat=1))["a"] == 1
+    await storage.finish(chat=1)
+    assert await storage.get_state(chat=1) is None
+    assert len(storage) == 0
+
+
+@pytest.mark.asyncio
+async def test_ttl(clock):
+    storage = BoundedStorage(StorageOptions(ttl=100))
+    await storage.set_state(chat=1, state="S")
+    clock.now += 50
+    await storage.set_state(chat=2, state="S")
+    clock.now += 60
+    assert await storage.get_state(chat=1) is None
+    assert await storage.get_state(chat=2) == "S"
+    clock.now += 200
+    await storage.set_state(chat=3, state="S")  # Запись запускает очистку брошенных диалогов
+    assert len(storage) == 1
+    assert storage.expired == 2
+
+
+@pytest.mark.asyncio
+async def test_capacity_without_disk():
+    storage = BoundedStorage(StorageOptions(capacity=2))
+    for chat in range(3):
+        await storage.set_state(chat=chat, state="S")
+    assert len(storage) == 2
+    assert storage.evicted == 1
+    assert await storage.get_state(chat=0) is None
+    assert await storage.get_state(chat=2) == "S"
+
+
+@pytest.mark.asyncio
+async def test_disk_spill_and_restore(tmp_path, clock):
+    options = StorageOptions(ttl=100, capacity=2, path=str(tmp_path / "fsm.sqlite3"))
+    storage = BoundedStorage(options)
+    for chat in range(3):
+        await storage.set_state(chat=chat, state=f"S{chat}")
+        await storage.set_data(chat=chat, data={"chat": chat})
+    assert len(storage) == 2
+    assert await storage.get_state(chat=0) == "S0"
+    assert await storage.get_data(chat=0) == {"chat": 0}
+    await storage.close()
+
+    storage = BoundedStorage(options)
+    assert [await storage.get_state(chat=chat) for chat in range(3)] == ["S0", "S1", "S2"]
+    clock.now += 200
+    await storage.close()
+    storage = BoundedStorage(options)
+    assert await storage.get_state(chat=1) is None
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_lookups(tmp_path, clock):
+    storage = BoundedStorage(StorageOptions(ttl=100, capacity=2, path=str(tmp_path / "fsm.sqlite3")))
+    statements = []
+    storage._conn.set_trace_callback(statements.append)
+    for chat in range(3):
+        await storage.set_state(chat=chat, state=f"S{chat}")
+
+    # Промах по диалогу, которого нет и на диске, не обращается к SQLite
+    statements.clear()
+    assert await storage.get_state(chat=10) is None
+    assert statements == []
+
+    # Диалог с диска читается без удаления строки, время его изменения обновляется. Вытеснение удаляет
+    # строку пачкой вместе с записью вытесненного диалога
+    clock.now += 80
+    assert await storage.get_state(chat=0) == "S0"
+    assert [s.split()[0] for s in statements] == ["SELECT", "BEGIN", "DELETE", "INSERT", "COMMIT"]
+    assert await storage.get_state(chat=0) == "S0"
+    assert len(statements) == 5
+
+    # Очистка удаляет брошенные диалоги из памяти и с диска, а вернувшийся пользователь сохраняет свой
+    clock.now += 70
+    await storage.set_state(chat=5, state="S5")
+    assert storage.expired == 2
+    assert await storage.get_state(chat=0) == "S0"
+    assert await storage.get_state(chat=1) is None and await storage.get_state(chat=2) is None
+    await storage.close()
@@ -0,0 +1,64 @@
+import pytest
+
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.gazetteer import Gazetteer, build, normalize, default_gazetteer
+from fast_weather_bot.weather_api import StubWeatherAPI
+
+pytest_plugins = ('pytest_asyncio',)
+
+CITIES = """# name	name_en	lat	lon	population	aliases
+Москва	Moscow	55.7558	37.6173	12600000
+Санкт-Петербург	Saint Petersburg	59.9343	30.3351	5400000	Питер
+Орёл	Oryol	52.9703	36.0635	300000	Orel
+Мурманск	Murmansk	68.9585	33.0827	270000
+Мытищи	Mytishchi	55.9116	37.7308	230000
+Сидней	Sydney	-33.8688	151.2093	5300000
+"""
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    source = tmp_path / "cities.tsv"
+    source.write_text(CITIES, encoding="utf-8")
+    target = str(tmp_path / "gazetteer.bin")
+    assert build(str(source), target) == 6
+    gazetteer = Gazetteer(target)
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_normalize():
+    assert normalize("Санкт-Петербург") == "sanktpeterburg"
+    assert normalize("Орёл") == normalize("орел") == "orel"
+
+
+def test_search(gazetteer):
+    assert [p.name for p in gazetteer.search("Москва")] == ["Москва"]
+    assert [p.name for p in gazetteer.search("moscow")] == ["Москва"]
+    assert [p.name for p in gazetteer.search("moskva")] == ["Москва"]
+    assert [p.name for p in gazetteer.search("питер")] == ["Санкт-Петербург"]
+    # По префиксу крупные города первыми
+    assert [p.name for p in gazetteer.search("м")] == ["Москва", "Мурманск", "Мытищи"]
+    assert [p.name for p in gazetteer.search("Мурманск")] == ["Мурманск"]
+
+
+def test_fuzzy_search(gazetteer):
+    assert [p.name for p in gazetteer.search("Масква")] == ["Москва"]
+    assert [p.name for p in gazetteer.search("Мурмансх")] == ["Мурманск"]
+    assert gazetteer.search("Лондон") == []
+
+
+def test_nearest(gazetteer):
+    assert gazetteer.nearest(Coordinates(lat=55.9, lon=37.7)).name == "Мытищи"
+    assert gazetteer.nearest(Coordinates(lat=-30, lon=150)).name == "Сидней"
+    assert gazetteer.nearest(Coordinates(lat=0, lon=-170), max_distance_km=500) is None
+    place = gazetteer.nearest(Coordinates(lat=59.9, lon=30.3))
+    assert (place.coordinates.lat, place.coordinates.lon) == (59.9343, 30.3351)
+
+
+@pytest.mark.asyncio
+async def test_bundled_coords_by_city():
+    assert len(default_gazetteer()) > 100
+    coordinates = await StubWeatherAPI().coords_by_city("Новосибирск")
+    assert abs(coordinates.lat - 55.0) < 0.1 and abs(coordinates.lon - 82.9) < 0.1
+    assert await StubWeatherAPI().coords_by_city("Абырвалг") is None
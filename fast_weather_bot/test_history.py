@@ -0,0 +1,118 @@
+import datetime
+import os
+
+import numpy as np
+
+from fast_weather_bot.entity import WeatherPoint, WeatherCondition, WindDirection
+from fast_weather_bot.history import History, FORECAST
+from fast_weather_bot.weather_api.hourly import HourlyForecast, HOUR
+
+DAY = 24 * HOUR
+# 2027-01-15 08:00 UTC
+NOW = 1_800_000_000 // DAY * DAY + 8 * HOUR
+
+
+def response(t: float, temperature: float) -> tuple:
+    current = WeatherPoint.construct(time=datetime.datetime.fromtimestamp(t), temperature=temperature,
+                                     pressure=750, condition=WeatherCondition.Rain, wind_speed=2.5,
+                                     wind_direction=WindDirection.N, humidity=80)
+    hourly = HourlyForecast.from_rows((int(t) // HOUR * HOUR + i * HOUR, temperature + i, 0, 0, 1, 0, 750, 50, 1)
+                                      for i in range(24))
+    return current, (), hourly
+
+
+def fill(history: History, hours: int) -> None:
+    # Каждые 10 минут ответ для двух ячеек, наблюдение повторяется в двух ответах подряд
+    for i in range(hours * 6):
+        t = NOW + i // 2 * 1200
+        history.append([((1, -2), NOW + i * 600, response(t, i // 2 % 20)), ((3, 4), NOW + i * 600, response(t, 100))])
+
+
+def test_append_and_scan(tmp_path):
+    history = History(str(tmp_path), forecast_hours=6)
+    fill(history, 48)
+    observations = history.scan((1, -2), NOW, NOW + DAY)
+    assert len(observations) == 72
+    assert np.all(np.diff(observations.time) == 1200)
+    assert observations.temperature[:3].tolist() == [0, 1, 2]
+    assert history.scan((3, 4), NOW, NOW + DAY).temperature.tolist() == [100] * 72
+    assert len(history.scan((5, 6), NOW, NOW + DAY)) == 0
+
+    # Из прогнозов на один час остаётся последний полученный
+    forecast = history.scan((1, -2), NOW, NOW + 3 * DAY, kind=FORECAST)
+    assert np.all(np.diff(forecast.time) == HOUR)
+    assert forecast.time[0] == NOW and forecast.time[-1] == NOW + 53 * HOUR
+    last = history.scan((1, -2), NOW + 47 * HOUR, NOW + 48 * HOUR)
+    assert forecast.temperature[47] == last.temperature[-1]
+    history.close()
+
+
+def test_compaction(tmp_path):
+    history = History(str(tmp_path), writer=1)
+    fill(history, 48)
+    before = history.scan((1, -2), NOW, NOW + 2 * DAY)
+    forecast = history.scan((1, -2), NOW, NOW + 3 * DAY, kind=FORECAST)
+
+    # Закрытые часы сжимаются в сегменты дней, последние часы остаются файлами часов
+    assert history.compact(NOW + 2 * DAY) == 3
+    names = sorted(os.listdir(tmp_path))
+    assert names[:4] == ["20270115.seg", "20270116.seg", "20270117.seg", "2027011706.1.live"]
+    after = history.scan((1, -2), NOW, NOW + 2 * DAY)
+    assert after.time.tolist() == before.time.tolist()
+    assert after.temperature.tolist() == before.temperature.tolist()
+
+    # Дни закрытого месяца сжимаются в сегмент месяца
+    assert history.compact(NOW + 30 * DAY) == 2
+    assert sorted(os.listdir(tmp_path)) == ["202701.seg"]
+    assert history.scan((1, -2), NOW, NOW + 2 * DAY).temperature.tolist() == before.temperature.tolist()
+    assert history.scan((1, -2), NOW, NOW + 3 * DAY, kind=FORECAST).time.tolist() == forecast.time.tolist()
+    assert history.compact(NOW + 60 * DAY) == 0
+    history.close()
+
+
+def test_aggregate(tmp_path):
+    history = History(str(tmp_path))
+    fill(history, 48)
+    hourly = history.aggregate((1, -2), NOW, NOW + 2 * HOUR)
+    assert hourly.time.tolist() == [NOW, NOW + HOUR]
+    assert hourly.count.tolist() == [3, 3]
+    assert hourly.min.tolist() == [0, 3] and hourly.max.tolist() == [2, 5] and hourly.mean.tolist() == [1, 4]
+
+    # Сутки по местному времени UTC+3 начинаются в 21:00 UTC
+    daily = history.aggregate((3, 4), NOW - DAY, NOW + 3 * DAY, step=DAY, utc_offset=3 * HOUR)
+    assert daily.time.tolist() == [NOW - 11 * HOUR, NOW + 13 * HOUR, NOW + 37 * HOUR]
+    assert daily.count.tolist() == [39, 72, 33] and daily.mean.tolist() == [100, 100, 100]
+    empty = history.aggregate((5, 6), NOW, NOW + DAY)
+    assert len(empty.time) == 0
+    history.close()
+
+
+def test_scan_during_compaction(tmp_path, monkeypatch):
+    history = History(str(tmp_path), writer=1)
+    fill(history, 48)
+    before = history.scan((1, -2), NOW, NOW + 2 * DAY)
+    # Сжимает другой процесс: между просмотром каталога и чтением файлы часов сливаются в сегменты и удаляются
+    compactor = History(str(tmp_path))
+    listing = history._listing
+    compacted = []
+
+    def racing(start, end):
+        files = listing(start, end)
+        if not compacted:
+            compacted.append(compactor.compact(NOW + 2 * DAY))
+        return files
+
+    monkeypatch.setattr(history, "_listing", racing)
+    after = history.scan((1, -2), NOW, NOW + 2 * DAY)
+    assert compacted == [3] and history.rescans == 1
+    assert after.time.tolist() == before.time.tolist()
+    assert after.temperature.tolist() == before.temperature.tolist()
+
+    # Последние часы сливаются в сегмент дня, который уже открыт прошлой выборкой
+    compacted.clear()
+    compactor.compact_delay = -DAY
+    after = history.scan((1, -2), NOW, NOW + 2 * DAY)
+    assert compacted == [1] and history.rescans == 2
+    assert after.temperature.tolist() == before.temperature.tolist()
+    history.close()
+    compactor.close()
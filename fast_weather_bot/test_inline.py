@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from fast_weather_bot.inline import InlineAnswers, InlineOptions
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_newer_query_cancels_lookup():
+    answers = InlineAnswers(InlineOptions(debounce=0.01))
+    started = []
+
+    async def lookup(text):
+        started.append(text)
+        await asyncio.sleep(0.05)
+        return text
+
+    # Пока пользователь набирает, поиск не начинается, а последний запрос отменяет предыдущий
+    typing = [asyncio.create_task(answers.latest(1, "mo", lambda: lookup("mo"))),
+              asyncio.create_task(answers.latest(1, "mos", lambda: lookup("mos")))]
+    await asyncio.sleep(0.03)
+    other = asyncio.create_task(answers.latest(2, "kazan", lambda: lookup("kazan")))
+    latest = asyncio.create_task(answers.latest(1, "moscow", lambda: lookup("moscow")))
+    assert await asyncio.gather(*typing, latest, other) == [None, None, "moscow", "kazan"]
+    assert started == ["mos", "kazan", "moscow"]
+    assert answers.cancelled == 2
+
+    # Запрос, которому нужен тот же ответ, дожидается уже идущего поиска
+    started.clear()
+    typing = [answers.latest(1, "moscow", lambda: lookup("mosk")),
+              answers.latest(1, "moscow", lambda: lookup("moskva"))]
+    assert await asyncio.gather(*typing) == ["mosk", "mosk"]
+    assert started == ["mosk"] and answers.cancelled == 2
+
+
+@pytest.mark.asyncio
+async def test_handler_cancellation_stops_lookup():
+    answers = InlineAnswers(InlineOptions(debounce=0))
+    cancelled = asyncio.Event()
+
+    async def lookup():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    handler = asyncio.create_task(answers.latest(1, "moscow", lookup))
+    await asyncio.sleep(0.01)
+    handler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await handler
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_lookup_survives_one_cancelled_waiter():
+    answers = InlineAnswers(InlineOptions(debounce=0))
+
+    async def lookup():
+        await asyncio.sleep(0.05)
+        return "moscow"
+
+    first = asyncio.create_task(answers.latest(1, "moscow", lookup))
+    second = asyncio.create_task(answers.latest(1, "moscow", lookup))
+    await asyncio.sleep(0.01)
+    # Отменён только один из обработчиков, второй по-прежнему ждёт тот же поиск
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await second == "moscow"
+    assert answers.cancelled == 0
+
+
+def test_cache_ttl_and_size():
+    answers = InlineAnswers(InlineOptions(ttl=60, max_size=2))
+    answers.put("mos", ["moscow"])
+    answers.put("kaz", ["kazan"])
+    assert answers.get("mos") == ["moscow"]
+    answers.put("spb", ["saint petersburg"])
+    assert answers.get("kaz") is None and answers.get("mos") == ["moscow"]
+    expired = InlineAnswers(InlineOptions(ttl=0))
+    expired.put("mos", ["moscow"])
+    assert expired.get("mos") is None
+    assert (answers.hits, answers.misses) == (2, 1)
@@ -0,0 +1,47 @@
+import pytest
+
+from fast_weather_bot import log
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class Noisy:
+    reprs = 0
+
+    def __repr__(self):
+        Noisy.reprs += 1
+        return "Noisy"
+
+
+@log.logit()
+async def handler(arg):
+    return arg
+
+
+@log.logit()
+def function(arg):
+    return arg
+
+
+@pytest.mark.asyncio
+async def test_disabled_level_skips_formatting():
+    log.setup("INFO")
+    Noisy.reprs = 0
+    await handler(Noisy())
+    function(Noisy())
+    assert Noisy.reprs == 0
+
+
+@pytest.mark.asyncio
+async def test_module_level_enables_logging():
+    messages = []
+    log.setup("INFO", {__name__: "TRACE"})
+    log.logger.add(messages.append, level="TRACE", format="{name} {message}")
+    Noisy.reprs = 0
+    await handler(Noisy())
+    assert Noisy.reprs == 1
+    assert any(m.startswith(f"{__name__} START AWAIT") for m in messages)
+    log.setup("INFO", {"other.module": "TRACE"})
+    await handler(Noisy())
+    assert Noisy.reprs == 1
+    log.setup()
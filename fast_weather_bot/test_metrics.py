@@ -0,0 +1,59 @@
+import aiohttp
+import pytest
+
+from fast_weather_bot import log
+from fast_weather_bot.metrics import Registry, REGISTRY, MetricsServer
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@log.logit(metric="test_handler")
+async def failing(arg):
+    raise ValueError(arg)
+
+
+@log.logit(metric="test_handler")
+async def ok(arg):
+    return arg
+
+
+def test_render():
+    registry = Registry()
+    registry.histogram("latency_seconds", "Latency", ("method",), buckets=(0.1, 1.0)).labels("get").observe(0.5)
+    registry.counter("errors_total", "Errors").labels().inc()
+    registry.gauge("queue_depth", "Queue", lambda: 7)
+    text = registry.render()
+    assert 'latency_seconds_bucket{method="get",le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{method="get",le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{method="get",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{method="get"} 1' in text
+    assert "errors_total 1" in text
+    assert "# TYPE queue_depth gauge" in text
+    assert "queue_depth 7" in text
+
+
+@pytest.mark.asyncio
+async def test_logit_metric():
+    assert await ok(1) == 1
+    with pytest.raises(ValueError):
+        await failing(2)
+    text = REGISTRY.render()
+    assert 'test_handler_seconds_count{function="ok"} 1' in text
+    assert 'test_handler_seconds_count{function="failing"} 1' in text
+    assert 'test_handler_errors_total{function="failing"} 1' in text
+    assert 'test_handler_errors_total{function="ok"} 0' in text
+
+
+@pytest.mark.asyncio
+async def test_server():
+    registry = Registry()
+    registry.gauge("up", "Up", lambda: 1)
+    server = MetricsServer(registry, port=19100)
+    await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get("http://127.0.0.1:19100/metrics") as response:
+                assert response.status == 200
+                assert "up 1" in await response.text()
+    finally:
+        await server.stop()
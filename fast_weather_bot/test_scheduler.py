@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from fast_weather_bot.scheduler import Scheduler, next_daily
+
+pytest_plugins = ('pytest_asyncio',)
+
+UTC = datetime.timezone.utc
+
+
+def test_next_daily():
+    after = datetime.datetime(2021, 5, 1, 10, 0, tzinfo=UTC).timestamp()
+    assert next_daily(datetime.time(12, 0), after, UTC) == after + 2 * 3600
+    assert next_daily(datetime.time(9, 0), after, UTC) == after + 23 * 3600
+    assert next_daily(datetime.time(10, 0), after, UTC) == after + 24 * 3600
+
+
+@pytest.mark.asyncio
+async def test_run_pending_order_and_cancel():
+    scheduler = Scheduler()
+    fired = []
+
+    async def job(name):
+        fired.append(name)
+
+    now = time.time()
+    jobs = [scheduler.every(10, job, i, first=now - i) for i in range(100)]
+    for j in jobs[::2]:
+        scheduler.cancel(j)
+    assert len(scheduler) == 50
+    assert scheduler.run_pending(now) == 50
+    await asyncio.sleep(0)
+    assert sorted(fired) == list(range(1, 100, 2))
+    assert all(j.deadline > now for j in jobs[1::2])
+    assert scheduler.lag.count == 50 and scheduler.lag.max == 99
+
+
+@pytest.mark.asyncio
+async def test_missed_daily_run_caught_up_within_grace():
+    scheduler = Scheduler(tz=UTC, misfire_grace=600)
+    fired = []
+
+    async def job():
+        fired.append(1)
+
+    now = time.time()
+    scheduler.daily((datetime.datetime.fromtimestamp(now - 60, UTC)).time(), job, since=now - 120)
+    scheduler.daily((datetime.datetime.fromtimestamp(now - 3600, UTC)).time(), job, since=now - 7200)
+    scheduler.run_pending(now)
+    await asyncio.sleep(0)
+    assert fired == [1]
+    assert scheduler.lag.skipped == 1
+    assert len(scheduler) == 2
+    assert scheduler.checked == now
+
+    # После простоя в несколько дней догоняется только последний пропущенный запуск
+    fired.clear()
+    scheduler.daily((datetime.datetime.fromtimestamp(now - 60, UTC)).time(), job, since=now - 3 * 24 * 3600)
+    scheduler.run_pending(now)
+    await asyncio.sleep(0)
+    assert fired == [1]
+    assert scheduler.lag.skipped == 1
+
+
+@pytest.mark.asyncio
+async def test_loop_wakes_for_new_job():
+    scheduler = Scheduler()
+    scheduler.start()
+    done = asyncio.Event()
+
+    async def job():
+        done.set()
+
+    scheduler.every(0.01, job)
+    await asyncio.wait_for(done.wait(), 1)
+    await scheduler.stop()
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import aiogram
+import pytest
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from fast_weather_bot.sender import Sender, Priority
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class TelegramStub:
+    """
+    Локальная заглушка Bot API: принимает sendMessage и может ответить 429 заданное число раз
+    """
+
+    def __init__(self, flood_errors: int = 0):
+        self.flood_errors = flood_errors
+        self.messages = []
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = dict(await request.post())
+        if self.flood_errors:
+            self.flood_errors -= 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        self.messages.append((int(data["chat_id"]), data["text"], time.monotonic()))
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(self.messages), "date": 0, "text": data["text"],
+            "chat": {"id": int(data["chat_id"]), "type": "private"}}})
+
+
+async def start_stub(stub: TelegramStub):
+    server = TestServer(stub.app)
+    await server.start_server()
+    bot = aiogram.Bot("123:abc", server=TelegramAPIServer.from_base(str(server.make_url("")).rstrip("/")))
+    return server, bot
+
+
+@pytest.mark.asyncio
+async def test_coalesce_and_retry_after():
+    stub = TelegramStub(flood_errors=1)
+    server, bot = await start_stub(stub)
+    sender = Sender(bot.send_message)
+    first = sender.send(1, "Ожидается плохая погода", priority=Priority.Alarm)
+    second = sender.send(1, "Дождь", priority=Priority.Alarm)
+    sender.start()
+    await asyncio.wait_for(asyncio.gather(first, second), 5)
+    assert [text for _, text, _ in stub.messages] == ["Ожидается плохая погода\n\nДождь"]
+    assert (sender.sent, sender.coalesced, sender.retried) == (1, 1, 1)
+    await sender.stop()
+    await (await bot.get_session()).close()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_priority_and_chat_pacing():
+    stub = TelegramStub()
+    server, bot = await start_stub(stub)
+    sender = Sender(bot.send_message, rate=1000, chat_interval=0.2)
+    sender.send(2, "alarm", priority=Priority.Alarm)
+    sender.send(3, "scheduled", priority=Priority.Scheduled)
+    sender.send(4, "reply", reply_markup=aiogram.types.ReplyKeyboardRemove())
+    sender.start()
+    await asyncio.sleep(0.05)
+    sender.send(4, "second reply")
+    await asyncio.sleep(0.4)
+    assert [text for _, text, _ in stub.messages] == ["reply", "scheduled", "alarm", "second reply"]
+    assert stub.messages[3][2] - stub.messages[0][2] >= 0.15
+    await sender.stop()
+    await (await bot.get_session()).close()
+    await server.close()
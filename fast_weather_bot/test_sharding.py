@@ -0,0 +1,84 @@
+import asyncio
+from collections import Counter
+
+import aiogram
+import pytest
+from aiogram.dispatcher.filters.state import State, StatesGroup
+
+from fast_weather_bot.fsm_storage import BoundedStorage
+from fast_weather_bot.sharding import HashRing, ShardOptions, encode_frame, update_chat_id
+from fast_weather_bot.weather_api.jsonlib import dumps
+from fast_weather_bot.webhook import ShardListener
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class InputState(StatesGroup):
+    Text = State()
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": text,
+                                                "chat": {"id": chat_id, "type": "private"},
+                                                "from": {"id": chat_id, "is_bot": False, "first_name": "user"}}}
+
+
+def test_hash_ring():
+    ring = HashRing(3)
+    owners = [ring.owner(chat_id) for chat_id in range(3000)]
+    assert [HashRing(3).owner(chat_id) for chat_id in range(0, 3000, 300)] == owners[::300]
+    assert min(Counter(owners).values()) > 700
+    # Новый воркер забирает примерно свою долю чатов, остальные остаются на месте
+    bigger = HashRing(4)
+    moved = sum(owner != bigger.owner(chat_id) for chat_id, owner in enumerate(owners))
+    assert moved < 1200
+
+
+def test_shard_options():
+    assert ShardOptions().owns(42)
+    owner = ShardOptions(workers=3).owner(42)
+    assert ShardOptions(workers=3, index=owner).owns(42)
+    assert not ShardOptions(workers=3, index=(owner + 1) % 3).owns(42)
+
+
+def test_update_chat_id():
+    update = make_update(1, 10, "hi")
+    assert update_chat_id(update) == 10
+    callback = {"update_id": 2, "callback_query": {"id": "1", "from": {"id": 20}, "message": update["message"]}}
+    assert update_chat_id(callback) == 10
+    assert update_chat_id({"update_id": 3, "inline_query": {"id": "1", "from": {"id": 30}, "query": ""}}) == 30
+    assert update_chat_id({"update_id": 4}) == 4
+
+
+@pytest.mark.asyncio
+async def test_shard_listener(tmp_path):
+    dp = aiogram.Dispatcher(aiogram.Bot("123:abc"), storage=BoundedStorage())
+    handled = []
+
+    async def start(msg):
+        await InputState.Text.set()
+
+    async def text(msg, state):
+        handled.append(msg.text)
+        await state.finish()
+
+    dp.register_message_handler(start, text="/start")
+    dp.register_message_handler(text, state=InputState.Text)
+    path = str(tmp_path / "worker.sock")
+    listener = ShardListener(dp, path, workers=1)
+    await listener.start()
+    _, writer = await asyncio.open_unix_connection(path)
+    # Состояние, установленное одним обновлением, видно следующему, даже если их обрабатывает один воркер
+    for i, message in enumerate(["/start", "first", "/start", "second", "ignored"]):
+        writer.write(encode_frame(dumps(make_update(i, 1, message))))
+    writer.write(encode_frame(b"{"))
+    await writer.drain()
+    for _ in range(100):
+        if listener.received == 5 and not listener.qsize():
+            break
+        await asyncio.sleep(0.01)
+    await listener.stop()
+    writer.close()
+    assert listener.received == 5
+    assert handled == ["first", "second"]
+    await (await dp.bot.get_session()).close()
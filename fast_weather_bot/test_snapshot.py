@@ -0,0 +1,39 @@
+import struct
+import time
+
+import pytest
+
+from fast_weather_bot.snapshot import MAGIC, Snapshot, write
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "bot.snapshot")
+    now = time.time()
+    weather = [((1111, 756), now - 10, ("current", (), "hourly")),
+               ((-340, -5812), now - 100, ("south", (), None)),
+               ((0, 0), now - 5000, ("old", (), None))]
+    size = write(path, weather, {1: ["осадки"], 2: ("снег", "t<-10")})
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 3 and snapshot.age < 5
+    fetched_at, decoded = snapshot.get((1111, 756), max_age=60)
+    assert fetched_at == now - 10 and decoded == ("current", (), "hourly")
+    assert snapshot.get((-340, -5812), max_age=1000)[1][0] == "south"
+    assert snapshot.get((-340, -5812), max_age=60) is None
+    assert snapshot.get((1111, 757), max_age=60) is None
+    assert sorted(cell for cell, _, _ in snapshot.items(max_age=1000)) == [(-340, -5812), (1111, 756)]
+    assert snapshot.alarms() == {1: ("осадки",), 2: ("снег", "t<-10")}
+    snapshot.close()
+    with open(path, "rb") as f:
+        assert len(f.read()) == size
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "bot.snapshot"
+    write(str(path), [], {})
+    data = path.read_bytes()
+    path.write_bytes(data[:len(MAGIC)] + struct.pack("<H", 999) + data[len(MAGIC) + 2:])
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+    path.write_bytes(b"WB")
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
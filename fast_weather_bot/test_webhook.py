@@ -0,0 +1,42 @@
+import asyncio
+
+import aiogram
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from fast_weather_bot.webhook import WebhookServer, WebhookOptions, SECRET_HEADER
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+def make_update(update_id: int) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "hi",
+                                                "chat": {"id": 1, "type": "private"},
+                                                "from": {"id": 1, "is_bot": False, "first_name": "user"}}}
+
+
+@pytest.mark.asyncio
+async def test_webhook_queue():
+    dp = aiogram.Dispatcher(aiogram.Bot("123:abc"))
+    handled = []
+
+    async def handler(msg):
+        handled.append(msg.message_id)
+
+    dp.register_message_handler(handler)
+    server = WebhookServer(dp, WebhookOptions(url="", secret="secret", queue_size=2, workers=1))
+    client = TestClient(TestServer(server.make_app()))
+    await client.start_server()
+    headers = {SECRET_HEADER: "secret"}
+
+    assert (await client.post("/webhook", json=make_update(1))).status == 403
+    statuses = [(await client.post("/webhook", json=make_update(i), headers=headers)).status for i in range(3)]
+    assert statuses == [200, 200, 503]
+    assert server.qsize() == 2
+
+    server.start_workers()
+    await asyncio.wait_for(server._queue.join(), 1)
+    assert handled == [0, 1]
+    await server.stop()
+    await client.close()
+    await (await dp.bot.get_session()).close()
@@ -1,2 +1,9 @@
 from .yandex import YandexWeatherAPI
-from .factory import WeatherFactory, WeatherAPIType
\ No newline at end of file
+from .factory import WeatherFactory, WeatherAPIType
+from .cache import CachedWeatherAPI, CacheOptions
+from .session import HTTPOptions
+from .coalesce import SingleFlight
+from .composite import CompositeWeatherAPI, HedgeOptions, CircuitBreaker, WeatherUnavailable
+from .open_meteo import OpenMeteoWeatherAPI
+from .stub import StubWeatherAPI
+from .prefetch import Prefetcher, PrefetchOptions
@@ -0,0 +1,287 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from loguru import logger
+
+from fast_weather_bot.entity import Coordinates, Forecast, WeatherPoint
+from fast_weather_bot.metrics import REGISTRY, Timer
+from fast_weather_bot.options import CacheOptions
+from .coalesce import SingleFlight
+from .grid import Cell, cell_of, cell_center
+from .hourly import HourlyForecast
+from .shared import Decoded, SharedStore
+from .weather_base import WeatherAPIBase
+
+# Ответ другого процесса моложе этого считается свежим и при принудительном обновлении
+REFRESH_SHARED_AGE = 60
+
+
+class _Entry:
+    __slots__ = ("raw", "doc", "fetched_at", "current", "forecast", "hourly")
+
+    def __init__(self, raw: Any, fetched_at: float):
+        self.raw = raw
+        self.doc: Any = None  # Декодированный ответ, пока из него разобраны не все части
+        self.fetched_at = fetched_at
+        self.current: Optional[WeatherPoint] = None
+        self.forecast: Optional[Sequence[Forecast]] = None
+        self.hourly: Optional[HourlyForecast] = None
+
+
+class CachedWeatherAPI(WeatherAPIBase):
+    """
+    Кэширует один ответ провайдера на ячейку координатной сетки и отдаёт из него и текущую погоду, и прогноз.
+    Ячейки вытесняются по LRU при превышении max_size. Устаревший не больше чем на stale_ttl ответ
+    отдаётся сразу, а свежий запрашивается в фоне. С shared_path промах сначала ищется в общем для процессов
+    кэше, а полученный ответ разбирается и кладётся туда. После перезапуска промах ищется и в снимке кэша,
+    см. warm
+    """
+
+    def __init__(self, api: WeatherAPIBase, options: Optional[CacheOptions] = None):
+        self._api = api
+        self._options = options or CacheOptions()
+        self._entries: "OrderedDict[Cell, _Entry]" = OrderedDict()
+        self.flight = SingleFlight()
+        method = f"{type(api).__name__}.fetch"
+        self._upstream_latency = REGISTRY.histogram("weather_upstream_seconds", "Duration of upstream weather requests",
+                                                    ("method",)).labels(method)
+        self._upstream_errors = REGISTRY.counter("weather_upstream_errors_total", "Failed upstream weather requests",
+                                                 ("method",)).labels(method)
+        self._refreshing: Set[asyncio.Future] = set()
+        self._sharing: Set[asyncio.Future] = set()
+        self._max_age = max(self._options.current_ttl, self._options.forecast_ttl) + self._options.stale_ttl
+        self._shared: Optional[SharedStore] = None
+        if self._options.shared_path:
+            self._shared = SharedStore(self._options.shared_path, self._max_age)
+        self._snapshot = None
+        self._fetched: Optional[Dict[Cell, _Entry]] = None  # См. take_fetched
+        self.hits = 0
+        self.shared_hits = 0  # Сколько промахов закрыто ответом из общего кэша
+        self.restored = 0  # Сколько ячеек взято из снимка
+        self.misses = 0
+        self.stale = 0  # Сколько раз отдан устаревший ответ
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, cell: Cell, ttl: float) -> Optional[_Entry]:
+        entry = self._entries.get(cell)
+        if entry is None:
+            if self._snapshot is None:
+                return None
+            entry = self._from_snapshot(cell)
+            if entry is None:
+                return None
+        age = time.monotonic() - entry.fetched_at
+        if age >= ttl + self._options.stale_ttl:
+            return None
+        if age >= ttl:
+            self.stale += 1
+            self._refresh_later(cell, ttl)
+        self._entries.move_to_end(cell)
+        return entry
+
+    def _put(self, cell: Cell, raw: Any) -> _Entry:
+        entry = _Entry(raw, time.monotonic())
+        self._entries[cell] = entry
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self._options.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _put_decoded(self, cell: Cell, fetched_at: float, decoded: Decoded) -> _Entry:
+        entry = self._put(cell, None)
+        entry.fetched_at -= time.time() - fetched_at
+        entry.current, entry.forecast, entry.hourly = decoded
+        return entry
+
+    async def _from_shared(self, cell: Cell, max_age: float) -> Optional[_Entry]:
+        # Файл общий у всех воркеров и читается под его блокировкой, поэтому не в цикле событий
+        found = await asyncio.get_running_loop().run_in_executor(None, self._shared.get, cell, max_age)
+        if found is None:
+            return None
+        self.shared_hits += 1
+        return self._put_decoded(cell, *found)
+
+    def _from_snapshot(self, cell: Cell) -> Optional[_Entry]:
+        try:
+            found = self._snapshot.get(cell, self._max_age)
+        except Exception as e:
+            logger.warning(f"Failed to read weather for {cell} from snapshot: {e!r}")
+            return None
+        if found is None:
+            return None
+        self.restored += 1
+        return self._put_decoded(cell, *found)
+
+    def warm(self, snapshot) -> None:
+        """
+        Подключает снимок кэша, см. snapshot.Snapshot. Ячейки читаются из него при первом обращении,
+        устаревшие ответы отдаются и обновляются в фоне, как из памяти
+        """
+        self._snapshot = snapshot
+
+    def _parse(self, entry: _Entry, part: str) -> Any:
+        """
+        Часть ответа ячейки: current, forecast или hourly. Части разбираются по отдельности, чтобы ошибка в одной
+        не мешала отдавать остальные, а декодированный ответ хранится, пока не разобраны все
+        """
+        value = getattr(entry, part)
+        if value is None:
+            doc = entry.doc
+            if doc is None:
+                doc = entry.doc = self._api.decode(entry.raw)
+            value = getattr(self._api, f"parse_{part}")(doc)
+            setattr(entry, part, value)
+            if entry.current is not None and entry.forecast is not None and entry.hourly is not None:
+                entry.doc = None
+        return value
+
+    def _parse_all(self, entry: _Entry) -> Decoded:
+        return self._parse(entry, "current"), self._parse(entry, "forecast"), self._parse(entry, "hourly")
+
+    def _decode(self, cell: Cell, entry: _Entry) -> Optional[Decoded]:
+        try:
+            self._parse_all(entry)
+        except Exception as e:
+            logger.warning(f"Failed to parse weather for {cell}: {e!r}")
+            return None
+        return entry.current, entry.forecast, entry.hourly
+
+    def take_fetched(self) -> List[Tuple[Cell, float, Decoded]]:
+        """
+        Ответы, полученные от провайдера с прошлого вызова, для истории наблюдений: ячейка, время получения
+        (time.time()), ответ. Ответы запоминаются начиная с первого вызова, из нескольких ответов ячейки - последний
+        """
+        fetched, self._fetched = self._fetched or {}, {}
+        now, wall = time.monotonic(), time.time()
+        taken = []
+        for cell, entry in fetched.items():
+            decoded = self._decode(cell, entry)
+            if decoded is not None:
+                taken.append((cell, wall - (now - entry.fetched_at), decoded))
+        return taken
+
+    def decoded(self) -> Iterator[Tuple[Cell, float, Decoded]]:
+        """
+        Разобранные ответы для снимка: ячейка, время получения (time.time()), ответ. Вызывается при остановке
+        """
+        now, wall = time.monotonic(), time.time()
+        for cell, entry in list(self._entries.items()):
+            decoded = self._decode(cell, entry)
+            if decoded is not None:
+                yield cell, wall - (now - entry.fetched_at), decoded
+        if self._snapshot is not None:
+            # Ячейки снимка, к которым после перезапуска не обращались, переходят в следующий снимок
+            for cell, fetched_at, decoded in self._snapshot.items(self._max_age):
+                if cell not in self._entries:
+                    yield cell, fetched_at, decoded
+
+    def _share(self, cell: Cell, entry: _Entry) -> None:
+        # Выполняется в исполнителе: разбор, pickle и запись под блокировкой файла не задерживают цикл событий
+        try:
+            self._shared.put(cell, time.time(), self._parse_all(entry))
+        except Exception as e:
+            logger.warning(f"Failed to share weather for {cell}: {e!r}")
+
+    def _share_later(self, cell: Cell, entry: _Entry) -> None:
+        task = asyncio.get_running_loop().run_in_executor(None, self._share, cell, entry)
+        self._sharing.add(task)
+        task.add_done_callback(self._sharing.discard)
+
+    async def _load(self, cell: Cell, max_age: float = 0) -> _Entry:
+        """
+        :param max_age: Ответ из общего кэша моложе стольких секунд берётся вместо запроса к API
+        """
+        async def load() -> _Entry:
+            if self._shared is not None and max_age > 0:
+                entry = await self._from_shared(cell, max_age)
+                if entry is not None:
+                    return entry
+            with Timer(self._upstream_latency, self._upstream_errors):
+                raw = await self._api.fetch(cell_center(cell, self._options.grid_step))
+            entry = self._put(cell, raw)
+            if self._fetched is not None:
+                self._fetched[cell] = entry
+            if self._shared is not None:
+                self._share_later(cell, entry)
+            return entry
+
+        return await self.flight.do(cell, load)
+
+    def _refresh_later(self, cell: Cell, ttl: float) -> None:
+        if cell in self.flight:
+            return
+        task = asyncio.ensure_future(self._load(cell, ttl))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Future) -> None:
+        self._refreshing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background weather refresh failed: {task.exception()!r}")
+
+    async def _entry(self, coordinates: Coordinates, ttl: float) -> _Entry:
+        cell = cell_of(coordinates, self._options.grid_step)
+        entry = self._get(cell, ttl)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return await self._load(cell, ttl)
+
+    async def refresh(self, coordinates: Coordinates) -> None:
+        """
+        Запрашивает свежий ответ для ячейки точки, даже если в кэше есть действующий
+        """
+        await self._load(cell_of(coordinates, self._options.grid_step), REFRESH_SHARED_AGE)
+
+    async def open(self) -> None:
+        await self._api.open()
+
+    async def close(self) -> None:
+        for task in list(self._refreshing):
+            task.cancel()
+        if self._shared is not None:
+            # Запись в общий кэш нельзя прервать, соединение закрывается после неё
+            await asyncio.gather(*self._sharing, return_exceptions=True)
+            self._shared.close()
+            self._shared = None
+        await self._api.close()
+
+    async def current(self, coordinates: Coordinates) -> WeatherPoint:
+        entry = await self._entry(coordinates, self._options.current_ttl)
+        return self._parse(entry, "current")
+
+    async def forecast(self, coordinates: Coordinates) -> Sequence[Forecast]:
+        entry = await self._entry(coordinates, self._options.forecast_ttl)
+        return self._parse(entry, "forecast")
+
+    async def hourly(self, coordinates: Coordinates) -> HourlyForecast:
+        entry = await self._entry(coordinates, self._options.forecast_ttl)
+        return self._parse(entry, "hourly")
+
+    async def coords_by_city(self, city: str) -> Optional[Coordinates]:
+        return await self._api.coords_by_city(city)
+
+    async def fetch(self, coordinates: Coordinates) -> Any:
+        ttl = min(self._options.current_ttl, self._options.forecast_ttl)
+        entry = await self._entry(coordinates, ttl)
+        if entry.raw is None:
+            # Ответ из общего кэша уже разобран, исходный нужно запросить
+            entry = await self._load(cell_of(coordinates, self._options.grid_step))
+        return entry.raw
+
+    def decode(self, raw: Any) -> Any:
+        return self._api.decode(raw)
+
+    def parse_current(self, doc: Any) -> WeatherPoint:
+        return self._api.parse_current(doc)
+
+    def parse_forecast(self, doc: Any) -> Sequence[Forecast]:
+        return self._api.parse_forecast(doc)
+
+    def parse_hourly(self, doc: Any) -> HourlyForecast:
+        return self._api.parse_hourly(doc)
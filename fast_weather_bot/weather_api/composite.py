@@ -0,0 +1,242 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from fast_weather_bot.entity import Coordinates, Forecast, WeatherPoint
+from fast_weather_bot.metrics import REGISTRY
+from fast_weather_bot.options import HedgeOptions
+from .hourly import HourlyForecast
+from .weather_base import WeatherAPIBase
+
+
+class WeatherUnavailable(Exception):
+    """
+    Ни один провайдер не ответил: все упали или отключены предохранителем
+    """
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failures ошибок подряд провайдер отключается на reset_timeout секунд,
+    потом ему уходит один пробный запрос. Успех включает провайдер, ошибка отключает снова
+    """
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half-open"
+
+    def __init__(self, failures: int = 5, reset_timeout: float = 30):
+        self._threshold = failures
+        self._reset_timeout = reset_timeout
+        self.state = self.Closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        if self.state == self.Closed:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == self.Open and now - self.opened_at >= self._reset_timeout:
+            self.state = self.HalfOpen
+        if self.state == self.HalfOpen and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.state = self.Closed
+        self.failures = 0
+        self._probing = False
+
+    def failure(self, now: Optional[float] = None) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HalfOpen or self.failures >= self._threshold:
+            self.state = self.Open
+            self.opened_at = time.monotonic() if now is None else now
+
+    def release(self) -> None:
+        """
+        Пробный запрос отменён, не дождавшись ответа: следующий запрос снова может стать пробным
+        """
+        self._probing = False
+
+
+class _Tagged:
+    """
+    Ответ вместе с провайдером, который его вернул: разбирать ответ должен тот же провайдер
+    """
+    __slots__ = ("backend", "raw")
+
+    def __init__(self, backend: "_Backend", raw: Any):
+        self.backend = backend
+        self.raw = raw
+
+
+class _Backend:
+    """
+    Провайдер и статистика его задержек
+    """
+
+    def __init__(self, api: WeatherAPIBase, index: int, name: str, options: HedgeOptions):
+        self.api = api
+        self.index = index
+        self.name = name
+        self.breaker = CircuitBreaker(options.failures, options.reset_timeout)
+        self.ewma: Optional[float] = None
+        self._alpha = options.ewma_alpha
+        self._samples: deque = deque(maxlen=options.window)
+        self._options = options
+        self._latency = REGISTRY.histogram("weather_backend_seconds", "Duration of requests to each weather provider",
+                                           ("backend",)).labels(self.name)
+        self._errors = REGISTRY.counter("weather_backend_errors_total", "Failed requests to each weather provider",
+                                        ("backend",)).labels(self.name)
+
+    def _observe(self, latency: float) -> None:
+        self.ewma = latency if self.ewma is None else self.ewma + self._alpha * (latency - self.ewma)
+        self._samples.append(latency)
+        self._latency.observe(latency)
+
+    def hedge_delay(self) -> float:
+        """
+        Сколько ждать ответа, прежде чем дублировать запрос другому провайдеру
+        """
+        samples = self._samples
+        if len(samples) < 20:
+            return self._options.initial_delay
+        ordered = sorted(samples)
+        return max(self._options.min_delay, ordered[int(self._options.quantile * (len(ordered) - 1))])
+
+    async def fetch(self, coordinates: Coordinates) -> Any:
+        started = time.monotonic()
+        try:
+            raw = await self.api.fetch(coordinates)
+        except asyncio.CancelledError:
+            # Проигравший запрос тоже был не быстрее победителя, это честная нижняя оценка задержки
+            self._observe(time.monotonic() - started)
+            self.breaker.release()
+            raise
+        except Exception:
+            self._errors.inc()
+            self.breaker.failure()
+            raise
+        self._observe(time.monotonic() - started)
+        self.breaker.success()
+        return raw
+
+
+class CompositeWeatherAPI(WeatherAPIBase):
+    """
+    Несколько провайдеров за одним интерфейсом. Запрос уходит самому быстрому по скользящему среднему задержки.
+    Если он не ответил за свой квантиль задержки, тот же запрос дублируется следующему, и берётся первый ответ.
+    Упавший запрос сразу повторяется у следующего провайдера, а часто падающий провайдер отключается предохранителем
+    """
+
+    def __init__(self, apis: Sequence[WeatherAPIBase], options: Optional[HedgeOptions] = None):
+        if not apis:
+            raise ValueError("CompositeWeatherAPI needs at least one provider")
+        options = options or HedgeOptions()
+        names = [type(api).__name__ for api in apis]
+        # Одинаковые провайдеры различаются номером, иначе их метрики сольются
+        names = [f"{name}#{i}" if names.count(name) > 1 else name for i, name in enumerate(names)]
+        self._backends = [_Backend(api, i, name, options) for i, (api, name) in enumerate(zip(apis, names))]
+        self.hedged = 0  # Сколько раз запрос был продублирован
+        self.hedge_wins = 0  # Сколько раз дубль ответил раньше первого запроса
+        self.failovers = 0  # Сколько раз запрос повторялся у другого провайдера после ошибки
+        REGISTRY.gauge("weather_hedged_total", "Upstream requests duplicated to another provider",
+                       lambda: self.hedged, kind="counter")
+        REGISTRY.gauge("weather_hedge_wins_total", "Duplicated requests answered before the original",
+                       lambda: self.hedge_wins, kind="counter")
+        REGISTRY.gauge("weather_failovers_total", "Upstream requests retried on another provider after an error",
+                       lambda: self.failovers, kind="counter")
+        REGISTRY.gauge("weather_backends_open", "Providers switched off by circuit breakers",
+                       lambda: sum(b.breaker.state != CircuitBreaker.Closed for b in self._backends))
+
+    @property
+    def backends(self) -> List[WeatherAPIBase]:
+        return [backend.api for backend in self._backends]
+
+    def stats(self) -> Dict[str, dict]:
+        return {backend.name: {"ewma": backend.ewma, "state": backend.breaker.state}
+                for backend in self._backends}
+
+    def _order(self) -> List[_Backend]:
+        """
+        Доступные провайдеры, самые быстрые первыми. Провайдеры без замеров идут в заданном порядке после остальных
+        """
+        now = time.monotonic()
+        available = [backend for backend in self._backends if backend.breaker.allow(now)]
+        return sorted(available, key=lambda b: (b.ewma is None, b.ewma or 0.0, b.index))
+
+    async def open(self) -> None:
+        for backend in self._backends:
+            await backend.api.open()
+
+    async def close(self) -> None:
+        for backend in self._backends:
+            await backend.api.close()
+
+    async def fetch(self, coordinates: Coordinates) -> _Tagged:
+        order = self._order()
+        if not order:
+            raise WeatherUnavailable("All weather providers are switched off by circuit breakers")
+        queue = iter(order)
+        primary = order[0]
+        pending: Dict[asyncio.Future, _Backend] = {}
+        error: Optional[BaseException] = None
+        hedge = len(order) > 1
+        hedged = False
+
+        def launch() -> bool:
+            backend = next(queue, None)
+            if backend is None:
+                return False
+            pending[asyncio.ensure_future(backend.fetch(coordinates))] = backend
+            return True
+
+        launch()
+        try:
+            while pending:
+                timeout = primary.hedge_delay() if hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = False
+                    hedged = launch()
+                    if hedged:
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is not primary:
+                            self.hedge_wins += 1
+                        return _Tagged(backend, task.result())
+                    error = task.exception()
+                if not pending and launch():
+                    self.failovers += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            # Провайдеры, до которых очередь не дошла, не должны остаться с незавершённым пробным запросом
+            for backend in queue:
+                backend.breaker.release()
+        raise WeatherUnavailable("All weather providers failed") from error
+
+    def decode(self, raw: _Tagged) -> _Tagged:
+        return _Tagged(raw.backend, raw.backend.api.decode(raw.raw))
+
+    def parse_current(self, doc: _Tagged) -> WeatherPoint:
+        return doc.backend.api.parse_current(doc.raw)
+
+    def parse_forecast(self, doc: _Tagged) -> Sequence[Forecast]:
+        return doc.backend.api.parse_forecast(doc.raw)
+
+    def parse_hourly(self, doc: _Tagged) -> HourlyForecast:
+        return doc.backend.api.parse_hourly(doc.raw)
+
+    async def coords_by_city(self, city: str) -> Optional[Coordinates]:
+        for backend in self._backends:
+            coordinates = await backend.api.coords_by_city(city)
+            if coordinates is not None:
+                return coordinates
@@ -1,17 +1,66 @@
 from enum import Enum, auto
+from typing import Dict, Tuple, Optional, Sequence
 
+from .cache import CachedWeatherAPI, CacheOptions
+from .composite import CompositeWeatherAPI, HedgeOptions
+from .open_meteo import OpenMeteoWeatherAPI
+from .session import HTTPOptions
+from .stub import StubWeatherAPI
 from .weather_base import WeatherAPIBase
-from .yandex import YandexWeatherAPI
+from .yandex import YandexWeatherAPI, API_URL
 
 
 class WeatherAPIType(Enum):
     Yandex = auto()
+    OpenMeteo = auto()
+    Stub = auto()
 
 
 class WeatherFactory:
+    _instances: Dict[tuple, WeatherAPIBase] = {}
+
     @staticmethod
-    def create(type_: WeatherAPIType, token: str) -> WeatherAPIBase:
+    def _provider(type_: WeatherAPIType, token: str, http: Optional[HTTPOptions], rate: str, days: int,
+                  url: Optional[str]) -> WeatherAPIBase:
         if type_ == WeatherAPIType.Yandex:
-            return YandexWeatherAPI(token)
-        else:
-            raise NotImplemented
+            return YandexWeatherAPI(token, http, rate=rate, days=days, url=url or API_URL)
+        if type_ == WeatherAPIType.OpenMeteo:
+            return OpenMeteoWeatherAPI(http, days=days)
+        if type_ == WeatherAPIType.Stub:
+            return StubWeatherAPI(days=days)
+        raise NotImplementedError(type_)
+
+    @staticmethod
+    def create(type_: WeatherAPIType, token: str,
+               http: Optional[HTTPOptions] = None,
+               cache: Optional[CacheOptions] = None,
+               rate: str = "informers",
+               days: int = 3,
+               url: Optional[str] = None,
+               fallback: Sequence[WeatherAPIType] = (),
+               hedge: Optional[HedgeOptions] = None,
+               ) -> WeatherAPIBase:
+        """
+        Возвращает общий на весь процесс экземпляр провайдера. Параметры учитываются только при первом вызове
+        :param url: Адрес API основного провайдера
+        :param fallback: Запасные провайдеры. Если заданы, запросы идут через CompositeWeatherAPI:
+                         с дублированием медленных запросов и обходом упавших провайдеров
+        """
+        key: Tuple = (type_, token, tuple(fallback))
+        api = WeatherFactory._instances.get(key)
+        if api is None:
+            provider = WeatherFactory._provider(type_, token, http, rate, days, url)
+            if fallback:
+                provider = CompositeWeatherAPI(
+                    [provider] + [WeatherFactory._provider(t, token, http, rate, days, None) for t in fallback],
+                    hedge,
+                )
+            api = CachedWeatherAPI(provider, cache)
+            WeatherFactory._instances[key] = api
+        return api
+
+    @staticmethod
+    async def close_all() -> None:
+        for api in WeatherFactory._instances.values():
+            await api.close()
+        WeatherFactory._instances.clear()
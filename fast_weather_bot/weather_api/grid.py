@@ -0,0 +1,32 @@
+import math
+from typing import Tuple
+
+from fast_weather_bot.entity import Coordinates
+
+Cell = Tuple[int, int]
+
+
+def cell_of(coordinates: Coordinates, step: float) -> Cell:
+    """
+    Ячейка координатной сетки с шагом step градусов, в которую попадает точка
+    """
+    return math.floor(coordinates.lat / step), math.floor(coordinates.lon / step)
+
+
+def cell_center(cell: Cell, step: float) -> Coordinates:
+    """
+    Центр ячейки. Погода запрашивается именно для него, чтобы все точки ячейки получали один ответ
+    """
+    return Coordinates.construct(lat=round((cell[0] + 0.5) * step, 6), lon=round((cell[1] + 0.5) * step, 6))
+
+
+def cell_key(cell: Cell) -> int:
+    """
+    Ячейка одним числом: широта в старших 32 битах, долгота в младших. Порядок ключей - порядок ячеек
+    """
+    return (cell[0] << 32) | (cell[1] & 0xFFFFFFFF)
+
+
+def key_cell(key: int) -> Cell:
+    lon = key & 0xFFFFFFFF
+    return key >> 32, lon - (1 << 32) if lon >= 1 << 31 else lon
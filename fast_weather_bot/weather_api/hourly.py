@@ -0,0 +1,244 @@
+import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from fast_weather_bot.entity import WeatherCondition, WindDirection, DayPart, Forecast
+
+# Коды состояний в массиве condition - значения WeatherCondition
+CLEAR_CODES = np.array([WeatherCondition.Clear.value, WeatherCondition.Clouds.value], dtype=np.int8)
+PRECIPITATION_CODES = np.array([WeatherCondition.Drizzle.value, WeatherCondition.Rain.value,
+                                WeatherCondition.Snow.value, WeatherCondition.Thunderstorm.value], dtype=np.int8)
+
+# Насколько состояние хуже ясного. Для части суток показывается самое плохое состояние из её часов
+_severity_order = (WeatherCondition.Clear, WeatherCondition.Clouds, WeatherCondition.Drizzle,
+                   WeatherCondition.Rain, WeatherCondition.Snow, WeatherCondition.Thunderstorm)
+SEVERITY = np.zeros(max(c.value for c in WeatherCondition) + 1, dtype=np.int8)
+for _rank, _condition in enumerate(_severity_order):
+    SEVERITY[_condition.value] = _rank
+_BY_SEVERITY = np.array([c.value for c in _severity_order], dtype=np.int8)
+
+# Части суток по местному часу начала
+_PART_BY_HOUR = {0: DayPart.Night, 6: DayPart.Morning, 12: DayPart.Day, 18: DayPart.Evening}
+
+HOUR = 3600
+
+
+class HourlyForecast:
+    """
+    Почасовой прогноз на несколько дней в колонках NumPy. Срез (forecast[a:b], window) не копирует данные
+    """
+    __slots__ = ("time", "temperature", "precipitation", "precipitation_probability", "wind_speed",
+                 "wind_direction", "pressure", "humidity", "condition", "utc_offset")
+
+    # Колонки и их типы, в том же порядке, что и параметры конструктора
+    columns: Dict[str, type] = {
+        "time": np.int64,  # Unix-время начала часа
+        "temperature": np.float32,  # Температура в градусах Цельсия
+        "precipitation": np.float32,  # Осадки за час в мм
+        "precipitation_probability": np.float32,  # Вероятность осадков (%)
+        "wind_speed": np.float32,  # Скорость ветра (м/с)
+        "wind_direction": np.int8,  # Коды WindDirection
+        "pressure": np.float32,  # Давление в мм ртутного столба
+        "humidity": np.float32,  # Относительная влажность (%)
+        "condition": np.int8,  # Коды WeatherCondition
+    }
+
+    def __init__(self, time: np.ndarray, temperature: np.ndarray, precipitation: np.ndarray,
+                 precipitation_probability: np.ndarray, wind_speed: np.ndarray, wind_direction: np.ndarray,
+                 pressure: np.ndarray, humidity: np.ndarray, condition: np.ndarray,
+                 utc_offset: int = 0,
+                 ):
+        """
+        :param utc_offset: Смещение местного времени точки от UTC в секундах, по нему делятся сутки
+        """
+        self.time = time
+        self.temperature = temperature
+        self.precipitation = precipitation
+        self.precipitation_probability = precipitation_probability
+        self.wind_speed = wind_speed
+        self.wind_direction = wind_direction
+        self.pressure = pressure
+        self.humidity = humidity
+        self.condition = condition
+        self.utc_offset = utc_offset
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], utc_offset: int = 0) -> "HourlyForecast":
+        """
+        Собирает прогноз из строк в порядке columns. Строки сортируются по времени
+        """
+        rows = sorted(rows)
+        if not rows:
+            return cls(*(np.empty(0, dtype) for dtype in cls.columns.values()), utc_offset=utc_offset)
+        columns = zip(*rows)
+        return cls(*(np.array(column, dtype) for column, dtype in zip(columns, cls.columns.values())),
+                   utc_offset=utc_offset)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, item: slice) -> "HourlyForecast":
+        if not isinstance(item, slice):
+            raise TypeError("HourlyForecast supports only slices")
+        return HourlyForecast(*(getattr(self, name)[item] for name in self.columns), utc_offset=self.utc_offset)
+
+    def __repr__(self) -> str:
+        if not len(self):
+            return "<HourlyForecast empty>"
+        return f"<HourlyForecast {len(self)}h from {int(self.time[0])}>"
+
+    def window(self, start: float, hours: float) -> "HourlyForecast":
+        """
+        Часы, которые заканчиваются после start и начинаются раньше start + hours часов
+        """
+        first = int(np.searchsorted(self.time, start - HOUR, side="right"))
+        last = int(np.searchsorted(self.time, start + hours * HOUR, side="left"))
+        return self[first:last]
+
+    def local_hour(self) -> np.ndarray:
+        return (self.time + self.utc_offset) // HOUR % 24
+
+    # Запросы
+
+    @staticmethod
+    def first(mask: np.ndarray) -> Optional[int]:
+        """
+        Индекс первого True или None
+        """
+        if not len(mask):
+            return None
+        i = int(np.argmax(mask))
+        return i if mask[i] else None
+
+    def first_condition(self, codes: np.ndarray) -> Optional[int]:
+        """
+        Первый час с одним из состояний codes, например с PRECIPITATION_CODES - первый час осадков
+        """
+        return self.first(np.isin(self.condition, codes))
+
+    def bad_weather(self) -> np.ndarray:
+        """
+        Маска часов с погодой хуже облачной
+        """
+        return ~np.isin(self.condition, CLEAR_CODES)
+
+    @staticmethod
+    def rolling_min(column: np.ndarray, width: int) -> np.ndarray:
+        """
+        Минимум в скользящем окне из width часов, i-й элемент - окно [i, i + width)
+        """
+        if len(column) < width:
+            return column[:0]
+        return sliding_window_view(column, width).min(axis=1)
+
+    @staticmethod
+    def rolling_max(column: np.ndarray, width: int) -> np.ndarray:
+        if len(column) < width:
+            return column[:0]
+        return sliding_window_view(column, width).max(axis=1)
+
+    @staticmethod
+    def runs(mask: np.ndarray, min_length: int = 1) -> np.ndarray:
+        """
+        Отрезки подряд идущих True не короче min_length часов
+        :return: Массив формы (n, 2) с началом и концом (не включительно) каждого отрезка
+        """
+        edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        stops = np.flatnonzero(edges == -1)
+        keep = stops - starts >= min_length
+        return np.stack((starts[keep], stops[keep]), axis=1)
+
+    def above(self, column: str, threshold: float, min_length: int = 1) -> np.ndarray:
+        """
+        Окна, когда значение колонки не меньше порога, например порывы ветра от 15 м/с не меньше 2 часов подряд
+        """
+        return self.runs(getattr(self, column) >= threshold, min_length)
+
+    def below(self, column: str, threshold: float, min_length: int = 1) -> np.ndarray:
+        return self.runs(getattr(self, column) <= threshold, min_length)
+
+    # Сводка
+
+    def part_bounds(self) -> np.ndarray:
+        """
+        Индексы начала частей суток (ночь, утро, день, вечер по местному времени)
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.intp)
+        part = self.local_hour() // 6
+        day = (self.time + self.utc_offset) // (24 * HOUR)
+        key = day * 4 + part
+        return np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+
+    def summary(self, bounds: Optional[np.ndarray] = None) -> "Summary":
+        """
+        Сводка по отрезкам, которые начинаются с индексов bounds (по умолчанию - по частям суток)
+        """
+        if bounds is None:
+            bounds = self.part_bounds()
+        return Summary(self, bounds)
+
+
+class Summary:
+    """
+    Сводка почасового прогноза по отрезкам: все величины считаются разом через reduceat
+    """
+    __slots__ = ("time", "part", "min_temperature", "max_temperature", "precipitation", "wind_speed",
+                 "wind_direction", "pressure", "humidity", "condition", "utc_offset")
+
+    def __init__(self, hourly: HourlyForecast, bounds: np.ndarray):
+        self.utc_offset = hourly.utc_offset
+        if not len(hourly) or not len(bounds):
+            empty = hourly[:0]
+            for name in self.__slots__[:-1]:
+                setattr(self, name, getattr(empty, name, empty.temperature))
+            return
+        lengths = np.diff(np.append(bounds, len(hourly)))
+        self.time = hourly.time[bounds]
+        self.part = hourly.local_hour()[bounds] // 6 * 6
+        self.min_temperature = np.minimum.reduceat(hourly.temperature, bounds)
+        self.max_temperature = np.maximum.reduceat(hourly.temperature, bounds)
+        self.precipitation = np.add.reduceat(hourly.precipitation, bounds)
+        self.pressure = np.add.reduceat(hourly.pressure, bounds) / lengths
+        self.humidity = np.add.reduceat(hourly.humidity, bounds) / lengths
+        self.condition = _BY_SEVERITY[np.maximum.reduceat(SEVERITY[hourly.condition], bounds)]
+        # Ветер показывается для самого ветреного часа отрезка
+        self.wind_speed = np.maximum.reduceat(hourly.wind_speed, bounds)
+        segment = np.repeat(np.arange(len(bounds)), lengths)
+        windiest = np.lexsort((-hourly.wind_speed, segment))[bounds]
+        self.wind_direction = hourly.wind_direction[windiest]
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def forecasts(self) -> Tuple[Forecast, ...]:
+        """
+        Отрезки в виде Forecast, для форматирования текста
+        """
+        tz = datetime.timezone(datetime.timedelta(seconds=self.utc_offset))
+        time = self.time.tolist()
+        part = self.part.tolist()
+        min_temperature = np.rint(self.min_temperature).astype(int).tolist()
+        max_temperature = np.rint(self.max_temperature).astype(int).tolist()
+        pressure = np.rint(self.pressure).astype(int).tolist()
+        humidity = np.rint(self.humidity).astype(int).tolist()
+        wind_speed = np.round(self.wind_speed.astype(np.float64), 1).tolist()
+        wind_direction = self.wind_direction.tolist()
+        condition = self.condition.tolist()
+        return tuple(
+            Forecast.construct(
+                time=datetime.datetime.fromtimestamp(time[i], tz),
+                part=_PART_BY_HOUR[part[i]],
+                min_temperature=min_temperature[i],
+                max_temperature=max_temperature[i],
+                pressure=pressure[i],
+                condition=WeatherCondition(condition[i]),
+                wind_speed=wind_speed[i],
+                wind_direction=WindDirection(wind_direction[i]),
+                humidity=humidity[i],
+            )
+            for i in range(len(time))
+        )
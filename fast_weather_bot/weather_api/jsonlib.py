@@ -0,0 +1,28 @@
+"""
+Разбор JSON ответов провайдеров и обновлений Telegram. Если установлен orjson, используется он, иначе стандартный json
+"""
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+else:
+    import json
+
+    BACKEND = "json"
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
@@ -0,0 +1,114 @@
+import datetime
+import time
+from typing import Optional, Sequence
+
+import aiohttp
+import numpy as np
+
+from fast_weather_bot.entity import WeatherPoint, Coordinates, WeatherCondition, WindDirection, Forecast
+from .hourly import HourlyForecast
+from .jsonlib import loads
+from .session import HTTPOptions, create_session
+from .weather_base import WeatherAPIBase
+
+API_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Коды погоды WMO -> WeatherCondition
+_WMO = np.full(100, WeatherCondition.Clouds.value, dtype=np.int8)
+_WMO[0] = WeatherCondition.Clear.value
+for _codes, _condition in (((51, 53, 55, 56, 57), WeatherCondition.Drizzle),
+                           ((61, 63, 65, 66, 67, 80, 81, 82), WeatherCondition.Rain),
+                           ((71, 73, 75, 77, 85, 86), WeatherCondition.Snow),
+                           ((95, 96, 99), WeatherCondition.Thunderstorm)):
+    _WMO[list(_codes)] = _condition.value
+
+# Направление ветра в градусах по секторам 45° начиная с севера
+_SECTORS = np.array([d.value for d in (WindDirection.N, WindDirection.NE, WindDirection.E, WindDirection.SE,
+                                       WindDirection.S, WindDirection.SW, WindDirection.W, WindDirection.NW)],
+                    dtype=np.int8)
+_CALM = 0.5  # Ветер слабее этого (м/с) считается штилем
+
+_HPA_TO_MM = 0.750062
+
+_HOURLY = ("temperature_2m", "precipitation", "precipitation_probability", "wind_speed_10m", "wind_direction_10m",
+           "pressure_msl", "relative_humidity_2m", "weather_code")
+_CURRENT = ("temperature_2m", "relative_humidity_2m", "pressure_msl", "wind_speed_10m", "wind_direction_10m",
+            "weather_code")
+
+
+def _wind_directions(degrees: np.ndarray, speed: np.ndarray) -> np.ndarray:
+    directions = _SECTORS[np.rint(np.nan_to_num(degrees) / 45).astype(np.intp) % 8]
+    return np.where(speed < _CALM, np.int8(WindDirection.C.value), directions)
+
+
+class OpenMeteoWeatherAPI(WeatherAPIBase):
+    """
+    Клиент открытого API Open-Meteo, ключ не нужен. Почасовой прогноз отдаётся всегда,
+    прогноз на части суток собирается из него
+    """
+
+    def __init__(self, http: Optional[HTTPOptions] = None, days: int = 3, url: str = API_URL):
+        self._http = http or HTTPOptions()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._url = url
+        self._params = {"current": ",".join(_CURRENT), "hourly": ",".join(_HOURLY), "forecast_days": str(days),
+                        "wind_speed_unit": "ms", "timeformat": "unixtime", "timezone": "auto"}
+
+    async def open(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = create_session(self._http)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(self, coordinates: Coordinates) -> bytes:
+        if self._session is None or self._session.closed:
+            await self.open()
+        params = dict(self._params, latitude=str(coordinates.lat), longitude=str(coordinates.lon))
+        async with self._session.get(self._url, params=params) as response:
+            return await response.read()
+
+    def decode(self, raw: bytes) -> dict:
+        return loads(raw)
+
+    def parse_current(self, doc: dict) -> WeatherPoint:
+        current = doc["current"]
+        speed = float(current["wind_speed_10m"])
+        direction = _wind_directions(np.array([current["wind_direction_10m"]], dtype=np.float64),
+                                     np.array([speed]))[0]
+        return WeatherPoint.construct(
+            time=datetime.datetime.fromtimestamp(current["time"]),
+            temperature=round(current["temperature_2m"]),
+            pressure=round(current["pressure_msl"] * _HPA_TO_MM),
+            condition=WeatherCondition(int(_WMO[int(current["weather_code"]) % 100])),
+            wind_speed=speed,
+            wind_direction=WindDirection(int(direction)),
+            humidity=round(current["relative_humidity_2m"]),
+        )
+
+    def parse_hourly(self, doc: dict) -> HourlyForecast:
+        hourly = doc["hourly"]
+
+        # null в ответе превращается в nan, для осадков это ноль
+        def column(name: str, dtype=np.float32) -> np.ndarray:
+            return np.nan_to_num(np.array(hourly[name], dtype=np.float64)).astype(dtype)
+
+        wind_speed = column("wind_speed_10m")
+        return HourlyForecast(
+            time=np.array(hourly["time"], dtype=np.int64),
+            temperature=column("temperature_2m"),
+            precipitation=column("precipitation"),
+            precipitation_probability=column("precipitation_probability"),
+            wind_speed=wind_speed,
+            wind_direction=_wind_directions(column("wind_direction_10m", np.float64), wind_speed),
+            pressure=column("pressure_msl") * np.float32(_HPA_TO_MM),
+            humidity=column("relative_humidity_2m"),
+            condition=_WMO[column("weather_code", np.intp) % 100],
+            utc_offset=doc.get("utc_offset_seconds", 0),
+        )
+
+    def parse_forecast(self, doc: dict) -> Sequence[Forecast]:
+        # Как тариф informers Яндекса: две ближайшие части суток
+        return self.parse_hourly(doc).window(time.time(), 12).summary().forecasts()[:2]
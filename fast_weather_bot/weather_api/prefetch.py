@@ -0,0 +1,76 @@
+import datetime
+import zlib
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from loguru import logger
+
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.options import PrefetchOptions
+from fast_weather_bot.scheduler import Scheduler, Job
+from .cache import CachedWeatherAPI
+from .grid import Cell, cell_of, cell_center
+
+
+class Prefetcher:
+    """
+    Обновляет кэш незадолго до отправки прогнозов по расписанию, чтобы в момент отправки ответ уже был свежим.
+    Доставки группируются по времени и ячейке сетки: на пару приходится одна задача, сколько бы чатов её ни ждали.
+    Время обновления сдвигается на постоянную для ячейки долю jitter, и запросы к провайдеру не уходят пачкой
+    """
+
+    def __init__(self, scheduler: Scheduler, weather_api: CachedWeatherAPI,
+                 options: Optional[PrefetchOptions] = None,
+                 grid_step: float = 0.05,
+                 ):
+        self._scheduler = scheduler
+        self._weather_api = weather_api
+        self._options = options or PrefetchOptions()
+        self._grid_step = grid_step
+        self._deliveries: Dict[Hashable, Tuple[datetime.time, Cell]] = {}
+        self._waiting: Dict[Tuple[datetime.time, Cell], Set[Hashable]] = {}
+        self._jobs: Dict[Tuple[datetime.time, Cell], Job] = {}
+        self.prefetched = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _offset(self, cell: Cell) -> float:
+        return self._options.lead + zlib.crc32(repr(cell).encode()) % 1000 / 1000 * self._options.jitter
+
+    def _prefetch_time(self, at: datetime.time, cell: Cell) -> datetime.time:
+        # Дата любая: нужно только время суток с переходом через полночь
+        delivery = datetime.datetime.combine(datetime.date(2000, 1, 2), at)
+        return (delivery - datetime.timedelta(seconds=self._offset(cell))).time()
+
+    def add(self, key: Hashable, at: datetime.time, coordinates: Coordinates) -> None:
+        """
+        Запоминает ежедневную доставку key в время at. Повторный вызов с тем же key заменяет доставку
+        """
+        self.remove(key)
+        slot = (at, cell_of(coordinates, self._grid_step))
+        self._deliveries[key] = slot
+        waiting = self._waiting.setdefault(slot, set())
+        waiting.add(key)
+        if slot not in self._jobs:
+            self._jobs[slot] = self._scheduler.daily(self._prefetch_time(*slot), self._prefetch, slot[1])
+
+    def remove(self, key: Hashable) -> None:
+        slot = self._deliveries.pop(key, None)
+        if slot is None:
+            return
+        waiting = self._waiting[slot]
+        waiting.discard(key)
+        if not waiting:
+            del self._waiting[slot]
+            self._scheduler.cancel(self._jobs.pop(slot))
+
+    async def _prefetch(self, cell: Cell) -> None:
+        try:
+            await self._weather_api.refresh(cell_center(cell, self._grid_step))
+        except Exception as e:
+            # Не страшно: в момент отправки прогноз будет запрошен как обычно
+            self.failed += 1
+            logger.warning(f"Prefetch of {cell} failed: {e!r}")
+            return
+        self.prefetched += 1
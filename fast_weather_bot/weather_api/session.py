@@ -0,0 +1,18 @@
+import aiohttp
+
+from fast_weather_bot.options import HTTPOptions
+
+
+def create_session(options: HTTPOptions) -> aiohttp.ClientSession:
+    """
+    Создаёт долгоживущую сессию с пулом соединений. Закрывать её должен владелец
+    """
+    connector = aiohttp.TCPConnector(
+        limit=options.limit,
+        limit_per_host=options.limit_per_host,
+        keepalive_timeout=options.keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=options.dns_cache_ttl,
+    )
+    timeout = aiohttp.ClientTimeout(total=options.timeout, connect=options.connect_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, raise_for_status=True)
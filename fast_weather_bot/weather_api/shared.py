@@ -0,0 +1,58 @@
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+from fast_weather_bot.entity import Forecast, WeatherPoint
+from .grid import Cell
+from .hourly import HourlyForecast
+
+# Разобранный ответ: текущая погода, прогноз по частям суток, почасовой прогноз
+Decoded = Tuple[WeatherPoint, Sequence[Forecast], HourlyForecast]
+
+
+class SharedStore:
+    """
+    Общий для процессов бота кэш разобранной погоды в файле SQLite. Ответ, полученный одним воркером,
+    читают остальные, не обращаясь к API и не разбирая его заново
+    """
+
+    # Раз в столько записей удаляются ответы старше max_age
+    sweep_every = 1000
+
+    def __init__(self, path: str, max_age: float):
+        self._max_age = max_age
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS weather (lat INTEGER NOT NULL, lon INTEGER NOT NULL, "
+                           "fetched_at REAL NOT NULL, data BLOB NOT NULL, PRIMARY KEY (lat, lon)) WITHOUT ROWID")
+        self._writes = 0
+        # Воркер обращается к кэшу из потоков исполнителя через одно соединение
+        self._lock = threading.Lock()
+
+    def get(self, cell: Cell, max_age: float) -> Optional[Tuple[float, Decoded]]:
+        """
+        :return: Время получения ответа (time.time()) и сам ответ, если он моложе max_age секунд
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT fetched_at, data FROM weather "
+                                     "WHERE lat = ? AND lon = ? AND fetched_at > ?",
+                                     (*cell, time.time() - max_age)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1])
+
+    def put(self, cell: Cell, fetched_at: float, decoded: Decoded) -> None:
+        data = pickle.dumps(decoded, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO weather (lat, lon, fetched_at, data) VALUES (?, ?, ?, ?)",
+                               (*cell, fetched_at, data))
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                self._conn.execute("DELETE FROM weather WHERE fetched_at < ?", (time.time() - self._max_age,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,62 @@
+import asyncio
+import datetime
+import random
+import time
+from typing import Optional, Sequence, Tuple
+
+from fast_weather_bot.entity import WeatherPoint, Coordinates, WeatherCondition, WindDirection, Forecast
+from .hourly import HourlyForecast, HOUR
+from .weather_base import WeatherAPIBase
+
+
+class StubWeatherAPI(WeatherAPIBase):
+    """
+    Локальный провайдер без сети для тестов и прогонов: погода зависит только от координат и часа,
+    задержку и долю ошибок можно задать
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, days: int = 3, seed: Optional[int] = None):
+        """
+        :param latency: Задержка ответа в секундах
+        :param error_rate: Доля запросов, которые завершаются ConnectionError
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self._days = days
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    async def fetch(self, coordinates: Coordinates) -> Tuple[Coordinates, float]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ConnectionError("Stub weather provider failure")
+        return coordinates, time.time()
+
+    @staticmethod
+    def _temperature(coordinates: Coordinates, hour: int) -> float:
+        # Теплее у экватора, днём теплее, чем ночью
+        return 30 - abs(coordinates.lat) / 2 + 5 * (1 - abs(hour - 14) / 12)
+
+    def parse_current(self, raw: Tuple[Coordinates, float]) -> WeatherPoint:
+        coordinates, fetched_at = raw
+        now = datetime.datetime.fromtimestamp(fetched_at)
+        return WeatherPoint.construct(time=now, temperature=round(self._temperature(coordinates, now.hour)),
+                                      pressure=750, condition=WeatherCondition.Clouds, wind_speed=3.0,
+                                      wind_direction=WindDirection.W, humidity=60)
+
+    def parse_hourly(self, raw: Tuple[Coordinates, float]) -> HourlyForecast:
+        coordinates, fetched_at = raw
+        start = int(fetched_at) // HOUR * HOUR
+        rows = []
+        for i in range(self._days * 24):
+            t = start + i * HOUR
+            hour = datetime.datetime.fromtimestamp(t).hour
+            rows.append((t, self._temperature(coordinates, hour), 0.0, 10.0, 3.0, WindDirection.W.value, 750.0,
+                         60.0, WeatherCondition.Clouds.value))
+        offset = int(datetime.datetime.fromtimestamp(fetched_at).astimezone().utcoffset().total_seconds())
+        return HourlyForecast.from_rows(rows, utc_offset=offset)
+
+    def parse_forecast(self, raw: Tuple[Coordinates, float]) -> Sequence[Forecast]:
+        return self.parse_hourly(raw).window(raw[1], 12).summary().forecasts()[:2]
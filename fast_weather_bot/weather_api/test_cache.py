@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+from typing import Any, Sequence
+
+import pytest
+
+from fast_weather_bot.entity import Coordinates, WeatherPoint, Forecast, WeatherCondition, WindDirection
+from fast_weather_bot.snapshot import Snapshot, write
+from .cache import CachedWeatherAPI, CacheOptions
+from .hourly import HourlyForecast
+from .weather_base import WeatherAPIBase
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class FakeWeatherAPI(WeatherAPIBase):
+    def __init__(self):
+        self.fetched = []
+        self.decoded = 0
+
+    async def fetch(self, coordinates: Coordinates) -> Any:
+        self.fetched.append(coordinates)
+        return {"temp": len(self.fetched)}
+
+    def decode(self, raw: Any) -> Any:
+        self.decoded += 1
+        return raw
+
+    def parse_current(self, raw: Any) -> WeatherPoint:
+        return WeatherPoint(time=datetime.datetime(2021, 1, 1), temperature=raw["temp"], pressure=750,
+                            condition=WeatherCondition.Clear, wind_speed=1, wind_direction=WindDirection.N,
+                            humidity=50)
+
+    def parse_forecast(self, raw: Any) -> Sequence[Forecast]:
+        return ()
+
+    def parse_hourly(self, raw: Any) -> HourlyForecast:
+        return HourlyForecast.from_rows(())
+
+    async def coords_by_city(self, city: str) -> Coordinates:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_one_fetch_per_cell():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions(grid_step=0.1))
+    await cache.current(Coordinates(lat=55.81, lon=37.61))
+    await cache.forecast(Coordinates(lat=55.82, lon=37.62))
+    await cache.current(Coordinates(lat=55.89, lon=37.69))
+    assert len(api.fetched) == 1
+    assert cache.hits == 2 and cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_separate_ttl():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions(current_ttl=0, forecast_ttl=60, stale_ttl=0))
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    assert (await cache.current(coordinates)).temperature == 1
+    await cache.forecast(coordinates)
+    assert (await cache.current(coordinates)).temperature == 2
+    assert len(api.fetched) == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions(grid_step=1, max_size=2))
+    for lat in (1.5, 2.5, 1.5, 3.5):
+        await cache.current(Coordinates(lat=lat, lon=0.5))
+    assert len(cache) == 2
+    await cache.current(Coordinates(lat=1.5, lon=0.5))
+    assert len(api.fetched) == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_fetch_once():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api)
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    await asyncio.gather(*(cache.current(coordinates) for _ in range(5)))
+    assert len(api.fetched) == 1
+    assert cache.flight.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions(current_ttl=0, stale_ttl=60))
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    assert (await cache.current(coordinates)).temperature == 1
+    # Устаревший ответ отдаётся сразу, свежий приходит в фоне
+    assert (await cache.current(coordinates)).temperature == 1
+    assert cache.stale == 1
+    await asyncio.sleep(0.01)
+    assert len(api.fetched) == 2
+    assert (await cache.current(coordinates)).temperature == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api)
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    await cache.current(coordinates)
+    await cache.refresh(coordinates)
+    assert (await cache.current(coordinates)).temperature == 2
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_between_processes(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    first, second = FakeWeatherAPI(), FakeWeatherAPI()
+    first_cache = CachedWeatherAPI(first, CacheOptions(shared_path=path))
+    second_cache = CachedWeatherAPI(second, CacheOptions(shared_path=path))
+    assert (await first_cache.current(coordinates)).temperature == 1
+    # Ответ кладётся в общий кэш в фоне
+    await asyncio.gather(*first_cache._sharing)
+    assert (await second_cache.current(coordinates)).temperature == 1
+    assert len(first.fetched) == 1 and second.fetched == []
+    assert second_cache.shared_hits == 1
+    # Ответ, только что полученный другим процессом, годится и для обновления перед рассылкой
+    await second_cache.refresh(coordinates)
+    assert second.fetched == [] and second_cache.shared_hits == 2
+    await first_cache.close()
+    await second_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_warm_from_snapshot(tmp_path):
+    path = str(tmp_path / "bot.snapshot")
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    cache = CachedWeatherAPI(FakeWeatherAPI(), CacheOptions())
+    await cache.current(coordinates)
+    write(path, cache.decoded(), {})
+
+    # После перезапуска ячейка берётся из снимка, а нетронутые ячейки переходят в следующий снимок
+    api = FakeWeatherAPI()
+    restarted = CachedWeatherAPI(api, CacheOptions())
+    restarted.warm(Snapshot(path))
+    assert [cell for cell, _, _ in restarted.decoded()] == [cell for cell, _, _ in cache.decoded()]
+    assert (await restarted.current(coordinates)).temperature == 1
+    assert api.fetched == [] and restarted.restored == 1
+    assert (await restarted.current(Coordinates(lat=10, lon=10))).temperature == 1
+    assert len(api.fetched) == 1
+
+
+@pytest.mark.asyncio
+async def test_take_fetched():
+    cache = CachedWeatherAPI(FakeWeatherAPI(), CacheOptions())
+    await cache.current(Coordinates(lat=55.8, lon=37.6))
+    # Ответы запоминаются только после первого вызова
+    assert cache.take_fetched() == []
+    await cache.current(Coordinates(lat=10, lon=10))
+    await cache.current(Coordinates(lat=55.8, lon=37.6))
+    fetched = cache.take_fetched()
+    assert len(fetched) == 1 and fetched[0][2][0].temperature == 2
+    assert cache.take_fetched() == []
+
+
+@pytest.mark.asyncio
+async def test_decode_once_per_response():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions())
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+    await cache.current(coordinates)
+    await cache.forecast(coordinates)
+    await cache.hourly(coordinates)
+    assert api.decoded == 1
+    await cache.refresh(coordinates)
+    await cache.hourly(coordinates)
+    assert api.decoded == 2
+
+
+@pytest.mark.asyncio
+async def test_parse_failure_keeps_other_parts():
+    api = FakeWeatherAPI()
+    cache = CachedWeatherAPI(api, CacheOptions())
+    coordinates = Coordinates(lat=55.8, lon=37.6)
+
+    def broken(doc: Any) -> Sequence[Forecast]:
+        raise ValueError("unexpected forecast")
+
+    api.parse_forecast = broken
+    with pytest.raises(ValueError):
+        await cache.forecast(coordinates)
+    # Ошибка в прогнозе не мешает отдавать текущую погоду и почасовой прогноз из того же ответа
+    assert (await cache.current(coordinates)).temperature == 1
+    assert len(await cache.hourly(coordinates)) == 0
+    assert len(api.fetched) == 1 and api.decoded == 1
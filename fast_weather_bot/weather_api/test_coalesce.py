@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from .coalesce import SingleFlight
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_coalesced():
+    flight = SingleFlight()
+    executed = 0
+
+    async def fetch():
+        nonlocal executed
+        executed += 1
+        await asyncio.sleep(0.01)
+        return executed
+
+    results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(10)))
+    assert results == [1] * 10
+    assert executed == 1
+    assert (flight.calls, flight.executed, flight.coalesced) == (10, 1, 9)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    results = await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.errors == 1
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_one_waiter_keeps_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    first = asyncio.ensure_future(flight.do("key", fetch))
+    second = asyncio.ensure_future(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "ok"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_cancel_all_waiters_cancels_call():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    finished = False
+
+    async def fetch():
+        nonlocal finished
+        started.set()
+        await asyncio.sleep(1)
+        finished = True
+
+    waiter = asyncio.ensure_future(flight.do("key", fetch))
+    await started.wait()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+    assert not finished
+    assert len(flight) == 0
@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+from fast_weather_bot.entity import Coordinates, WeatherCondition, WindDirection
+from .cache import CachedWeatherAPI
+from .composite import CompositeWeatherAPI, HedgeOptions, CircuitBreaker, WeatherUnavailable
+from .open_meteo import OpenMeteoWeatherAPI
+from .stub import StubWeatherAPI
+
+pytest_plugins = ('pytest_asyncio',)
+
+POINT = Coordinates(lat=55.75, lon=37.62)
+
+
+@pytest.mark.asyncio
+async def test_hedge_to_fast_provider():
+    slow = StubWeatherAPI(latency=1.0)
+    fast = StubWeatherAPI(latency=0.01)
+    api = CompositeWeatherAPI([slow, fast], HedgeOptions(initial_delay=0.05))
+    raw = await api.fetch(POINT)
+    assert raw.backend.api is fast
+    assert api.hedged == 1 and api.hedge_wins == 1
+    assert api.parse_current(raw).temperature == StubWeatherAPI().parse_current(raw.raw).temperature
+    # Теперь у быстрого провайдера меньше средняя задержка, и запрос сразу уходит ему
+    assert (await api.fetch(POINT)).backend.api is fast
+    assert slow.calls == 1 and fast.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_failover_and_breaker():
+    primary = StubWeatherAPI()
+    backup = StubWeatherAPI(latency=0.01)
+    api = CompositeWeatherAPI([primary, backup], HedgeOptions(failures=2, reset_timeout=60))
+    assert (await api.fetch(POINT)).backend.api is primary
+    primary.error_rate = 1.0
+    for _ in range(3):
+        assert (await api.fetch(POINT)).backend.api is backup
+    assert api.failovers == 2
+    # После двух ошибок подряд основной провайдер отключён и больше не получает запросов
+    assert primary.calls == 3
+    assert api.stats()["StubWeatherAPI#0"]["state"] == CircuitBreaker.Open
+
+
+@pytest.mark.asyncio
+async def test_all_failed():
+    api = CompositeWeatherAPI([StubWeatherAPI(error_rate=1.0)], HedgeOptions(failures=1))
+    with pytest.raises(WeatherUnavailable):
+        await api.fetch(POINT)
+    with pytest.raises(WeatherUnavailable):
+        await api.fetch(POINT)
+
+
+def test_breaker_half_open():
+    breaker = CircuitBreaker(failures=1, reset_timeout=10)
+    breaker.failure(now=100)
+    assert not breaker.allow(now=105)
+    assert breaker.allow(now=111)
+    assert not breaker.allow(now=111)  # Пробный запрос только один
+    breaker.failure(now=112)
+    assert not breaker.allow(now=115)
+    assert breaker.allow(now=123)
+    breaker.success()
+    assert breaker.allow() and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_cache_over_composite():
+    api = CachedWeatherAPI(CompositeWeatherAPI([StubWeatherAPI(error_rate=1.0), StubWeatherAPI()]))
+    hourly = await api.hourly(POINT)
+    assert len(hourly) == 72
+    assert len(await api.forecast(POINT)) == 2
+    assert api.misses == 1
+
+
+def test_parse_open_meteo():
+    raw = json.dumps({
+        "utc_offset_seconds": 10800,
+        "current": {"time": 1634475600, "temperature_2m": 4.4, "relative_humidity_2m": 70, "pressure_msl": 1013.0,
+                    "wind_speed_10m": 3.2, "wind_direction_10m": 310, "weather_code": 61},
+        "hourly": {"time": [1634475600, 1634479200], "temperature_2m": [4.4, 5.0], "precipitation": [0.3, None],
+                   "precipitation_probability": [80, None], "wind_speed_10m": [3.2, 0.1],
+                   "wind_direction_10m": [310, 90], "pressure_msl": [1013.0, 1012.0],
+                   "relative_humidity_2m": [70, 72], "weather_code": [61, 0]},
+    }).encode()
+    api = OpenMeteoWeatherAPI()
+    doc = api.decode(raw)
+    current = api.parse_current(doc)
+    assert (current.temperature, current.pressure) == (4, 760)
+    assert current.condition == WeatherCondition.Rain and current.wind_direction == WindDirection.NW
+    hourly = api.parse_hourly(doc)
+    assert hourly.utc_offset == 10800
+    assert np.allclose(hourly.precipitation, [0.3, 0])
+    assert hourly.wind_direction.tolist() == [WindDirection.NW.value, WindDirection.C.value]
+    assert hourly.condition.tolist() == [WeatherCondition.Rain.value, WeatherCondition.Clear.value]
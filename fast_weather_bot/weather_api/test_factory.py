@@ -0,0 +1,16 @@
+import pytest
+
+from .factory import WeatherFactory, WeatherAPIType
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_factory_shares_instance():
+    api = WeatherFactory.create(WeatherAPIType.Yandex, "token")
+    assert WeatherFactory.create(WeatherAPIType.Yandex, "token") is api
+    assert WeatherFactory.create(WeatherAPIType.Yandex, "other") is not api
+    await api.open()
+    await WeatherFactory.close_all()
+    assert WeatherFactory.create(WeatherAPIType.Yandex, "token") is not api
+    await WeatherFactory.close_all()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from fast_weather_bot.entity import WeatherCondition, WindDirection, DayPart
+from .hourly import HourlyForecast, PRECIPITATION_CODES
+
+START = 1634418000  # 2021-10-17 00:00 по Москве
+OFFSET = 3 * 3600
+
+
+def make(conditions, temperatures=None, wind=None) -> HourlyForecast:
+    n = len(conditions)
+    temperatures = temperatures or [0] * n
+    wind = wind or [1] * n
+    rows = [(START + i * 3600, temperatures[i], 0.5, 50, wind[i], WindDirection.N.value if i % 2 else
+             WindDirection.S.value, 750, 80, conditions[i].value) for i in range(n)]
+    return HourlyForecast.from_rows(rows, utc_offset=OFFSET)
+
+
+def test_queries():
+    clear, rain = WeatherCondition.Clear, WeatherCondition.Rain
+    hourly = make([clear] * 3 + [rain] * 2 + [clear] + [rain] * 3 + [clear] * 3)
+    assert hourly.first_condition(PRECIPITATION_CODES) == 3
+    assert hourly.runs(hourly.bad_weather()).tolist() == [[3, 5], [6, 9]]
+    assert hourly.runs(hourly.bad_weather(), min_length=3).tolist() == [[6, 9]]
+    window = hourly.window(START + 4 * 3600 + 600, 3)
+    assert window.time.tolist() == [START + h * 3600 for h in (4, 5, 6, 7)]
+    assert window.first_condition(PRECIPITATION_CODES) == 0
+    assert make([clear] * 2).first_condition(PRECIPITATION_CODES) is None
+
+
+def test_rolling_and_thresholds():
+    hourly = make([WeatherCondition.Clear] * 6, temperatures=[1, 5, 3, -2, 0, 4], wind=[3, 16, 17, 4, 15, 2])
+    assert HourlyForecast.rolling_min(hourly.temperature, 3).tolist() == [1, -2, -2, -2]
+    assert HourlyForecast.rolling_max(hourly.temperature, 3).tolist() == [5, 5, 3, 4]
+    assert hourly.above("wind_speed", 15).tolist() == [[1, 3], [4, 5]]
+    assert hourly.above("wind_speed", 15, min_length=2).tolist() == [[1, 3]]
+    assert hourly.below("temperature", 0).tolist() == [[3, 5]]
+
+
+def test_summary_by_day_parts():
+    conditions = [WeatherCondition.Clear] * 6 + [WeatherCondition.Clouds] * 5 + [WeatherCondition.Snow] + \
+                 [WeatherCondition.Drizzle] * 2
+    temperatures = list(range(len(conditions)))
+    wind = [1] * 8 + [9] + [1] * 5
+    forecasts = make(conditions, temperatures, wind).summary().forecasts()
+    assert [f.part for f in forecasts] == [DayPart.Night, DayPart.Morning, DayPart.Day]
+    night, morning, day = forecasts
+    assert (night.min_temperature, night.max_temperature, night.condition) == (0, 5, WeatherCondition.Clear)
+    assert morning.condition == WeatherCondition.Snow
+    assert (morning.wind_speed, morning.wind_direction) == (9, WindDirection.S)
+    assert day.condition == WeatherCondition.Drizzle and day.time.hour == 12
+    assert not len(make([]).summary())
+    assert make([]).summary().forecasts() == ()
+
+
+def test_whole_range_summary():
+    hourly = make([WeatherCondition.Rain] * 4, temperatures=[1, 2, 3, 4])
+    forecast = hourly.summary(np.zeros(1, dtype=np.intp)).forecasts()[0]
+    assert (forecast.min_temperature, forecast.max_temperature) == (1, 4)
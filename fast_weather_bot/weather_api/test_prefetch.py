@@ -0,0 +1,54 @@
+import asyncio
+import datetime
+
+import pytest
+
+from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.scheduler import Scheduler
+from .prefetch import Prefetcher, PrefetchOptions
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+class FakeCache:
+    def __init__(self):
+        self.refreshed = []
+
+    async def refresh(self, coordinates: Coordinates) -> None:
+        self.refreshed.append(coordinates)
+
+
+def test_prefetch_time_wraps_midnight():
+    prefetcher = Prefetcher(Scheduler(), FakeCache(), PrefetchOptions(lead=300, jitter=0))
+    assert prefetcher._prefetch_time(datetime.time(0, 2), (0, 0)) == datetime.time(23, 57)
+
+
+@pytest.mark.asyncio
+async def test_one_job_per_time_and_cell():
+    scheduler = Scheduler(tz=datetime.timezone.utc)
+    cache = FakeCache()
+    prefetcher = Prefetcher(scheduler, cache, PrefetchOptions(lead=300, jitter=240), grid_step=1)
+    at = datetime.time(7, 0)
+    for chat_id in range(5):
+        prefetcher.add((chat_id, at), at, Coordinates(lat=55.5, lon=37.5))
+    prefetcher.add((5, at), at, Coordinates(lat=10.5, lon=10.5))
+    prefetcher.add((6, datetime.time(8, 0)), datetime.time(8, 0), Coordinates(lat=55.5, lon=37.5))
+    assert len(prefetcher) == 3 and len(scheduler) == 3
+
+    # Все обновления - за 5-9 минут до отправки, у разных ячеек в разное время
+    deadlines = sorted(job.deadline for job in scheduler._heap)
+    seven = datetime.datetime.fromtimestamp(deadlines[0], datetime.timezone.utc).replace(hour=7, minute=0, second=0,
+                                                                                         microsecond=0)
+    leads = [seven.timestamp() - deadline for deadline in deadlines[:2]]
+    assert all(300 <= lead < 540 for lead in leads)
+    assert leads[0] != leads[1]
+
+    for deadline in deadlines:
+        scheduler.run_pending(now=deadline)
+    await asyncio.sleep(0)
+    await scheduler.stop()
+    assert len(cache.refreshed) == 3 and prefetcher.prefetched == 3
+
+    for chat_id in range(5):
+        prefetcher.remove((chat_id, at))
+    assert len(prefetcher) == 2
@@ -1,14 +1,55 @@
 import asyncio
+import json
 import os
 
-from fast_weather_bot.entity import Coordinates
+from fast_weather_bot.entity import Coordinates, DayPart, WeatherCondition, WindDirection
 from .yandex import YandexWeatherAPI
 import pytest
 
 pytest_plugins = ('pytest_asyncio',)
 
 
+@pytest.mark.skipif(not os.environ.get("YANDEX_KEY"), reason="needs YANDEX_KEY and network")
 @pytest.mark.asyncio
 async def test_forecast():
     await YandexWeatherAPI(os.environ.get("YANDEX_KEY")).forecast(Coordinates(lat=55.833333, lon=37.616667))
 
+
+PART = {"temp_min": -1, "temp_max": 3, "pressure_mm": 745, "condition": "light-snow", "wind_speed": 2.5,
+        "wind_dir": "c", "humidity": 80}
+FACT = {"obs_time": 1634475000, "temp": 4, "pressure_mm": 747, "condition": "something-new", "wind_speed": 3,
+        "wind_dir": "nw", "humidity": 70}
+
+
+def test_parse_informers():
+    raw = json.dumps({"fact": FACT, "forecast": {"parts": [dict(PART, part_name="evening"),
+                                                            dict(PART, part_name="night")]}}).encode()
+    api = YandexWeatherAPI("token")
+    doc = api.decode(raw)
+    current = api.parse_current(doc)
+    assert current.temperature == 4 and current.wind_direction == WindDirection.NW
+    assert current.condition == WeatherCondition.Clouds
+    forecast = api.parse_forecast(doc)
+    assert [f.part for f in forecast] == [DayPart.Evening, DayPart.Night]
+    assert forecast[0].condition == WeatherCondition.Snow and forecast[0].wind_direction == WindDirection.C
+
+
+def test_parse_forecast_rate():
+    parts = {name: PART for name in ("night", "morning", "day", "evening", "day_short", "night_short")}
+    raw = json.dumps({"fact": FACT, "forecasts": [{"parts": parts, "hours": []}]}).encode()
+    api = YandexWeatherAPI("token", rate="forecast")
+    forecast = api.parse_forecast(api.decode(raw))
+    assert [f.part for f in forecast] == [DayPart.Night, DayPart.Morning, DayPart.Day, DayPart.Evening]
+
+
+def test_parse_hourly_from_parts():
+    parts = [dict(PART, part_name="evening", temp_min=2, temp_max=7, prec_mm=3),
+             dict(PART, part_name="night", condition="clear")]
+    raw = json.dumps({"fact": FACT, "forecast": {"date_ts": 1634428800, "parts": parts}}).encode()
+    api = YandexWeatherAPI("token")
+    hourly = api.parse_hourly(api.decode(raw))
+    assert len(hourly) == 12
+    assert hourly.time[0] == 1634428800 + 18 * 3600 and hourly.time[6] == 1634428800 + 24 * 3600
+    assert (hourly.temperature[:6].min(), hourly.temperature[:6].max()) == (2, 7)
+    assert abs(hourly.precipitation[:6].sum() - 3) < 1e-5
+    assert hourly.condition[6] == WeatherCondition.Clear.value
@@ -1,18 +1,62 @@
 from abc import ABC, abstractmethod
-from typing import Sequence
+from typing import Sequence, Any, Optional
 
 from fast_weather_bot.entity import Coordinates, Forecast, WeatherPoint
+from fast_weather_bot.gazetteer import default_gazetteer
+from .hourly import HourlyForecast
 
 
 class WeatherAPIBase(ABC):
-    @abstractmethod
+    async def open(self) -> None:
+        """
+        Захватывает долгоживущие ресурсы провайдера (сессии, пулы соединений)
+        """
+        pass
+
+    async def close(self) -> None:
+        pass
+
     async def current(self, coordinates: Coordinates) -> WeatherPoint:
+        return self.parse_current(self.decode(await self.fetch(coordinates)))
+
+    async def coords_by_city(self, city: str) -> Optional[Coordinates]:
+        """
+        Координаты города по названию из офлайн-справочника
+        :return: None, если город не найден
+        """
+        return default_gazetteer().coords_by_city(city)
+
+    async def forecast(self, coordinates: Coordinates) -> Sequence[Forecast]:
+        return self.parse_forecast(self.decode(await self.fetch(coordinates)))
+
+    async def hourly(self, coordinates: Coordinates) -> HourlyForecast:
+        """
+        Почасовой прогноз на все дни, которые отдаёт провайдер
+        """
+        return self.parse_hourly(self.decode(await self.fetch(coordinates)))
+
+    @abstractmethod
+    async def fetch(self, coordinates: Coordinates) -> Any:
+        """
+        Запрашивает у провайдера погоду в точке
+        :return: Ответ провайдера, из которого строятся и текущая погода, и прогноз
+        """
+        pass
+
+    def decode(self, raw: Any) -> Any:
+        """
+        Декодирует ответ fetch. Ответ декодируется один раз, и результат получают все parse_*
+        """
+        return raw
+
+    @abstractmethod
+    def parse_current(self, doc: Any) -> WeatherPoint:
         pass
 
     @abstractmethod
-    async def coords_by_city(self, city: str) -> Coordinates:
+    def parse_forecast(self, doc: Any) -> Sequence[Forecast]:
         pass
 
     @abstractmethod
-    async def forecast(self, coordinates: Coordinates) -> Sequence[Forecast]:
+    def parse_hourly(self, doc: Any) -> HourlyForecast:
         pass
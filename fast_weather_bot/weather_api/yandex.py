@@ -1,14 +1,41 @@
 import datetime
-from typing import Sequence, List
+from typing import Sequence, List, Optional, Dict
 
 import aiohttp
-import yandex_weather_api
 
 from fast_weather_bot.entity import WeatherPoint, Coordinates, WeatherCondition, WindDirection, DayPart, Forecast
+from .hourly import HourlyForecast
+from .jsonlib import loads
+from .session import HTTPOptions, create_session
 from .weather_base import WeatherAPIBase
 
+API_URL = "https://api.weather.yandex.ru/v1/"
+
+_conditions: Dict[WeatherCondition, Sequence[str]] = {
+    WeatherCondition.Clear: ("clear",),
+    WeatherCondition.Clouds: ("partly-cloudy", "cloudy", "overcast"),
+    WeatherCondition.Rain: ("partly-cloudy-and-rain", "overcast-and-rain", "cloudy-and-rain",
+                            "rain", "heavy-rain", "showers"),
+    WeatherCondition.Thunderstorm: ("overcast-thunderstorms-with-rain", "thunderstorm", "thunderstorm-with-rain",
+                                    "thunderstorm-with-hail"),
+    WeatherCondition.Drizzle: ("partly-cloudy-and-light-rain", "cloudy-and-light-rain", "overcast-and-light-rain",
+                               "drizzle", "light-rain"),
+    WeatherCondition.Snow: ("overcast-and-wet-snow", "partly-cloudy-and-light-snow", "partly-cloudy-and-snow",
+                            "overcast-and-snow", "cloudy-and-light-snow", "overcast-and-light-snow", "cloudy-and-snow",
+                            "wet-snow", "light-snow", "snow", "snow-showers", "hail"),
+}
+
 
 class YandexWeatherAPI(WeatherAPIBase):
+    """
+    Клиент API Яндекс.Погоды. fetch возвращает тело ответа как есть (bytes), decode декодирует его один раз,
+    а parse_* берут из документа только нужный раздел
+    """
+
+    _condition_conversion: Dict[str, WeatherCondition] = {
+        name: condition for condition, names in _conditions.items() for name in names
+    }
+
     _wind_direction_conversion = {
         "nw": WindDirection.NW,
         "n": WindDirection.N,
@@ -18,6 +45,7 @@ class YandexWeatherAPI(WeatherAPIBase):
         "s": WindDirection.S,
         "sw": WindDirection.SW,
         "w": WindDirection.W,
+        "c": WindDirection.C,
     }
 
     _day_part_conversion = {
@@ -27,37 +55,59 @@ class YandexWeatherAPI(WeatherAPIBase):
         "night": DayPart.Night,
     }
 
-    def __init__(self, token: str):
+    # Для колонок почасового прогноза
+    _condition_codes = {name: condition.value for name, condition in _condition_conversion.items()}
+    _wind_direction_codes = {name: direction.value for name, direction in _wind_direction_conversion.items()}
+    _part_start_hour = {"night": 0, "morning": 6, "day": 12, "evening": 18}
+
+    def __init__(self, token: str, http: Optional[HTTPOptions] = None, rate: str = "informers", days: int = 3,
+                 url: str = API_URL,
+                 ):
+        """
+        :param rate: Тариф: informers (факт и прогноз на две части суток) или forecast (почасовой прогноз)
+        :param days: На сколько дней запрашивать прогноз на тарифе forecast
+        :param url: Адрес API, например локальной заглушки
+        """
         self._token = token
+        self._http = http or HTTPOptions()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._url = url.rstrip("/") + "/" + rate
+        self._headers = {"X-Yandex-API-Key": token}
+        self._params = {"lang": "ru_RU"} if rate == "informers" else \
+            {"lang": "ru_RU", "limit": str(days), "hours": "true", "extra": "false"}
+
+    @classmethod
+    def _convert_condition(cls, condition: str) -> WeatherCondition:
+        # Незнакомые состояния считаем облачностью, чтобы не терять весь ответ
+        return cls._condition_conversion.get(condition, WeatherCondition.Clouds)
+
+    @classmethod
+    def _convert_wind_direction(cls, wind_direction: str) -> WindDirection:
+        return cls._wind_direction_conversion[wind_direction]
+
+    async def open(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = create_session(self._http)
 
-    @staticmethod
-    def _convert_condition(condition: str) -> WeatherCondition:
-        if condition in ("clear",):
-            return WeatherCondition.Clear
-        if condition in ("partly-cloudy", "cloudy", "overcast"):
-            return WeatherCondition.Clouds
-        if condition in ("partly-cloudy-and-rain", "overcast-and-rain", "cloudy-and-rain"):
-            return WeatherCondition.Rain
-        if condition in ("overcast-thunderstorms-with-rain",):
-            return WeatherCondition.Thunderstorm
-        if condition in ("partly-cloudy-and-light-rain", "cloudy-and-light-rain", "overcast-and-light-rain"):
-            return WeatherCondition.Drizzle
-        if condition in ("overcast-and-wet-snow", "partly-cloudy-and-light-snow", "partly-cloudy-and-snow",
-                         "overcast-and-snow", "cloudy-and-light-snow", "overcast-and-light-snow", "cloudy-and-snow"):
-            return WeatherCondition.Snow
-
-    @staticmethod
-    def _convert_wind_direction(wind_direction: str) -> WindDirection:
-        return YandexWeatherAPI._wind_direction_conversion[wind_direction]
-
-    async def current(self, coordinates: Coordinates) -> WeatherPoint:
-        async with aiohttp.ClientSession() as session:
-            res = await yandex_weather_api.async_get(
-                session, self._token, lat=str(coordinates.lat),
-                lon=str(coordinates.lon), lang="ru_RU")
-        fact = res["fact"]
-
-        return WeatherPoint(
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(self, coordinates: Coordinates) -> bytes:
+        if self._session is None or self._session.closed:
+            await self.open()
+        params = dict(self._params, lat=str(coordinates.lat), lon=str(coordinates.lon))
+        async with self._session.get(self._url, params=params, headers=self._headers) as response:
+            return await response.read()
+
+    def decode(self, raw: bytes) -> dict:
+        return loads(raw)
+
+    def parse_current(self, doc: dict) -> WeatherPoint:
+        fact = doc["fact"]
+
+        return WeatherPoint.construct(
             time=datetime.datetime.fromtimestamp(fact["obs_time"]),
             temperature=int(fact["temp"]),
             pressure=int(fact["pressure_mm"]),
@@ -67,20 +117,19 @@ class YandexWeatherAPI(WeatherAPIBase):
             humidity=int(fact["humidity"])
         )
 
-    async def coords_by_city(self, city: str) -> Coordinates:
-        pass
-
-    async def forecast(self, coordinates: Coordinates) -> Sequence[Forecast]:
-        async with aiohttp.ClientSession() as session:
-            res = await yandex_weather_api.async_get(
-                session, self._token, lat=str(coordinates.lat),
-                lon=str(coordinates.lon), lang="ru_RU")
+    def parse_forecast(self, doc: dict) -> Sequence[Forecast]:
+        if "forecast" in doc:
+            # Тариф informers: одна дата и список из двух ближайших частей суток
+            parts = [(part["part_name"], part) for part in doc["forecast"]["parts"]]
+        else:
+            # Тариф forecast: части суток словарём, кроме них там есть day_short и night_short
+            parts = [(name, part) for name, part in doc["forecasts"][0]["parts"].items()
+                     if name in self._day_part_conversion]
         forecasts: List[Forecast] = []
-        for forecast in res["forecast"][0]["parts"].values():
-            print(forecast)
+        for part_name, forecast in parts:
             forecasts.append(
-                Forecast(
-                    part=self._day_part_conversion[forecast["part_name"]],
+                Forecast.construct(
+                    part=self._day_part_conversion[part_name],
                     min_temperature=int(forecast["temp_min"]),
                     max_temperature=int(forecast["temp_max"]),
                     pressure=int(forecast["pressure_mm"]),
@@ -91,3 +140,46 @@ class YandexWeatherAPI(WeatherAPIBase):
                 )
             )
         return tuple(forecasts)
+
+    def parse_hourly(self, doc: dict) -> HourlyForecast:
+        offset = doc.get("info", {}).get("tzinfo", {}).get("offset", 0)
+        if "forecast" in doc:
+            # Тариф informers: почасового прогноза нет, часы восстанавливаются из двух частей суток
+            forecast = doc["forecast"]
+            days = [(forecast["date_ts"], [(part["part_name"], part) for part in forecast["parts"]], ())]
+        else:
+            days = [(day["date_ts"], [(name, part) for name, part in day["parts"].items()
+                                      if name in self._part_start_hour], day.get("hours") or ())
+                    for day in doc["forecasts"]]
+
+        conditions = self._condition_codes
+        clouds = WeatherCondition.Clouds.value
+        directions = self._wind_direction_codes
+        rows = []
+        for date_ts, parts, hours in days:
+            if hours:
+                rows.extend(
+                    (hour["hour_ts"], hour["temp"], hour.get("prec_mm", 0), hour.get("prec_prob", 0),
+                     hour["wind_speed"], directions[hour["wind_dir"]], hour["pressure_mm"], hour["humidity"],
+                     conditions.get(hour["condition"], clouds))
+                    for hour in hours
+                )
+                continue
+            day_start = date_ts
+            previous = -1
+            for name, part in parts:
+                start = self._part_start_hour[name]
+                if start < previous:
+                    # Ночь после вечера относится уже к следующим суткам
+                    day_start += 24 * 3600
+                previous = start
+                # Температура по часам неизвестна, раскладываем её от минимума к максимуму, чтобы сохранился диапазон
+                low, high = part["temp_min"], part["temp_max"]
+                precipitation = part.get("prec_mm", 0) / 6
+                row = (part.get("prec_prob", 0), part["wind_speed"], directions[part["wind_dir"]],
+                       part["pressure_mm"], part["humidity"], conditions.get(part["condition"], clouds))
+                rows.extend(
+                    (day_start + (start + i) * 3600, low + (high - low) * i / 5, precipitation) + row
+                    for i in range(6)
+                )
+        return HourlyForecast.from_rows(rows, utc_offset=offset)
@@ -0,0 +1,147 @@
+import asyncio
+import hmac
+import os
+from typing import List, Optional, Set
+
+import aiogram
+from aiogram.types import Update
+from aiohttp import web
+from loguru import logger
+
+from fast_weather_bot.options import WebhookOptions
+from fast_weather_bot.sharding import read_frame
+from fast_weather_bot.weather_api.jsonlib import loads
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Принимает обновления от Telegram по HTTP. Запрос подтверждается сразу после постановки обновления
+    в ограниченную очередь, обработкой занимаются воркеры. Если очередь полна, Telegram получает 503
+    и повторит доставку позже
+    """
+
+    def __init__(self, dp: aiogram.Dispatcher, options: WebhookOptions):
+        self._dp = dp
+        self._options = options
+        self._queue: "asyncio.Queue[Update]" = asyncio.Queue(options.queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.received = 0
+        self.rejected = 0
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._options.path, self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self._options.secret):
+            return web.Response(status=403)
+        try:
+            update = Update.to_object(await request.json())
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response()
+
+    async def _worker(self) -> None:
+        aiogram.Bot.set_current(self._dp.bot)
+        aiogram.Dispatcher.set_current(self._dp)
+        while True:
+            update = await self._queue.get()
+            try:
+                # Фильтр состояний aiogram кэширует состояние чата в контекстной переменной, поэтому каждое
+                # обновление обрабатывается в своей задаче со своей копией контекста
+                await asyncio.create_task(self._dp.process_update(update))
+            except Exception:
+                logger.exception(f"Failed to process update {update.update_id}")
+            finally:
+                self._queue.task_done()
+
+    def start_workers(self) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._options.workers)]
+
+    async def start(self) -> None:
+        self.start_workers()
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._options.host, self._options.port).start()
+        logger.info(f"Listening for webhook on {self._options.host}:{self._options.port}{self._options.path}")
+
+    async def _stop_receiving(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Перестаёт принимать обновления и даёт воркерам дообработать очередь
+        """
+        await self._stop_receiving()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} unprocessed updates")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class ShardListener(WebhookServer):
+    """
+    Принимает обновления от супервизора через Unix-сокет, см. supervisor.Supervisor. Пока очередь полна,
+    сокет не читается, и обновления копятся у супервизора
+    """
+
+    def __init__(self, dp: aiogram.Dispatcher, path: str, queue_size: int = 1000, workers: int = 16):
+        super().__init__(dp, WebhookOptions(url="", secret="", queue_size=queue_size, workers=workers))
+        self._path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                payload = await read_frame(reader)
+                try:
+                    update = Update.to_object(loads(payload))
+                except ValueError:
+                    logger.error(f"Dropping malformed update of {len(payload)} bytes")
+                    continue
+                await self._queue.put(update)
+                self.received += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def start(self) -> None:
+        self.start_workers()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._serve, self._path)
+        logger.info(f"Listening for updates on {self._path}")
+
+    async def _stop_receiving(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # Закрытое соединение завершает и его чтение
+        for writer in list(self._connections):
+            writer.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)